@@ -1,6 +1,6 @@
 import streamlit as st
-from autotrader_ui.tpqoa import tpqoa
 
+from autotrader_ui.data_utils import get_oanda_instruments
 from autotrader_ui.market_info import (
     INSTRUMENT_MARKETS_DICT
 )
@@ -8,8 +8,7 @@ from autotrader_ui.market_info import (
 _, img_col, _ = st.columns((1, 2, 1))
 st.header("🏠 Home")
 
-oanda = tpqoa('oanda.cfg')
-indices_list = oanda.get_instruments()
+indices_list = get_oanda_instruments()
 clean_indices_list = [i for i in indices_list if i[1]
                       in INSTRUMENT_MARKETS_DICT.keys()]
 
@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Asyncio OANDA Client.
+
+Coroutine counterpart of ``tpqoa`` for fan-out work (pricing a watchlist,
+pulling history for many instruments, streaming while placing orders)
+from a single event loop.
+
+Requests go through one pooled ``requests.Session`` whose keep-alive
+connections are shared by all coroutines, and are run on a dedicated
+thread pool of ``max_connections`` threads, so that blocking socket I/O
+never stalls the event loop nor the loop's default executor. Price streams
+are read by a second pool of ``max_streams`` threads, so that long-lived
+streams never hold the threads of the REST requests. A token
+bucket caps the request rate of the client, and requests also go through
+the scheduler shared with the ``tpqoa`` clients of the same token, with
+rate limited requests retried after the advertised delay.
+
+Todo:
+    * ...
+"""
+
+# Built-in modules
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# Third-party modules
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+# Local modules
+from autotrader_ui.instrumentation import (
+    endpoint_family,
+    record_queue_wait,
+    record_request,
+    record_retry
+)
+from autotrader_ui.request_scheduler import endpoint_priority, retry_delay
+from autotrader_ui.tpqoa import tpqoa
+
+MAX_CONNECTIONS = 32
+MAX_STREAMS = 4
+REQUESTS_PER_SECOND = 100.
+
+
+class AsyncRateLimiter(object):
+    """Token bucket limiting the rate of requests started by coroutines."""
+
+    def __init__(self, rate: float = REQUESTS_PER_SECOND,
+                 burst: int = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Waits until a request can be started."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens +
+                                   (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AsyncOandaError(Exception):
+    """Raised when OANDA answers with an unexpected status."""
+
+    def __init__(self, status: int, body: str):
+        self.status = status
+        self.body = body
+        super().__init__(f"OANDA request failed ({status}): {body}")
+
+
+class async_tpqoa(object):
+    """Asyncio wrapper class for the Oanda v20 API.
+
+    Args:
+        conf_file (str): OANDA configuration file, as for ``tpqoa``.
+        max_connections (int, optional): Size of the keep-alive connection
+            pool and of the thread pool running the requests: at most that
+            many requests are in flight, the others wait for a free
+            thread. Defaults to 32.
+        rate (float, optional): Maximum number of requests started per
+            second. Defaults to 100.
+        max_streams (int, optional): Number of threads reading the price
+            streams: at most that many streams are open, the others wait
+            for one to end. Defaults to 4.
+    """
+
+    def __init__(self, conf_file: str, max_connections: int = MAX_CONNECTIONS,
+                 rate: float = REQUESTS_PER_SECOND,
+                 max_streams: int = MAX_STREAMS):
+        # Reuse tpqoa's configuration handling and batch splitting
+        self.api = tpqoa(conf_file)
+        self.account_id = self.api.account_id
+        scheme = "https" if self.api.ssl else "http"
+        self._base_url = f"{scheme}://{self.api.hostname}:{self.api.port}"
+        self._stream_url = \
+            f"{scheme}://{self.api.stream_hostname}:{self.api.port}"
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2,
+                              pool_maxsize=max_connections + max_streams)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._session.headers.update({
+            "Authorization": f"Bearer {self.api.access_token}",
+            "Content-Type": "application/json",
+            "Accept-Datetime-Format": "RFC3339"
+        })
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_connections, thread_name_prefix="async_tpqoa")
+        self._stream_executor = ThreadPoolExecutor(
+            max_workers=max_streams, thread_name_prefix="async_tpqoa_stream")
+        self._semaphore = asyncio.Semaphore(max_connections)
+        self.limiter = AsyncRateLimiter(rate)
+        self.poll_timeout = 10
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        """Closes the pooled connections and the thread pools."""
+        self._executor.shutdown(wait=False)
+        self._stream_executor.shutdown(wait=False)
+        self._session.close()
+
+    async def _send(self, method: str, path: str, params: dict,
+                    data: str) -> requests.Response:
+        endpoint = endpoint_family(path)
+        await self.limiter.acquire()
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            waited = await loop.run_in_executor(
+                self._executor, self.api.scheduler.acquire,
+                endpoint_priority(endpoint))
+            record_queue_wait(endpoint, waited)
+            start = time.perf_counter()
+            try:
+                response = await loop.run_in_executor(
+                    self._executor,
+                    partial(self._session.request, method,
+                            self._base_url + path, params=params, data=data,
+                            timeout=self.poll_timeout))
+            except Exception:
+                record_request(endpoint, "error", time.perf_counter() - start)
+                raise
+        record_request(endpoint, response.status_code,
+                       time.perf_counter() - start, len(response.content))
+        return response
+
+    async def _request(self, method: str, path: str, params: dict = None,
+                       body: dict = None) -> dict:
+        data = json.dumps(body) if body is not None else None
+        attempt = 0
+        while True:
+            response = await self._send(method, path, params, data)
+            delay = retry_delay(response.status_code, response.headers,
+                                attempt)
+            if delay is None:
+                break
+            self.api.scheduler.pause(delay)
+            record_retry(endpoint_family(path))
+            attempt += 1
+        if response.status_code >= 400:
+            raise AsyncOandaError(response.status_code, response.text)
+        return response.text
+
+    async def get_instruments(self) -> list:
+        """Retrieves and returns all instruments for the given account."""
+        raw = await self._request(
+            "GET", f"/v3/accounts/{self.account_id}/instruments")
+        instruments = json.loads(raw)["instruments"]
+        return sorted((ins["displayName"], ins["name"])
+                      for ins in instruments)
+
+    async def get_prices(self, instrument: str) -> tuple:
+        """Returns the current time, BID and ASK prices for instrument."""
+        raw = await self._request(
+            "GET", f"/v3/accounts/{self.account_id}/pricing",
+            params={"instruments": instrument})
+        r = json.loads(raw)
+        bid = float(r['prices'][0]['closeoutBid'])
+        ask = float(r['prices'][0]['closeoutAsk'])
+        return r['time'], bid, ask
+
+    async def _retrieve_data(self, instrument: str, start: str, end: str,
+                             granularity: str, price: str) -> pd.DataFrame:
+        raw = await self._request(
+            "GET", f"/v3/instruments/{instrument}/candles",
+            params={"price": price, "granularity": granularity,
+                    "from": start, "to": end})
+        return tpqoa.decode_candles(raw, price)
+
+    async def get_history(self, instrument: str, start, end,
+                          granularity: str, price: str,
+                          localize: bool = True) -> pd.DataFrame:
+        """Retrieves historical data for instrument, all batches at once.
+
+        Args:
+            instrument (str): Valid instrument name.
+            start (datetime, str): Start date.
+            end (datetime, str): End date.
+            granularity (str): A string like 'S5', 'M1' or 'D'.
+            price (str): One of 'A' (ask), 'B' (bid) or 'M' (middle).
+            localize (bool, optional): Drop the UTC timezone from the index. Defaults to True.
+
+        Returns:
+            pd.DataFrame: Candles, same as ``tpqoa.get_history``.
+        """
+        batches = self.api._history_batches(start, end, granularity)
+        frames = await asyncio.gather(*[
+            self._retrieve_data(instrument, batch_start, batch_end,
+                                granularity, price)
+            for batch_start, batch_end in batches])
+        frames = [frame for frame in frames if len(frame) > 0]
+        if len(frames) == 0:
+            data = pd.DataFrame()  # return empty DataFrame if no data
+        else:
+            data = pd.concat(frames)
+            # Consecutive batches share their boundary candle
+            data = data[~data.index.duplicated(keep='first')]
+        if localize:
+            data.index = data.index.tz_localize(None)
+        return data[['o', 'h', 'l', 'c', 'volume', 'complete']]
+
+    async def get_positions(self) -> list:
+        """Retrieves and returns open positions data."""
+        raw = await self._request(
+            "GET", f"/v3/accounts/{self.account_id}/openPositions")
+        return json.loads(raw)["positions"]
+
+    async def get_transactions(self, tid: int = 0) -> list:
+        """Retrieves and returns transactions data since tid."""
+        raw = await self._request(
+            "GET", f"/v3/accounts/{self.account_id}/transactions/sinceid",
+            params={"id": tid})
+        return json.loads(raw)["transactions"]
+
+    async def create_order(self, instrument: str, units: int,
+                           price: float = None, sl_distance: float = None,
+                           tsl_distance: float = None, tp_price: float = None,
+                           comment: str = None, touch: bool = False) -> dict:
+        """Places order with Oanda.
+
+        Args:
+            instrument (str): Valid instrument name.
+            units (int): Units to buy (positive) or sell (negative).
+            price (float, optional): Limit order price, touch order price. Defaults to None (market order).
+            sl_distance (float, optional): Stop loss distance price. Defaults to None.
+            tsl_distance (float, optional): Trailing stop loss distance. Defaults to None.
+            tp_price (float, optional): Take profit price. Defaults to None.
+            comment (str, optional): Comment of the dependent orders. Defaults to None.
+            touch (bool, optional): Market if touched order (requires price). Defaults to False.
+
+        Returns:
+            dict: Reject, fill or create transaction, as for ``tpqoa.create_order``.
+        """
+        client_ext = {"comment": comment} if comment is not None else None
+        order = {"instrument": instrument, "units": str(units)}
+        if price is None:
+            order["type"] = "MARKET"
+        else:
+            order["type"] = "MARKET_IF_TOUCHED" if touch else "LIMIT"
+            order["price"] = str(price)
+        for key, field, value in (
+                ("stopLossOnFill", "distance", sl_distance),
+                ("trailingStopLossOnFill", "distance", tsl_distance),
+                ("takeProfitOnFill", "price", tp_price)):
+            if value is not None:
+                order[key] = {field: str(value)}
+                if client_ext is not None:
+                    order[key]["clientExtensions"] = client_ext
+
+        try:
+            raw = await self._request(
+                "POST", f"/v3/accounts/{self.account_id}/orders",
+                body={"order": order})
+        except AsyncOandaError as e:
+            # Rejected orders come back with a 400 status
+            raw = e.body
+        body = json.loads(raw)
+        for key in ("orderRejectTransaction", "orderFillTransaction",
+                    "orderCreateTransaction"):
+            if key in body:
+                return body[key]
+        return None
+
+    async def stream_prices(self, instruments, snapshot: bool = True):
+        """Streams prices for one or several instruments.
+
+        Args:
+            instruments (str, list): Instrument name(s).
+            snapshot (bool, optional): Start with the current prices. Defaults to True.
+
+        Yields:
+            tuple: (instrument, time, bid, ask) for every price update.
+        """
+        if not isinstance(instruments, str):
+            instruments = ",".join(instruments)
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+        stop = threading.Event()
+        url = f"{self._stream_url}/v3/accounts/{self.account_id}" \
+            "/pricing/stream"
+
+        def read():
+            try:
+                with self._session.get(
+                        url, stream=True, timeout=self.poll_timeout,
+                        params={"instruments": instruments,
+                                "snapshot": str(snapshot).lower()}) as r:
+                    if r.status_code >= 400:
+                        raise AsyncOandaError(r.status_code, r.text)
+                    for line in r.iter_lines():
+                        if stop.is_set():
+                            break
+                        if line:
+                            loop.call_soon_threadsafe(queue.put_nowait, line)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        reader = loop.run_in_executor(self._stream_executor, read)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                msg = json.loads(item)
+                if msg.get("type") == "PRICE":
+                    yield (msg["instrument"], msg["time"],
+                           float(msg["bids"][0]["price"]),
+                           float(msg["asks"][0]["price"]))
+        finally:
+            stop.set()
+            reader.cancel()
@@ -0,0 +1,454 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Offline Benchmarks.
+
+Measures the hot paths of the OANDA client without an OANDA account, by
+driving ``tpqoa`` against the local v20 stand-in server, the document
+repositories without Google Cloud, on synthetic experiments, and the
+rolling indicator kernels on synthetic prices.
+
+Usage:
+    python -m autotrader_ui.benchmarks
+
+Todo:
+    * ...
+"""
+
+# Built-in modules
+import json
+import os
+import tempfile
+import time
+import timeit
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+# Third-party modules
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from v20.response import Response
+
+# Local modules
+from autotrader_ui import indicator_engine
+from autotrader_ui.oanda_standin import (
+    StandinConfig,
+    StandinServer,
+    parse_time,
+    synthetic_candles
+)
+from autotrader_ui.order_pipeline import OrderPipeline
+from autotrader_ui.repositories import SQLiteRepository
+from autotrader_ui.tpqoa import tpqoa
+
+
+def canned_response(request, raw_body: str, status: int = 200) -> Response:
+    """Builds the v20 response the API would send for a request.
+
+    Args:
+        request (v20.request.Request): Request sent through the context.
+        raw_body (str): JSON body of the response.
+        status (int, optional): HTTP status. Defaults to 200.
+
+    Returns:
+        Response: v20 response object.
+    """
+    response = Response(request, request.method, request.path, status, "OK",
+                        {"content-type": "application/json"})
+    response.set_raw_body(raw_body)
+    return response
+
+
+def bench_candle_decoding(config: str = "oanda.cfg", n: int = 5000,
+                          repeat: int = 20) -> pd.DataFrame:
+    """Compares the v20 object and raw JSON decoding of a candles batch.
+
+    Args:
+        config (str, optional): OANDA configuration file. Only used to
+            build the client, no request is sent. Defaults to "oanda.cfg".
+        n (int, optional): Candles per batch. Defaults to 5000.
+        repeat (int, optional): Number of timed runs. Defaults to 20.
+
+    Returns:
+        pd.DataFrame: Best time per batch (ms) for each decoding mode.
+    """
+    start = parse_time("2023-01-02T00:00:00Z")
+    raw_body = json.dumps({"instrument": "EUR_USD", "granularity": "M1",
+                           "candles": synthetic_candles(
+                               "EUR_USD", start, start + n * 60 * 10**9,
+                               "M1", "M")})
+    results = {}
+    outputs = {}
+    for raw_decoding in (False, True):
+        api = tpqoa(config, raw_decoding=raw_decoding)
+        api.ctx.request = lambda request: canned_response(request, raw_body)
+
+        def run():
+            return api.retrieve_data("EUR_USD", "2023-01-02T00:00:00Z",
+                                     "2023-01-06T00:00:00Z", "M1", "M")
+
+        outputs[raw_decoding] = run()
+        times = timeit.repeat(run, number=1, repeat=repeat)
+        mode = "raw" if raw_decoding else "v20"
+        results[mode] = {"candles": n, "best_ms": min(times) * 1e3,
+                         "median_ms": float(np.median(times)) * 1e3}
+
+    pd.testing.assert_frame_equal(outputs[False], outputs[True])
+    return pd.DataFrame(results).transpose()
+
+
+def _summary(name: str, latencies: list, elapsed: float, peak: int,
+             **extra) -> dict:
+    latencies = np.array(latencies) * 1e3
+    summary = {"benchmark": name, "requests": len(latencies),
+               "seconds": elapsed,
+               "requests_per_s": len(latencies) / elapsed,
+               "p50_ms": np.percentile(latencies, 50),
+               "p99_ms": np.percentile(latencies, 99),
+               "peak_memory_mb": peak / 2**20}
+    summary.update(extra)
+    return summary
+
+
+def _measure(run) -> tuple:
+    """Times a run, then repeats it under tracemalloc for its peak memory.
+
+    Tracing allocations slows Python code down several times, so the
+    timings come from the first, untraced, run only.
+    """
+    t0 = time.perf_counter()
+    result = run()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def _timed(api, method: str, latencies: list):
+    """Records the duration of every call of an api method."""
+    call = getattr(api, method)
+
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return call(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    setattr(api, method, timed)
+
+
+def bench_get_history(config: str, days: int = 30, granularity: str = "M1",
+                      max_workers: int = None) -> dict:
+    """Retrieves days of candles with ``tpqoa.get_history``.
+
+    Args:
+        config (str): Configuration file pointing at the stand-in.
+        days (int, optional): Length of the range. Defaults to 30.
+        granularity (str, optional): Candle granularity. Defaults to "M1".
+        max_workers (int, optional): Concurrent batches. Defaults to None (sequential).
+
+    Returns:
+        dict: Requests/s, p50/p99 request latency and peak memory.
+    """
+    api = tpqoa(config, raw_decoding=True)
+    latencies = []
+    _timed(api, "retrieve_data", latencies)
+    end = pd.Timestamp("2023-03-01")
+    start = end - pd.Timedelta(days=days)
+
+    data, elapsed, peak = _measure(lambda: api.get_history(
+        "EUR_USD", start, end, granularity, "M", max_workers=max_workers))
+    latencies = latencies[:len(latencies) // 2]
+
+    name = f"get_history {days}d {granularity}"
+    if max_workers is not None:
+        name += f" ({max_workers} workers)"
+    return _summary(name, latencies, elapsed, peak, candles=len(data))
+
+
+def bench_stream_data(config: str, ticks: int = 100,
+                      instrument: str = "EUR_USD") -> dict:
+    """Streams ticks with ``tpqoa.stream_data``.
+
+    Latencies are the delays between the server time of each tick and its
+    reception by the callback.
+
+    Args:
+        config (str): Configuration file pointing at the stand-in.
+        ticks (int, optional): Number of ticks to receive. Defaults to 100.
+        instrument (str, optional): Streamed instrument. Defaults to "EUR_USD".
+
+    Returns:
+        dict: Ticks/s, p50/p99 tick latency and peak memory.
+    """
+    api = tpqoa(config)
+    latencies = []
+
+    def callback(instrument, time_str, bid, ask):
+        received = time.time_ns()
+        latencies.append((received - parse_time(time_str)) / 1e9)
+
+    _, elapsed, peak = _measure(lambda: api.stream_data(
+        instrument, stop=ticks, callback=callback))
+    latencies = latencies[:ticks]
+    return _summary(f"stream_data {ticks} ticks", latencies, elapsed, peak)
+
+
+def bench_create_order(config: str, orders: int = 100,
+                       concurrency: int = 1) -> dict:
+    """Places market orders with ``tpqoa.create_order``.
+
+    Args:
+        config (str): Configuration file pointing at the stand-in.
+        orders (int, optional): Number of orders. Defaults to 100.
+        concurrency (int, optional): Orders placed in parallel. Defaults to 1.
+
+    Returns:
+        dict: Orders/s, p50/p99 order latency and peak memory.
+    """
+    api = tpqoa(config)
+    latencies = []
+    _timed(api, "create_order", latencies)
+
+    def place(i):
+        return api.create_order("EUR_USD", 1 if i % 2 else -1,
+                                suppress=True, ret=True)
+
+    def run():
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(place, range(orders)))
+
+    _, elapsed, peak = _measure(run)
+    latencies = latencies[:orders]
+    return _summary(f"create_order x{concurrency}", latencies, elapsed, peak)
+
+
+def bench_order_pipeline(config: str, orders: int = 100,
+                         max_workers: int = 4) -> dict:
+    """Places market orders through an ``OrderPipeline``.
+
+    Args:
+        config (str): Configuration file pointing at the stand-in.
+        orders (int, optional): Number of orders. Defaults to 100.
+        max_workers (int, optional): Orders sent concurrently. Defaults to 4.
+
+    Returns:
+        dict: Orders/s, p50/p99 submit-to-response latency and peak memory.
+    """
+    api = tpqoa(config)
+    latencies = []
+    batch = [{"instrument": "EUR_USD", "units": 1 if i % 2 else -1}
+             for i in range(orders)]
+
+    with OrderPipeline(api, max_workers=max_workers) as pipeline:
+        def run():
+            results = pipeline.submit_many(batch)
+            latencies.extend(r["queue_s"] + r["round_trip_s"]
+                             for r in results)
+
+        _, elapsed, peak = _measure(run)
+    latencies = latencies[:orders]
+    return _summary(f"order_pipeline x{max_workers}", latencies, elapsed,
+                    peak)
+
+
+def run_benchmarks(latency: float = 0.02, jitter: float = 0.005,
+                   rate_limit: float = None,
+                   failure_rate: float = 0.) -> pd.DataFrame:
+    """Runs the client benchmarks against a local stand-in server.
+
+    Args:
+        latency (float, optional): Server latency, in seconds. Defaults to 0.02.
+        jitter (float, optional): Server latency jitter, in seconds. Defaults to 0.005.
+        rate_limit (float, optional): Server rate limit, requests per second. Defaults to None.
+        failure_rate (float, optional): Probability of server errors. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: One row per benchmark. Peak memory is the client's only,
+        the server runs in a separate process.
+    """
+    standin_config = StandinConfig(latency=latency, jitter=jitter,
+                                   rate_limit=rate_limit,
+                                   failure_rate=failure_rate,
+                                   tick_interval=0.01, seed=0)
+    with StandinServer(config=standin_config, process=True) as server, \
+            tempfile.TemporaryDirectory() as tmp_dir:
+        config = server.write_config(os.path.join(tmp_dir, "oanda.cfg"))
+        results = [
+            bench_get_history(config),
+            bench_get_history(config, max_workers=8),
+            bench_stream_data(config),
+            bench_create_order(config),
+            bench_create_order(config, concurrency=8),
+            bench_order_pipeline(config),
+        ]
+    return pd.DataFrame(results).set_index("benchmark")
+
+
+def synthetic_experiment(name: str, rng: np.random.Generator,
+                         transactions: int = 50) -> dict:
+    """Builds an experiment document, as stored by ``create_experiment``.
+
+    Args:
+        name (str): Experiment name.
+        rng (np.random.Generator): Random generator.
+        transactions (int, optional): Buy/sell transactions. Defaults to 50.
+
+    Returns:
+        dict: {name: values}, with summary fields and transactions.
+    """
+    start = pd.Timestamp("2023-01-02") + pd.Timedelta(
+        minutes=int(rng.integers(0, 60 * 24 * 30)))
+    times = start + pd.to_timedelta(
+        np.sort(rng.choice(60 * 24 * 5, transactions, replace=False)),
+        unit="min")
+    prices = 1.1 + rng.normal(0, 0.002, transactions).cumsum()
+    records = {}
+    for i, (t, price) in enumerate(zip(times, prices)):
+        action = "buy" if i % 2 == 0 else "sell"
+        records[t.strftime("%Y-%m-%d %H:%M:%S")] = {
+            "action": action, "volume": 1 if action == "buy" else -1,
+            "price": float(price)}
+    capital = 1000.
+    return {name: {
+        "start": start.strftime("%Y-%m-%d %H:%M:%S"),
+        "end": times[-1].strftime("%Y-%m-%d %H:%M:%S"),
+        "agent": {"name": "rsi_agent", "window": int(rng.integers(5, 50))},
+        "execution": {"instrument": "EUR_USD", "initial_capital": capital,
+                      "final_capital": capital + float(rng.normal(0, 10)),
+                      "initial_stocks": 0, "final_stocks": 0,
+                      "final_bid_price": float(prices[-1])},
+        "failure": {"failure_flag": False, "traceback": ""},
+        "transactions": records}}
+
+
+def bench_repository(repository, experiments: int = 2000,
+                     transactions: int = 50, loads: int = 200) -> list:
+    """Runs the experiment page operations against a repository.
+
+    Creates the experiments, lists their names, pages through them, loads
+    some of them, updates them all and deletes them. The repository should
+    start empty.
+
+    Args:
+        repository (Repository): Experiment repository.
+        experiments (int, optional): Synthetic experiments. Defaults to 2000.
+        transactions (int, optional): Transactions per experiment. Defaults to 50.
+        loads (int, optional): Experiments loaded one by one. Defaults to 200.
+
+    Returns:
+        list: One dict per operation, with calls/s, p50/p99 call latency and
+        peak memory.
+    """
+    rng = np.random.default_rng(0)
+    documents = {}
+    for i in range(experiments):
+        documents.update(synthetic_experiment(f"exp_{i:06d}", rng,
+                                              transactions))
+    names = list(documents)
+    backend = type(repository).__name__
+    results = []
+
+    def measure(operation: str, call, repeat: int = 1, reset=None):
+        latencies = []
+
+        def run():
+            if reset is not None:
+                reset()
+            for i in range(repeat):
+                start = time.perf_counter()
+                call(i)
+                latencies.append(time.perf_counter() - start)
+
+        _, _, peak = _measure(run)
+        latencies = latencies[:repeat]
+        # Time spent in the calls, without the reset
+        results.append(_summary(f"{backend} {operation}", latencies,
+                                sum(latencies), peak,
+                                documents=experiments))
+
+    def list_pages(i):
+        cursor = None
+        while True:
+            _, cursor = repository.list(fields=[], limit=500,
+                                        start_after=cursor)
+            if cursor is None:
+                return
+
+    measure("bulk_create", lambda i: repository.bulk_create(documents))
+    measure("names", lambda i: repository.names(), repeat=10)
+    measure("list pages", list_pages, repeat=10)
+    measure("get", lambda i: repository.get(names[i * 7 % experiments]),
+            repeat=loads)
+    measure("bulk_update", lambda i: repository.bulk_update(
+        {name: {f"{name}.execution.reviewed": True} for name in names}))
+    measure("bulk_delete", lambda i: repository.bulk_delete(names),
+            reset=lambda: repository.bulk_create(documents))
+    return results
+
+
+def run_repository_benchmarks(experiments: int = 2000,
+                              transactions: int = 50) -> pd.DataFrame:
+    """Runs the repository benchmarks offline, on in-memory SQLite.
+
+    Args:
+        experiments (int, optional): Synthetic experiments. Defaults to 2000.
+        transactions (int, optional): Transactions per experiment. Defaults to 50.
+
+    Returns:
+        pd.DataFrame: One row per operation.
+    """
+    repository = SQLiteRepository("Experiment")
+    try:
+        results = bench_repository(repository, experiments, transactions)
+    finally:
+        repository.close()
+    return pd.DataFrame(results).set_index("benchmark")
+
+
+def bench_indicator_kernels(n: int = 100000, lengths: tuple = (14, 200),
+                            number: int = 5) -> pd.DataFrame:
+    """Times the rolling kernels against a reduction over every window.
+
+    The baseline reduces ``sliding_window_view`` windows, which costs
+    O(n * length), while the engine's kernels run in O(n).
+
+    Args:
+        n (int, optional): Number of prices. Defaults to 100000.
+        lengths (tuple, optional): Window lengths. Defaults to (14, 200).
+        number (int, optional): Runs per measure, the best is kept. Defaults to 5.
+
+    Returns:
+        pd.DataFrame: Seconds per call of the window reduction and of the
+        engine, and the speedup, by kernel and length.
+    """
+    x = 1.1 + np.random.default_rng(0).normal(0, 1e-4, n).cumsum()
+    kernels = {"sma": (np.mean, indicator_engine.sma),
+               "rolling_min": (np.min, indicator_engine.rolling_min),
+               "rolling_max": (np.max, indicator_engine.rolling_max)}
+    results = []
+    for name, (reduce, kernel) in kernels.items():
+        for length in lengths:
+            windows = min(timeit.repeat(
+                lambda: reduce(sliding_window_view(x, length), axis=1),
+                number=1, repeat=number))
+            engine = min(timeit.repeat(lambda: kernel(x, length),
+                                       number=1, repeat=number))
+            results.append({"kernel": name, "length": length,
+                            "windows_s": windows, "engine_s": engine,
+                            "speedup": windows / engine})
+    return pd.DataFrame(results).set_index(["kernel", "length"])
+
+
+if __name__ == '__main__':
+
+    print(bench_candle_decoding())
+    print(run_benchmarks())
+    print(run_repository_benchmarks())
+    print(bench_indicator_kernels())
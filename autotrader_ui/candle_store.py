@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Local Candle Store.
+
+Persists OANDA candles on disk as Parquet files partitioned by
+instrument / granularity / price / day, so that ranges which were already
+retrieved are served locally and only the missing intervals are requested
+from the API.
+
+Todo:
+    * Prune old partitions.
+"""
+
+# Built-in modules
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+try:  # POSIX only, other platforms rely on the in-process lock
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Third-party modules
+import pandas as pd
+
+# Local modules
+
+CANDLE_COLUMNS = ['o', 'h', 'l', 'c', 'volume', 'complete']
+COVERAGE_FILE = "_coverage.json"
+LOCK_FILE = ".lock"
+# Next to the package, whatever the working directory of the app
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            ".candle_store")
+DAY_FORMAT = "%Y-%m-%d"
+
+
+def to_utc_timestamp(value) -> pd.Timestamp:
+    """Converts a datetime or string to a naive UTC timestamp.
+
+    Naive values are considered to already be expressed in UTC, which is how
+    ``tpqoa.transform_datetime`` treats them.
+
+    Args:
+        value (datetime, str): Date to convert.
+
+    Returns:
+        pd.Timestamp: Naive timestamp, in UTC.
+    """
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert("UTC").tz_localize(None)
+    return ts
+
+
+def merge_intervals(intervals: list) -> list:
+    """Merges overlapping or touching (start, end) intervals.
+
+    Args:
+        intervals (list): List of (start, end) timestamps.
+
+    Returns:
+        list: Sorted list of disjoint (start, end) timestamps.
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class CandleStore(object):
+    """On-disk columnar store of historical candles.
+
+    Layout::
+
+        <root>/<instrument>/<granularity>/<price>/YYYY-MM-DD.parquet
+        <root>/<instrument>/<granularity>/<price>/_coverage.json
+
+    The coverage file lists the time intervals which have been fully
+    retrieved from the API. An interval stops being covered at the first
+    candle that was still marked ``complete == False`` when it was stored,
+    so unfinished candles are requested again on the next read.
+
+    Writes to a partition hold an exclusive lock on its ``.lock`` file, so
+    that several processes sharing the store do not lose each other's
+    coverage, and files are replaced atomically.
+
+    Args:
+        root (str, optional): Store directory. Defaults to DEFAULT_ROOT,
+            in the package directory.
+    """
+
+    def __init__(self, root: str = DEFAULT_ROOT):
+        self.root = root
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def _partition_lock(self, partition_dir: str):
+        """Holds the partition lock, across threads and processes."""
+        with self._lock:
+            os.makedirs(partition_dir, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(partition_dir, LOCK_FILE), "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _replace(path: str, write):
+        """Writes a file through a temporary one, replaced atomically."""
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _partition_dir(self, instrument: str, granularity: str,
+                       price: str) -> str:
+        return os.path.join(self.root, instrument, granularity, price)
+
+    def _day_path(self, partition_dir: str, day: pd.Timestamp) -> str:
+        return os.path.join(partition_dir,
+                            day.strftime(DAY_FORMAT) + ".parquet")
+
+    def get_coverage(self, instrument: str, granularity: str,
+                     price: str) -> list:
+        """Returns the intervals already retrieved for a series.
+
+        Args:
+            instrument (str): Instrument name.
+            granularity (str): Candle granularity.
+            price (str): Price component ('A', 'B' or 'M').
+
+        Returns:
+            list: Sorted list of disjoint (start, end) naive UTC timestamps.
+        """
+        path = os.path.join(self._partition_dir(instrument, granularity,
+                                                price), COVERAGE_FILE)
+        if not os.path.exists(path):
+            return []
+        with open(path, "r") as f:
+            raw = json.load(f)
+        return [(pd.Timestamp(s), pd.Timestamp(e)) for s, e in raw]
+
+    def _set_coverage(self, instrument: str, granularity: str, price: str,
+                      intervals: list):
+        partition_dir = self._partition_dir(instrument, granularity, price)
+        path = os.path.join(partition_dir, COVERAGE_FILE)
+        raw = [(s.isoformat(), e.isoformat())
+               for s, e in merge_intervals(intervals)]
+
+        def write(tmp_path):
+            with open(tmp_path, "w") as f:
+                json.dump(raw, f)
+        self._replace(path, write)
+
+    def missing_intervals(self, instrument: str, start, end,
+                          granularity: str, price: str) -> list:
+        """Returns the parts of [start, end] which are not stored yet.
+
+        Args:
+            instrument (str): Instrument name.
+            start (datetime, str): Start date, UTC.
+            end (datetime, str): End date, UTC.
+            granularity (str): Candle granularity.
+            price (str): Price component ('A', 'B' or 'M').
+
+        Returns:
+            list: Sorted list of (start, end) naive UTC timestamps.
+        """
+        start, end = to_utc_timestamp(start), to_utc_timestamp(end)
+        gaps = []
+        cursor = start
+        for cov_start, cov_end in self.get_coverage(instrument, granularity,
+                                                    price):
+            if cov_end <= cursor:
+                continue
+            if cov_start >= end:
+                break
+            if cov_start > cursor:
+                gaps.append((cursor, cov_start))
+            cursor = max(cursor, cov_end)
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def load(self, instrument: str, start, end, granularity: str,
+             price: str) -> pd.DataFrame:
+        """Loads the stored candles between start and end.
+
+        Args:
+            instrument (str): Instrument name.
+            start (datetime, str): Start date, UTC.
+            end (datetime, str): End date, UTC.
+            granularity (str): Candle granularity.
+            price (str): Price component ('A', 'B' or 'M').
+
+        Returns:
+            pd.DataFrame: Candles indexed by UTC time.
+        """
+        start, end = to_utc_timestamp(start), to_utc_timestamp(end)
+        partition_dir = self._partition_dir(instrument, granularity, price)
+        frames = []
+        for day in pd.date_range(start.normalize(), end.normalize(),
+                                 freq="D"):
+            path = self._day_path(partition_dir, day)
+            if os.path.exists(path):
+                frames.append(pd.read_parquet(path))
+        if len(frames) == 0:
+            return pd.DataFrame(columns=CANDLE_COLUMNS,
+                                index=pd.DatetimeIndex([], tz="UTC",
+                                                       name="time"))
+        data = pd.concat(frames)
+        start, end = start.tz_localize("UTC"), end.tz_localize("UTC")
+        return data[(data.index >= start) & (data.index <= end)]
+
+    def save(self, instrument: str, data: pd.DataFrame, start, end,
+             granularity: str, price: str):
+        """Stores candles retrieved for [start, end] and marks it as covered.
+
+        Args:
+            instrument (str): Instrument name.
+            data (pd.DataFrame): Candles indexed by UTC time, as returned
+                by the API. Can be empty if the market was closed.
+            start (datetime, str): Start date of the retrieved interval, UTC.
+            end (datetime, str): End date of the retrieved interval, UTC.
+            granularity (str): Candle granularity.
+            price (str): Price component ('A', 'B' or 'M').
+        """
+        start, end = to_utc_timestamp(start), to_utc_timestamp(end)
+        # Nothing after the present can be considered as retrieved
+        end = min(end, to_utc_timestamp(pd.Timestamp.now("UTC")))
+
+        partition_dir = self._partition_dir(instrument, granularity, price)
+        with self._partition_lock(partition_dir):
+            if len(data) > 0:
+                data = data[CANDLE_COLUMNS]
+                if data.index.tz is None:
+                    data.index = data.index.tz_localize("UTC")
+                data.index.name = "time"
+
+                incomplete = data.index[~data["complete"].astype(bool)]
+                if len(incomplete) > 0:
+                    end = min(end, incomplete[0].tz_localize(None))
+
+                for day, day_data in data.groupby(data.index.normalize()):
+                    path = self._day_path(partition_dir, day)
+                    if os.path.exists(path):
+                        day_data = pd.concat([pd.read_parquet(path),
+                                              day_data])
+                        day_data = day_data[~day_data.index.duplicated(
+                            keep='last')].sort_index()
+                    self._replace(path, day_data.to_parquet)
+
+            coverage = self.get_coverage(instrument, granularity, price)
+            self._set_coverage(instrument, granularity, price,
+                               coverage + [(start, end)])
+
+    def read_through(self, fetch, instrument: str, start, end,
+                     granularity: str, price: str) -> pd.DataFrame:
+        """Returns candles for [start, end], fetching only missing intervals.
+
+        Args:
+            fetch (callable): Called as
+                ``fetch(instrument, start, end, granularity, price)`` with
+                naive UTC timestamps for every missing interval, and
+                returning the candles indexed by UTC time.
+            instrument (str): Instrument name.
+            start (datetime, str): Start date, UTC.
+            end (datetime, str): End date, UTC.
+            granularity (str): Candle granularity.
+            price (str): Price component ('A', 'B' or 'M').
+
+        Returns:
+            pd.DataFrame: Candles indexed by UTC time.
+        """
+        for gap_start, gap_end in self.missing_intervals(
+                instrument, start, end, granularity, price):
+            data = fetch(instrument, gap_start, gap_end, granularity, price)
+            self.save(instrument, data, gap_start, gap_end, granularity,
+                      price)
+        return self.load(instrument, start, end, granularity, price)
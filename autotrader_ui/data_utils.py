@@ -9,48 +9,239 @@ Todo:
 
 # Built-in modules
 import datetime as dt
+import inspect
+import json
+import os
+import threading
+import time
 
 # Third-party modules
-from autotrader_ui.tpqoa import tpqoa
+from autotrader_ui.candle_store import (DEFAULT_ROOT, CandleStore,
+                                        to_utc_timestamp)
+from autotrader_ui.metrics import METRICS
+from autotrader_ui.oanda_client import get_instrument_cache, get_oanda_client
+from autotrader_ui.transaction_ledger import TransactionLedger
+import pandas as pd
 import yfinance as yf
 
 # Local modules
 
+CANDLE_STORE_DIR = DEFAULT_ROOT
+CANDLE_STORE = CandleStore(CANDLE_STORE_DIR)
+
+PRICE_SNAPSHOT_TTL = 1.  # seconds
+PRICE_SNAPSHOT_COLUMNS = ["instrument", "time", "bid", "ask", "spread"]
+_PRICE_CACHE = {}
+_PRICE_CACHE_LOCK = threading.Lock()
+
+# Alongside the candle store, not in the working directory
+TRANSACTION_LEDGER_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "transactions.sqlite")
+_LEDGER = None
+_LEDGER_LOCK = threading.Lock()
+
+_IN_FLIGHT = {}
+_IN_FLIGHT_LOCK = threading.Lock()
+
+
+class _Flight(object):
+    """Fetch in progress, awaited by the callers of the same request."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _single_flight(key: tuple, fetch):
+    """Runs fetch once for all the concurrent callers with the same key.
+
+    The first caller fetches, the others wait for its result (or error).
+    Every caller gets its own copy of the result, so that one session
+    modifying its DataFrame does not affect the others.
+    """
+    with _IN_FLIGHT_LOCK:
+        flight = _IN_FLIGHT.get(key)
+        leader = flight is None
+        if leader:
+            flight = _IN_FLIGHT[key] = _Flight()
+    METRICS.counter("data.single_flight",
+                    role="leader" if leader else "follower").inc()
+
+    if leader:
+        try:
+            flight.result = fetch()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            # Later calls fetch again, so that results are never stale
+            with _IN_FLIGHT_LOCK:
+                del _IN_FLIGHT[key]
+            flight.done.set()
+    else:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+    return flight.result.copy()
+
+
+def _flight_key(source: str, fetch, data_kwargs: dict) -> tuple:
+    """Returns the single-flight key of a historical data request.
+
+    Equivalent requests get the same key: omitted arguments take their
+    default value, start and end are compared as UTC timestamps, and the
+    arguments are serialised as sorted JSON, which also accepts unhashable
+    values such as lists.
+    """
+    try:
+        bound = inspect.signature(fetch).bind(**data_kwargs)
+        bound.apply_defaults()
+        params = dict(bound.arguments)
+    except (TypeError, ValueError):  # Invalid arguments, fetch will raise
+        params = dict(data_kwargs)
+    for name in ("start", "end"):
+        try:
+            params[name] = to_utc_timestamp(params[name]).isoformat()
+        except (KeyError, TypeError, ValueError):
+            pass
+    return source.lower(), json.dumps(params, sort_keys=True, default=str)
+
 def get_historical_data(source: str = 'oanda', data_kwargs: dict = {}):
+    """Gets historical data, sharing identical concurrent fetches.
+
+    Concurrent calls with the same source and arguments (instrument,
+    start, end, granularity, price...), e.g. from several sessions opening
+    the same chart, wait for a single fetch and get copies of its result.
+
+    Args:
+        source (str, optional): 'oanda' or 'yahoo'. Defaults to 'oanda'.
+        data_kwargs (dict, optional): Arguments of get_oanda_data or get_yahoo_data. Defaults to {}.
+
+    Returns:
+        pd.DataFrame: Candles.
+    """
 
     # Define API based on selected source
     if source.lower() == 'oanda':
-        data = get_oanda_data(**data_kwargs)
+        fetch = get_oanda_data
 
     elif source.lower() == 'yahoo':
-        data = get_yahoo_data(**data_kwargs)
+        fetch = get_yahoo_data
 
-    return data
+    key = _flight_key(source, fetch, data_kwargs)
+    return _single_flight(key, lambda: fetch(**data_kwargs))
 
 def get_oanda_instruments(config: str = "oanda.cfg"):
-    api = tpqoa(config)
-    instruments = api.get_instruments()
+    instruments = get_instrument_cache(config).get()
     return instruments
 
-def get_spread(instrument: str, config: str = "oanda.cfg"):
-    api = tpqoa(config)
-    bid, ask = api.get_bid_ask(instrument)
+def get_price_snapshot(instruments: list, config: str = "oanda.cfg",
+                       ttl: float = None) -> pd.DataFrame:
+    """Gets the current prices of several instruments in a single request.
+
+    Args:
+        instruments (list): Instrument names.
+        config (str, optional): OANDA configuration file. Defaults to "oanda.cfg".
+        ttl (float, optional): Seconds during which a previously retrieved
+            price is reused instead of requested again. Defaults to None (no cache).
+
+    Returns:
+        pd.DataFrame: One row per instrument with columns instrument, time, bid, ask and spread.
+    """
+    instruments = list(instruments)
+    now = time.monotonic()
+    missing = instruments
+    if ttl is not None:
+        with _PRICE_CACHE_LOCK:
+            missing = [i for i in instruments
+                       if (config, i) not in _PRICE_CACHE
+                       or now - _PRICE_CACHE[(config, i)][0] > ttl]
+
+    if len(missing) > 0:
+        snapshot = get_oanda_client(config).get_price_snapshot(missing)
+        if ttl is None:
+            return snapshot
+        with _PRICE_CACHE_LOCK:
+            for row in snapshot.to_dict("records"):
+                _PRICE_CACHE[(config, row["instrument"])] = (now, row)
+
+    with _PRICE_CACHE_LOCK:
+        rows = [_PRICE_CACHE[(config, i)][1] for i in instruments
+                if (config, i) in _PRICE_CACHE]
+    return pd.DataFrame(rows, columns=PRICE_SNAPSHOT_COLUMNS)
+
+def get_spreads(instruments: list, config: str = "oanda.cfg",
+                ttl: float = PRICE_SNAPSHOT_TTL) -> pd.Series:
+    """Gets the current spread of several instruments in a single request.
+
+    Args:
+        instruments (list): Instrument names.
+        config (str, optional): OANDA configuration file. Defaults to "oanda.cfg".
+        ttl (float, optional): Seconds during which cached prices are reused. Defaults to PRICE_SNAPSHOT_TTL.
+
+    Returns:
+        pd.Series: Spread (ask - bid), indexed by instrument.
+    """
+    snapshot = get_price_snapshot(instruments, config=config, ttl=ttl)
+    return snapshot.set_index("instrument")["spread"]
+
+def get_spread(instrument: str, config: str = "oanda.cfg",
+               ttl: float = PRICE_SNAPSHOT_TTL):
+    """Gets the current spread of an instrument, None if it has no price."""
+    snapshot = get_price_snapshot([instrument], config=config, ttl=ttl)
+    if len(snapshot) == 0:  # e.g. unknown instrument
+        return None
+    bid, ask = snapshot["bid"].iloc[0], snapshot["ask"].iloc[0]
     if ask <= bid:
         err = f"Warning, weird values for bid and ask. bid: {bid}, ask: {ask}"
         raise RuntimeError(err)
     return ask - bid
 
 def get_positions(config: str = "oanda.cfg"):
-    api = tpqoa(config)
+    api = get_oanda_client(config)
     positions = api.get_positions()
     return positions
 
+def get_transaction_ledger(path: str = TRANSACTION_LEDGER_PATH):
+    """Returns the process-wide local transaction ledger."""
+    global _LEDGER
+    with _LEDGER_LOCK:
+        if _LEDGER is None or _LEDGER.path != path:
+            _LEDGER = TransactionLedger(path)
+        return _LEDGER
+
+def get_transactions(instrument: str = None, start: str = None,
+                     end: str = None, config: str = "oanda.cfg",
+                     sync: bool = True) -> pd.DataFrame:
+    """Gets account transactions from the local ledger.
+
+    Args:
+        instrument (str, optional): Instrument name. Defaults to None (all).
+        start (str, optional): Earliest time, UTC. Defaults to None.
+        end (str, optional): Latest time, UTC. Defaults to None.
+        config (str, optional): OANDA configuration file. Defaults to "oanda.cfg".
+        sync (bool, optional): First retrieve the transactions newer than
+            the last stored one. Defaults to True.
+
+    Returns:
+        pd.DataFrame: Transactions indexed by ID, with time, type, instrument, units and pl.
+    """
+    api = get_oanda_client(config)
+    ledger = get_transaction_ledger()
+    if sync:
+        ledger.sync(api)
+    return ledger.to_frame(api.account_id, instrument=instrument,
+                           start=start, end=end)
+
 def get_oanda_data(instrument: str = 'SPX500_USD',
                    start: str = "2022-05-01 10:00:00",
                    end: str = "2021-08-23 11:00:00",
                    granularity: str = "M1",
                    price: str = "M",
-                   config: str = "oanda.cfg"):
+                   config: str = "oanda.cfg",
+                   use_store: bool = True,
+                   max_workers: int = None):
     """Gets data using the OANDA API.
 
     Args:
@@ -59,15 +250,46 @@ def get_oanda_data(instrument: str = 'SPX500_USD',
         end (str, optional): End date. Defaults to "2020-08-12".
         granularity (str, optional): Time series granularity. Defaults to "M1".
         price (str, optional): Price. Defaults to "M".
+        use_store (bool, optional): Read through the local candle store, only requesting missing candles. Defaults to True.
+        max_workers (int, optional): Number of threads retrieving batches concurrently. Defaults to None (sequential).
 
     Returns:
         _type_: _description_
     """
 
-    api = tpqoa(config)
-    data = api.get_history(instrument, start, end, granularity, price)
+    api = get_oanda_client(config)
+    store = CANDLE_STORE if use_store else None
+    data = api.get_history(instrument, start, end, granularity, price,
+                           store=store, max_workers=max_workers)
     return data
 
+def iter_oanda_data(instrument: str = 'SPX500_USD',
+                    start: str = "2022-05-01 10:00:00",
+                    end: str = "2021-08-23 11:00:00",
+                    granularity: str = "M1",
+                    price: str = "M",
+                    config: str = "oanda.cfg",
+                    records: bool = False,
+                    max_workers: int = None):
+    """Gets data using the OANDA API, one batch of candles at a time.
+
+    Args:
+        instrument (str, optional): Quantity of interest to retrieve. Defaults to "EUR_USD".
+        start (str, optional): Start date. Defaults to "2020-08-10".
+        end (str, optional): End date. Defaults to "2020-08-12".
+        granularity (str, optional): Time series granularity. Defaults to "M1".
+        price (str, optional): Price. Defaults to "M".
+        records (bool, optional): Yield NumPy record arrays instead of DataFrames. Defaults to False.
+        max_workers (int, optional): Number of batches retrieved ahead concurrently. Defaults to None (sequential).
+
+    Yields:
+        pd.DataFrame: Candles of one batch, in chronological order.
+    """
+
+    api = get_oanda_client(config)
+    yield from api.iter_history(instrument, start, end, granularity, price,
+                                records=records, max_workers=max_workers)
+
 def get_yahoo_data(instrument: str = 'AAPL',
                    start: str = (dt.datetime.utcnow() -
                                  dt.timedelta(days=2)).strftime("%Y-%m-%d"),
@@ -3,11 +3,28 @@ from google.oauth2 import service_account
 import json
 import os
 import traceback
+import uuid
 import streamlit as st
+from autotrader_ui.doc_cache import DocumentCache, version_key
+from autotrader_ui.firestore_mirror import CollectionMirror
 
+WRITE_BATCH_SIZE = 500  # Maximum number of writes in a Firestore batch
+# In the package directory, so that every launch shares the same cache
+DOCUMENT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   "documents.sqlite")
+
+# Experiment documents keep the summary, transactions are stored in chunks
+EXPERIMENT_SUMMARY_FIELDS = ["execution", "agent", "start", "end", "failure"]
+TRANSACTIONS_COLLECTION = "transactions"
+TRANSACTIONS_CHUNK_SIZE = 5000  # ~250 KB per chunk, below the 1 MiB limit
+
+@st.cache_resource(show_spinner=False)
 def connect_to_firebase_db_and_authenticate(project_name: str = None, local_auth_file: str = "firestore-key.json"):
     """Connects to a firebase project using a local authentication file, or using a streamlit toml secrets file.
 
+    The client is created once per process and shared by all the sessions
+    and reruns, so that its gRPC channel and credentials are reused.
+
     Args:
         project_name (str, optional): Firebase project name. Defaults to None.
         local_auth_file (str, optional): Local authentication file. Defaults to "firestore-key.json".
@@ -18,16 +35,16 @@ def connect_to_firebase_db_and_authenticate(project_name: str = None, local_auth
 
     # Authenticate to Firestore with the JSON account key.
     if os.path.exists(local_auth_file):
-        db = firestore.Client.from_service_account_json("firestore-key.json")
+        db = firestore.Client.from_service_account_json(local_auth_file)
 
-    # Authenticate with streamlit secrets
+    # Authenticate with streamlit secrets, without writing the key to disk
     elif "textkey" in st.secrets.keys():
         key_dict = json.loads(st.secrets["textkey"])
-        with open("firestore-key.json", "w+") as f:
-            json.dump(key_dict, f)
-        #creds = service_account.Credentials.from_service_account_info(key_dict)
-        #db = firestore.Client(credentials=creds, project=project_name)
-        db = firestore.Client.from_service_account_json("firestore-key.json")
+        creds = service_account.Credentials.from_service_account_info(
+            key_dict)
+        # Same project as from_service_account_json, the key's one
+        db = firestore.Client(credentials=creds,
+                              project=key_dict.get("project_id"))
 
     # Other cases
     else:
@@ -36,26 +53,128 @@ def connect_to_firebase_db_and_authenticate(project_name: str = None, local_auth
 
     return db
 
-def get_all_backtests(db) -> dict:
+def list_documents(db, collection: str, fields: list = None,
+                   order_by: str = None, descending: bool = False,
+                   limit: int = None, start_after=None) -> tuple:
+    """Lists the documents of a collection, optionally projected and paginated.
+
+    Args:
+        db: Firebase database instance.
+        collection (str): Collection name.
+        fields (list, optional): Fields to transfer (field mask). An empty
+            list only transfers the document IDs. Defaults to None (all fields).
+        order_by (str, optional): Field to sort by. Defaults to None (document ID).
+        descending (bool, optional): Sort in descending order. Defaults to False.
+        limit (int, optional): Maximum number of documents. Defaults to None (all).
+        start_after (optional): Cursor returned by a previous call, to get
+            the next page. Defaults to None (first page).
+
+    Returns:
+        tuple: Dictionary of the documents data by ID, and the cursor of the
+        next page (None if this is the last page).
+    """
+    query = db.collection(collection)
+    if fields is not None:
+        fields = list(fields)
+        # Cursors need the value of the sort field
+        if order_by is not None and order_by not in fields:
+            fields.append(order_by)
+        # An empty projection means all fields, only ask for the name
+        query = query.select(fields if len(fields) > 0 else ["__name__"])
+    if order_by is not None:
+        direction = (firestore.Query.DESCENDING if descending
+                     else firestore.Query.ASCENDING)
+        query = query.order_by(order_by, direction=direction)
+    if start_after is not None:
+        query = query.start_after(start_after)
+    if limit is not None:
+        query = query.limit(limit)
+
+    documents = {}
+    last = None
+    for doc in query.stream():
+        documents[doc.id] = doc.to_dict()
+        last = doc
+    cursor = last if limit is not None and len(documents) == limit else None
+
+    return documents, cursor
+
+def iter_documents(db, collection: str, fields: list = None,
+                   order_by: str = None, descending: bool = False,
+                   page_size: int = 500):
+    """Yields the pages of a collection, see list_documents.
+
+    Yields:
+        dict: Documents data by ID, at most page_size per page.
+    """
+    cursor = None
+    while True:
+        documents, cursor = list_documents(db, collection, fields, order_by,
+                                           descending, page_size, cursor)
+        if len(documents) > 0:
+            yield documents
+        if cursor is None:
+            return
+
+@st.cache_resource(show_spinner=False)
+def get_collection_mirror(_db, collection: str,
+                          fields: tuple = None) -> CollectionMirror:
+    """Returns the process-wide realtime mirror of a collection.
+
+    The mirror is created on first use and shared by all the sessions. Its
+    listener keeps it up to date, so reading it costs no Firestore reads.
+    Listeners transfer whole documents, so prefer paginated listings when
+    live updates are not needed.
+
+    Args:
+        _db: Firebase database instance (not hashed).
+        collection (str): Collection name.
+        fields (tuple, optional): Fields kept in memory. Defaults to None (all fields).
+
+    Returns:
+        CollectionMirror: Mirror, possibly still loading: call ``wait_ready``
+        with a timeout before reading it.
+    """
+    return CollectionMirror(_db, collection,
+                            list(fields) if fields is not None else None)
+
+@st.cache_resource(show_spinner=False)
+def get_document_cache(path: str = DOCUMENT_CACHE_PATH) -> DocumentCache:
+    """Returns the process-wide local cache of experiments and backtests."""
+    return DocumentCache(path)
+
+def get_all_backtests(db, fields: list = None) -> dict:
     """Returns all the backtests available in the database.
 
     Args:
         db: Firebase database instance.
+        fields (list, optional): Fields to transfer. Defaults to None (all fields).
 
     Returns:
         dict: Nested dictionary of all backtest instances.
     """
 
-    # Let's make a reference to ALL of the posts
-    posts_ref = db.collection("Backtest")
-
-    # For a reference to a collection, we use .stream() instead of .get()
     all_backtests = {}
-    for doc in posts_ref.stream():
-        all_backtests[doc.id] = doc.to_dict()
+    for page in iter_documents(db, "Backtest", fields=fields):
+        all_backtests.update(page)
 
     return all_backtests
 
+def get_backtests_summary(db, limit: int = 50, start_after=None) -> tuple:
+    """Returns the status and creation time of backtests, newest first.
+
+    Args:
+        db: Firebase database instance.
+        limit (int, optional): Page size. Defaults to 50.
+        start_after (optional): Cursor of the next page. Defaults to None (first page).
+
+    Returns:
+        tuple: Backtests summaries by name, and the cursor of the next page.
+    """
+    return list_documents(db, "Backtest", fields=["status", "created_at"],
+                          order_by="created_at", descending=True,
+                          limit=limit, start_after=start_after)
+
 def get_all_experiments(db) -> dict:
 
     # Let's make a reference to ALL of the posts
@@ -68,15 +187,12 @@ def get_all_experiments(db) -> dict:
 
     return all_experiments
 
-def get_all_experiments_name(db) -> dict:
+def get_all_experiments_name(db) -> list:
+    """Returns the names of all the experiments, without their data."""
 
-    # Let's make a reference to ALL of the posts
-    posts_ref = db.collection("Experiment")
-
-    # For a reference to a collection, we use .stream() instead of .get()
     experiments_names = []
-    for doc in posts_ref.stream():
-        experiments_names.append(doc.id)
+    for page in iter_documents(db, "Experiment", fields=[]):
+        experiments_names.extend(page.keys())
 
     return experiments_names
 
@@ -92,26 +208,237 @@ def get_all_live(db) -> dict:
 
     return all_lives
 
-def get_specific_backtest(db, backtest_name: str) -> dict:
+def get_document_version(db, collection: str, document_name: str) -> str:
+    """Returns the version of a document, without transferring its fields.
+
+    The version is the update time of the document, which changes on every
+    write, e.g. to key caches of values derived from the document.
+
+    Args:
+        db: Firebase database instance.
+        collection (str): Collection name.
+        document_name (str): Document name.
+
+    Returns:
+        str: Comparable version string, None if the document does not exist.
+    """
+    doc = db.collection(collection).document(document_name).get(
+        field_paths=[])
+    if not doc.exists:
+        return None
+    return version_key(doc.update_time)
+
+def get_specific_backtest(db, backtest_name: str,
+                          use_cache: bool = True) -> dict:
     """Fetches all information for a specific backtest.
 
     Args:
         db: Firebase database instance.
         backtest_name (str): Backtest name.
+        use_cache (bool, optional): Serve the local copy when the backtest did not change. Defaults to True.
 
     Returns:
         backtest: Backtest information, as a dictionary. 
     """
     doc_ref = db.collection("Backtest").document(backtest_name)
+    if use_cache:
+        return get_document_cache().get(doc_ref)
     doc = doc_ref.get()  # Get data for document
 
     return doc.to_dict()
 
-def get_specific_experiment(db, experiment_name: str) -> dict:
+def get_specific_experiment(db, experiment_name: str,
+                            use_cache: bool = True) -> dict:
+    """Fetches all information for a specific experiment, transactions included.
+
+    Args:
+        db: Firebase database instance.
+        experiment_name (str): Experiment name.
+        use_cache (bool, optional): Serve the local copy when the experiment did not change. Defaults to True.
+
+    Returns:
+        dict: {experiment_name: values}, as stored by create_experiment.
+    """
     doc_ref = db.collection("Experiment").document(experiment_name)
-    doc = doc_ref.get()  # Get data for document
 
-    return doc.to_dict()
+    def load(doc) -> dict:
+        data = doc.to_dict()
+        values = (data or {}).get(experiment_name, {})
+        if "transactions_chunks" in values:
+            # Same output as the legacy format, transactions included
+            values["transactions"] = get_experiment_transactions(
+                db, experiment_name, values, use_cache=False)
+        return data
+
+    if use_cache:
+        return get_document_cache().get(doc_ref, load)
+    return load(doc_ref.get())
+
+def _transactions_to_chunks(transactions: dict,
+                            chunk_size: int = TRANSACTIONS_CHUNK_SIZE) -> list:
+    """Splits a {time: transaction} map into columnar chunks, by time."""
+    times = sorted(transactions.keys())
+    columns = sorted({key for t in transactions.values() for key in t})
+    chunks = []
+    for i in range(0, len(times), chunk_size):
+        chunk_times = times[i:i + chunk_size]
+        chunk = {"time": chunk_times}
+        for column in columns:
+            chunk[column] = [transactions[t].get(column) for t in chunk_times]
+        chunks.append({"index": len(chunks), "count": len(chunk_times),
+                       "columns": chunk})
+    return chunks
+
+def _chunks_to_transactions(chunks: list) -> dict:
+    """Rebuilds the {time: transaction} map from columnar chunks."""
+    transactions = {}
+    for chunk in sorted(chunks, key=lambda c: c["index"]):
+        columns = dict(chunk["columns"])
+        times = columns.pop("time")
+        for i, t in enumerate(times):
+            transactions[t] = {key: values[i]
+                               for key, values in columns.items()
+                               if values[i] is not None}
+    return transactions
+
+def _chunk_id(generation: str, index: int) -> str:
+    """Returns the document ID of a chunk, "" being the unversioned format."""
+    return f"{generation}-{index:05d}" if generation else f"{index:05d}"
+
+def _chunk_generation(chunk_id: str) -> str:
+    """Returns the generation of a chunk document ID, see _chunk_id."""
+    return chunk_id.rpartition("-")[0]
+
+def _store_experiment(db, experiment_name: str, data: dict):
+    """Stores an experiment in the chunked format, without exposing partial writes.
+
+    The chunks are written under a new generation ID first, then the
+    experiment document is pointed at them in a single write, and only then
+    are the chunks of the previous generation deleted. Readers see either
+    the previous or the new transactions, and a failure before the final
+    write leaves the previous ones untouched (the orphan chunks are removed
+    by delete_experiment).
+    """
+    doc_ref = db.collection("Experiment").document(experiment_name)
+    chunks_ref = doc_ref.collection(TRANSACTIONS_COLLECTION)
+    previous = get_experiment_summary(db, experiment_name) or {}
+
+    values = dict(data[experiment_name])
+    chunks = _transactions_to_chunks(values.pop("transactions", {}))
+    generation = uuid.uuid4().hex
+    values["transactions_generation"] = generation
+    values["transactions_count"] = sum(c["count"] for c in chunks)
+    values["transactions_chunks"] = len(chunks)
+    _commit_in_batches(db, (
+        ("set", chunks_ref.document(_chunk_id(generation, chunk["index"])),
+         (chunk,)) for chunk in chunks))
+
+    # Single write, the new transactions become visible at once
+    doc_ref.set({experiment_name: values})
+
+    if "transactions_chunks" in previous:
+        old_generation = previous.get("transactions_generation", "")
+        _commit_in_batches(db, (
+            ("delete", chunk_ref, ())
+            for chunk_ref in chunks_ref.list_documents()
+            if _chunk_generation(chunk_ref.id) == old_generation))
+
+def get_experiment_summary(db, experiment_name: str) -> dict:
+    """Fetches the summary of an experiment, without its transactions.
+
+    Works with both the chunked format and the legacy format, where the
+    transactions are inlined in the experiment document.
+
+    Args:
+        db: Firebase database instance.
+        experiment_name (str): Experiment name.
+
+    Returns:
+        dict: execution, agent, start, end and failure values, and
+        transactions_count/transactions_chunks/transactions_generation for
+        chunked experiments.
+    """
+    doc_ref = db.collection("Experiment").document(experiment_name)
+    fields = EXPERIMENT_SUMMARY_FIELDS + ["transactions_count",
+                                          "transactions_chunks",
+                                          "transactions_generation"]
+    doc = doc_ref.get(field_paths=[
+        firestore.Client.field_path(experiment_name, field)
+        for field in fields])
+    data = doc.to_dict()
+    if data is None:
+        return None
+    return data.get(experiment_name, {})
+
+def get_experiment_transactions(db, experiment_name: str,
+                                summary: dict = None,
+                                use_cache: bool = True) -> dict:
+    """Fetches the transactions of an experiment, on demand.
+
+    Args:
+        db: Firebase database instance.
+        experiment_name (str): Experiment name.
+        summary (dict, optional): Summary from get_experiment_summary. Defaults to None (fetched).
+        use_cache (bool, optional): Serve the local copy when the experiment did not change. Defaults to True.
+
+    Returns:
+        dict: Transactions by time string, as in the legacy format.
+    """
+    doc_ref = db.collection("Experiment").document(experiment_name)
+    if use_cache:
+        def load(doc) -> dict:
+            values = doc.to_dict().get(experiment_name, {})
+            if "transactions" in values:  # Legacy format, already loaded
+                return values["transactions"]
+            return get_experiment_transactions(db, experiment_name, values,
+                                               use_cache=False)
+
+        # Versioned by the experiment document, which is written last
+        return get_document_cache().get(doc_ref, load,
+                                        namespace="transactions")
+
+    if summary is None:
+        summary = get_experiment_summary(db, experiment_name) or {}
+    if "transactions_chunks" in summary:
+        chunks = _get_chunks(db, doc_ref, summary)
+        if chunks is None:
+            # Rewritten since the summary was read, its chunks are deleted
+            summary = get_experiment_summary(db, experiment_name) or {}
+            chunks = _get_chunks(db, doc_ref, summary)
+        if chunks is None:
+            raise ValueError(
+                f"Incomplete transactions for experiment {experiment_name}.")
+        return _chunks_to_transactions(chunks)
+
+    # Legacy format, transactions inlined in the experiment document
+    doc = doc_ref.get(field_paths=[
+        firestore.Client.field_path(experiment_name, "transactions")])
+    data = doc.to_dict() or {}
+    return data.get(experiment_name, {}).get("transactions", {})
+
+def _get_chunks(db, doc_ref, summary: dict) -> list:
+    """Fetches the chunks a summary points to, None if any is missing."""
+    chunks_ref = doc_ref.collection(TRANSACTIONS_COLLECTION)
+    generation = summary.get("transactions_generation", "")
+    refs = [chunks_ref.document(_chunk_id(generation, index))
+            for index in range(summary.get("transactions_chunks", 0))]
+    chunks = [chunk.to_dict() for chunk in db.get_all(refs)]
+    if any(chunk is None for chunk in chunks):
+        return None
+    return chunks
+
+def migrate_experiment(db, experiment_name: str) -> bool:
+    """Moves the transactions of a legacy experiment to chunks.
+
+    Returns:
+        bool: Whether the experiment was migrated (False if already chunked).
+    """
+    doc = db.collection("Experiment").document(experiment_name).get()
+    data = doc.to_dict()
+    if data is None or "transactions" not in data.get(experiment_name, {}):
+        return False
+    _store_experiment(db, experiment_name, data)
+    return True
 
 def get_specific_live(db, agent_name: str) -> dict:
 
@@ -121,20 +448,78 @@ def get_specific_live(db, agent_name: str) -> dict:
     return doc.to_dict()
 
 def update_specific_live(db, agent_name: str, new_data: dict):
+    """Merges new_data into an agent document, in a single write.
+
+    Args:
+        db: Firebase database instance.
+        agent_name (str): Agent name.
+        new_data (dict): Fields to set, other fields are kept.
+    """
+
+    doc_ref = db.collection("Live").document(agent_name)
+    doc_ref.set(new_data, merge=True)
+
+def update_live_status(db, agent_name: str, status: str, **fields):
+    """Sets the status (and other top-level fields) of an existing agent."""
+
+    doc_ref = db.collection("Live").document(agent_name)
+    doc_ref.update({"status": status, **fields})
+
+def update_backtest_status(db, backtest_name: str, status: str, **fields):
+    """Sets the status (and other top-level fields) of an existing backtest."""
+
+    doc_ref = db.collection("Backtest").document(backtest_name)
+    doc_ref.update({"status": status, **fields})
+
+def claim_backtest(db, backtest_name: str,
+                   from_status: str = "Ready to start",
+                   to_status: str = "Running") -> bool:
+    """Atomically moves a backtest from one status to another.
 
-    data = get_specific_live(db=db, agent_name=agent_name)
-    data.update(new_data)
-    create_live(db=db, agent_name=agent_name, data=new_data)
+    Runs in a transaction, so that when several workers try to claim the
+    same backtest, only one succeeds.
+
+    Args:
+        db: Firebase database instance.
+        backtest_name (str): Backtest name.
+        from_status (str, optional): Expected status. Defaults to "Ready to start".
+        to_status (str, optional): New status. Defaults to "Running".
+
+    Returns:
+        bool: Whether the backtest was claimed.
+    """
+    doc_ref = db.collection("Backtest").document(backtest_name)
+
+    @firestore.transactional
+    def claim(transaction) -> bool:
+        doc = doc_ref.get(field_paths=["status"], transaction=transaction)
+        if not doc.exists or doc.get("status") != from_status:
+            return False
+        transaction.update(doc_ref, {"status": to_status})
+        return True
+
+    return claim(db.transaction())
 
 def create_backtest(db, backtest_name: str, data: dict) -> bool:
 
     doc_ref = db.collection("Backtest").document(backtest_name)
-    doc = doc_ref.set(data)  # Get data for document
+    result = doc_ref.set(data)
+    # Write-through, the next read only checks the version
+    get_document_cache().store(doc_ref.path, result.update_time, data)
 
 def create_experiment(db, experiment_name: str, data: dict) -> bool:
+    """Stores an experiment, {experiment_name: values}.
 
-    doc_ref = db.collection("Experiment").document(experiment_name)
-    doc = doc_ref.set(data)  # Get data for document
+    The transactions are stored in columnar chunks of a subcollection, and
+    the experiment document only keeps the summary. Overwriting an
+    experiment is atomic for readers, see _store_experiment.
+    """
+
+    if experiment_name in data and "transactions" in data[experiment_name]:
+        _store_experiment(db, experiment_name, data)
+    else:
+        doc_ref = db.collection("Experiment").document(experiment_name)
+        doc = doc_ref.set(data)  # Get data for document
 
 def create_live(db, agent_name: str, data: dict) -> bool:
 
@@ -144,14 +529,102 @@ def create_live(db, agent_name: str, data: dict) -> bool:
 def delete_backtest(db, backtest_name: str) -> bool:
 
     doc_ref = db.collection("Backtest").document(backtest_name)
-    doc_ref.set({})
     doc_ref.delete()
+    get_document_cache().invalidate(doc_ref.path)
+
+def _experiment_deletes(db, experiment_name: str):
+    """Yields the deletes of an experiment and its transaction chunks."""
+    doc_ref = db.collection("Experiment").document(experiment_name)
+    # list_documents only transfers the chunk references
+    for chunk_ref in doc_ref.collection(
+            TRANSACTIONS_COLLECTION).list_documents():
+        yield ("delete", chunk_ref, ())
+    yield ("delete", doc_ref, ())
 
 def delete_experiment(db, experiment_name: str) -> bool:
 
-    doc_ref = db.collection("Experiment").document(experiment_name)
-    doc_ref.set({})
-    doc_ref.delete()
+    _commit_in_batches(db, _experiment_deletes(db, experiment_name))
+    get_document_cache().invalidate(f"Experiment/{experiment_name}")
+
+def delete_experiments(db, experiment_names: list) -> int:
+    """Deletes experiments and their transaction chunks, in batches.
+
+    Returns:
+        int: Number of documents deleted.
+    """
+    count = _commit_in_batches(db, (
+        delete for name in experiment_names
+        for delete in _experiment_deletes(db, name)))
+    cache = get_document_cache()
+    for name in experiment_names:
+        cache.invalidate(f"Experiment/{name}")
+    return count
+
+def _commit_in_batches(db, operations) -> int:
+    """Commits (method, reference, args) operations, WRITE_BATCH_SIZE at a time.
+
+    Returns:
+        int: Number of operations committed.
+    """
+    count = 0
+    batch = db.batch()
+    for method, doc_ref, args in operations:
+        getattr(batch, method)(doc_ref, *args)
+        count += 1
+        if count % WRITE_BATCH_SIZE == 0:
+            batch.commit()
+            batch = db.batch()
+    if count % WRITE_BATCH_SIZE != 0:
+        batch.commit()
+    return count
+
+def bulk_create(db, collection: str, documents: dict) -> int:
+    """Creates or overwrites documents, one round trip per 500 documents.
+
+    Args:
+        db: Firebase database instance.
+        collection (str): Collection name.
+        documents (dict): Documents data by name.
+
+    Returns:
+        int: Number of documents written.
+    """
+    col_ref = db.collection(collection)
+    return _commit_in_batches(db, (
+        ("set", col_ref.document(name), (data,))
+        for name, data in documents.items()))
+
+def bulk_update(db, collection: str, updates: dict) -> int:
+    """Updates fields of existing documents, one round trip per 500 documents.
+
+    Args:
+        db: Firebase database instance.
+        collection (str): Collection name.
+        updates (dict): Fields to update by document name. Nested fields
+            are given as field paths, e.g. {"execution.status": "done"}.
+
+    Returns:
+        int: Number of documents updated.
+    """
+    col_ref = db.collection(collection)
+    return _commit_in_batches(db, (
+        ("update", col_ref.document(name), (fields,))
+        for name, fields in updates.items()))
+
+def bulk_delete(db, collection: str, names: list) -> int:
+    """Deletes documents, one round trip per 500 documents.
+
+    Args:
+        db: Firebase database instance.
+        collection (str): Collection name.
+        names (list): Document names.
+
+    Returns:
+        int: Number of documents deleted.
+    """
+    col_ref = db.collection(collection)
+    return _commit_in_batches(db, (
+        ("delete", col_ref.document(name), ()) for name in names))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Local Firestore Document Cache.
+
+SQLite copy of Firestore documents (experiments, backtests), keyed by
+document path and Firestore ``update_time``. It survives server restarts,
+unlike the Streamlit caches, and never serves outdated data:
+
+* Each read first fetches the document metadata only (empty field mask),
+  which returns its current ``update_time`` without any field.
+* If it matches the stored version, the local copy is returned.
+* Otherwise the document is downloaded and stored (read-through), as are
+  the documents written by this process (write-through).
+
+Documents are stored pickled, so that Firestore values (timestamps,
+references...) are returned as such.
+
+Usage:
+    cache = DocumentCache("documents.sqlite")
+    data = cache.get(db.collection("Backtest").document(name))
+
+Todo:
+    * ...
+"""
+
+# Built-in modules
+import pickle
+import sqlite3
+import time
+from contextlib import contextmanager
+
+# Third-party modules
+
+# Local modules
+from autotrader_ui.metrics import METRICS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    namespace TEXT NOT NULL,
+    path TEXT NOT NULL,
+    update_time TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (namespace, path)
+);
+"""
+DEFAULT_NAMESPACE = "document"
+
+
+def version_key(update_time) -> str:
+    """Returns a comparable string of a Firestore update time.
+
+    Update times have a microsecond (or nanosecond) precision and change on
+    every write, so they identify a version of a document.
+    """
+    if hasattr(update_time, "rfc3339"):  # DatetimeWithNanoseconds
+        return update_time.rfc3339()
+    return update_time.isoformat()
+
+
+class DocumentCache(object):
+    """SQLite cache of Firestore documents, revalidated on every read.
+
+    Entries live in namespaces, so that several values derived from the
+    same document (e.g. an experiment and its transactions) are cached
+    separately and revalidated against the document's version.
+
+    Args:
+        path (str, optional): SQLite database file. Defaults to "documents.sqlite".
+        metrics (MetricsRegistry, optional): Registry receiving the
+            ``doc_cache.lookups`` counter, per namespace and result (hit,
+            miss, stale, missing). Defaults to the process-wide registry.
+    """
+
+    def __init__(self, path: str = "documents.sqlite", metrics=METRICS):
+        self.path = path
+        self.metrics = metrics
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:  # Commits, or rolls back on errors
+                yield conn
+        finally:
+            conn.close()
+
+    def lookup(self, path: str, namespace: str = DEFAULT_NAMESPACE) -> tuple:
+        """Returns the stored (update_time, data) of a document, or None."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT update_time, data FROM documents "
+                "WHERE namespace = ? AND path = ?",
+                (namespace, path)).fetchone()
+        if row is None:
+            return None
+        return row[0], pickle.loads(row[1])
+
+    def store(self, path: str, update_time, data,
+              namespace: str = DEFAULT_NAMESPACE):
+        """Stores a version of a document.
+
+        Args:
+            path (str): Document path, e.g. "Backtest/my_backtest".
+            update_time: Firestore update time of this version.
+            data: Value to cache, typically the document dictionary.
+            namespace (str, optional): Namespace. Defaults to "document".
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?)",
+                (namespace, path, version_key(update_time), time.time(),
+                 pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)))
+
+    def invalidate(self, path: str = None):
+        """Drops the entries of a document (all namespaces), or all entries."""
+        with self._connect() as conn:
+            if path is None:
+                conn.execute("DELETE FROM documents")
+            else:
+                conn.execute("DELETE FROM documents WHERE path = ?", (path,))
+
+    def get(self, doc_ref, load=None, namespace: str = DEFAULT_NAMESPACE):
+        """Returns the data of a document, from the cache when up to date.
+
+        Args:
+            doc_ref (DocumentReference): Document to read.
+            load (callable, optional): Builds the cached value from the
+                document snapshot, when the local copy is missing or stale.
+                Defaults to None (``snapshot.to_dict()``).
+            namespace (str, optional): Namespace of the value. Defaults to "document".
+
+        Returns:
+            Cached value, None if the document does not exist.
+        """
+        # Metadata only: no field is transferred
+        meta = doc_ref.get(field_paths=[])
+        if not meta.exists:
+            self.invalidate(doc_ref.path)
+            self._record(namespace, "missing")
+            return None
+
+        cached = self.lookup(doc_ref.path, namespace)
+        if cached is not None and cached[0] == version_key(meta.update_time):
+            self._record(namespace, "hit")
+            return cached[1]
+
+        self._record(namespace, "miss" if cached is None else "stale")
+        snapshot = doc_ref.get()
+        if not snapshot.exists:  # Deleted in between
+            self.invalidate(doc_ref.path)
+            return None
+        data = load(snapshot) if load is not None else snapshot.to_dict()
+        self.store(doc_ref.path, snapshot.update_time, data, namespace)
+        return data
+
+    def _record(self, namespace: str, result: str):
+        self.metrics.counter("doc_cache.lookups", namespace=namespace,
+                             result=result).inc()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Realtime Firestore Collection Mirror.
+
+In-memory copy of a Firestore collection, kept up to date by a snapshot
+listener. After the initial load, only the changed documents are
+transferred, and pages read the mirror without querying Firestore.
+
+Usage:
+    mirror = CollectionMirror(db, "Backtest", fields=["status", "created_at"])
+    backtests = mirror.snapshot()
+
+Todo:
+    * ...
+"""
+
+# Built-in modules
+import threading
+import time
+
+# Third-party modules
+
+# Local modules
+
+READY_TIMEOUT = 30.  # seconds
+
+
+class CollectionMirror(object):
+    """Collection mirror fed by an ``on_snapshot`` listener.
+
+    The listener runs on the Firestore client's background thread and
+    applies the change deltas (added, modified, removed documents).
+
+    Args:
+        db: Firebase database instance.
+        collection (str): Collection name.
+        fields (list, optional): Fields kept in memory. Listeners always
+            receive whole documents, so this only trims the mirror. Defaults
+            to None (all fields).
+    """
+
+    def __init__(self, db, collection: str, fields: list = None):
+        self.collection = collection
+        self.fields = fields
+        self.version = 0  # Incremented on every applied snapshot
+        self.updated_at = None
+        self._documents = {}
+        self._ready = threading.Event()
+        self._cond = threading.Condition()
+        self._watch = db.collection(collection).on_snapshot(self._on_snapshot)
+
+    def _on_snapshot(self, docs, changes, read_time):
+        with self._cond:
+            for change in changes:
+                doc = change.document
+                if change.type.name == "REMOVED":
+                    self._documents.pop(doc.id, None)
+                    continue
+                data = doc.to_dict()
+                if self.fields is not None:
+                    data = {k: data[k] for k in self.fields if k in data}
+                self._documents[doc.id] = data
+            self.version += 1
+            self.updated_at = time.time()
+            self._cond.notify_all()
+        self._ready.set()
+
+    def wait_ready(self, timeout: float = READY_TIMEOUT) -> bool:
+        """Waits for the initial load, returns False on timeout."""
+        return self._ready.wait(timeout)
+
+    def wait_for_change(self, version: int, timeout: float = None) -> int:
+        """Waits until the mirror is newer than version.
+
+        Args:
+            version (int): Last version seen by the caller.
+            timeout (float, optional): Maximum wait, in seconds. Defaults to None (no limit).
+
+        Returns:
+            int: Current version, equal to version on timeout.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def snapshot(self) -> dict:
+        """Returns a copy of the mirrored documents, by ID."""
+        with self._cond:
+            return {doc_id: dict(data)
+                    for doc_id, data in self._documents.items()}
+
+    def get(self, doc_id: str) -> dict:
+        """Returns a copy of one mirrored document, or None."""
+        with self._cond:
+            data = self._documents.get(doc_id)
+            return dict(data) if data is not None else None
+
+    def close(self):
+        """Stops listening. The mirror keeps its last state."""
+        self._watch.unsubscribe()
@@ -0,0 +1,499 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Incremental Indicators.
+
+Stateful RSI, MACD, EMA, SMA and stochastic objects updated bar by bar,
+for live agents fed by ``tpqoa.stream_data`` callbacks (e.g. through
+``ticks.BarAggregator``). Each update costs O(1) in the length of the
+history, instead of recomputing the whole history on every bar:
+
+* Exponential averages keep a weighted mean and its weight, updated with
+  the ``ewm`` recursion.
+* Rolling minimums and maximums use monotonic deques.
+* Rolling means keep a running sum, recomputed exactly every window.
+
+Indicators are seeded from a historical DataFrame with ``from_history``:
+their state is set from the batch values over the history (pandas ``ewm``
+means and the ``indicator_engine`` kernels), which then continue with
+each new closed bar.
+
+Usage:
+    rsi = RSI.from_history(df, length=14)
+    bar = aggregator.update(time_ns, price)
+    if bar is not None:
+        value = rsi.update_bar(bar)
+
+Todo:
+    * ...
+"""
+
+# Built-in modules
+import abc
+import math
+import sys
+from collections import deque
+
+# Third-party modules
+import numpy as np
+import pandas as pd
+
+# Local modules
+from autotrader_ui import indicator_engine
+from autotrader_ui.indicator_engine import MOVING_AVERAGES
+
+NAN = float("nan")
+# Positions of the columns in the (time, o, h, l, c, volume) bars
+BAR_INDEX = {"o": 1, "h": 2, "l": 3, "c": 4, "volume": 5}
+
+
+def _last(values: np.ndarray) -> float:
+    return float(values[-1]) if len(values) > 0 else NAN
+
+
+class Indicator(abc.ABC):
+    """Base class of the incremental indicators.
+
+    Subclasses define ``update``, taking the values of ``columns`` for one
+    bar and returning the indicator value(s) after that bar, and ``seed``,
+    taking the same values over a whole history.
+    """
+
+    columns = ("c",)
+
+    @abc.abstractmethod
+    def update(self, *values):
+        """Updates with the values of ``columns`` for one bar."""
+
+    @abc.abstractmethod
+    def seed(self, *columns):
+        """Sets the state after a history, from the batch values over it.
+
+        Args:
+            *columns (np.ndarray): Values of ``columns`` over the history.
+
+        Returns:
+            The batch values of the indicator over the history, as arrays.
+        """
+
+    def update_bar(self, bar: tuple):
+        """Updates with a (time, o, h, l, c, volume) bar, e.g. closed by a BarAggregator."""
+        return self.update(*(bar[BAR_INDEX[column]]
+                             for column in self.columns))
+
+    @classmethod
+    def from_history(cls, df: pd.DataFrame, **params):
+        """Creates an indicator in the state following the rows of df.
+
+        Args:
+            df (pd.DataFrame): Bars, with the o/h/l/c/volume columns used.
+            **params: Indicator arguments.
+
+        Returns:
+            Indicator: Indicator after the last row of df.
+        """
+        indicator = cls(**params)
+        indicator.seed(*(df[column].to_numpy(dtype=np.float64)
+                         for column in cls.columns))
+        return indicator
+
+
+class EWMean(Indicator):
+    """Exponentially weighted mean, as ``pd.Series.ewm(...).mean()``.
+
+    Applies the ``ewm`` recursion with ``ignore_na=False``: missing values
+    only decay the weight of the past observations. With ``adjust=False``
+    and ``com=1``, the weight of a new observation is the complement of the
+    decayed weight, as pandas does for irregular intervals, so that the
+    value following missing values matches too.
+
+    Args:
+        com (float, optional): Center of mass. Defaults to None.
+        span (float, optional): Span. Defaults to None.
+        alpha (float, optional): Smoothing factor. Defaults to None.
+        adjust (bool, optional): Adjusted weights. Defaults to True.
+        min_periods (int, optional): Observations needed for a value. Defaults to 0.
+    """
+
+    def __init__(self, com: float = None, span: float = None,
+                 alpha: float = None, adjust: bool = True,
+                 min_periods: int = 0):
+        # Same conversions as pandas, for the same rounding
+        if com is None:
+            com = (span - 1) / 2 if span is not None else (1 - alpha) / alpha
+        alpha = 1. / (1. + com)
+        self.com = com
+        self.old_wt_factor = 1. - alpha
+        self.new_wt = 1. if adjust else alpha
+        self.adjust = adjust
+        self.reweight = not adjust and com == 1
+        self.min_periods = max(min_periods, 1)
+        self.nobs = 0
+        self.weighted = NAN
+        self.old_wt = 1.
+        self.value = NAN
+
+    def seed(self, x: np.ndarray) -> np.ndarray:
+        observed = ~np.isnan(x)
+        nobs = np.cumsum(observed)
+        # Weighted mean after every value, whatever min_periods
+        weighted = pd.Series(x, copy=False).ewm(
+            com=self.com, adjust=self.adjust).mean().to_numpy()
+        positions = np.flatnonzero(observed)
+        if len(positions) > 0:
+            self.nobs = int(nobs[-1])
+            self.weighted = float(weighted[-1])
+            # Weight of the past observations, decayed at every value
+            ages = len(x) - 1 - (positions if self.adjust
+                                 else positions[-1:])
+            self.old_wt = float((self.old_wt_factor ** ages).sum())
+        self.value = _last(weighted) if self.nobs >= self.min_periods \
+            else NAN
+        return np.where(nobs >= self.min_periods, weighted, NAN)
+
+    def update(self, x: float) -> float:
+        is_observation = x == x
+        self.nobs += is_observation
+        if self.weighted == self.weighted:
+            self.old_wt *= self.old_wt_factor
+            if self.reweight:
+                self.new_wt = 1. - self.old_wt
+            if is_observation:
+                # Unchanged on constant values, like pandas
+                if self.weighted != x:
+                    self.weighted = (self.old_wt * self.weighted +
+                                     self.new_wt * x)
+                    self.weighted /= (self.old_wt + self.new_wt)
+                if self.adjust:
+                    self.old_wt += self.new_wt
+                else:
+                    self.old_wt = 1.
+        elif is_observation:
+            self.weighted = x
+        self.value = self.weighted if self.nobs >= self.min_periods else NAN
+        return self.value
+
+
+class RollingMean(Indicator):
+    """Simple moving average, NaN for windows with a missing value.
+
+    Keeps a running sum of the window, recomputed exactly every length
+    updates so that rounding errors do not accumulate.
+
+    Args:
+        length (int): Window length.
+    """
+
+    def __init__(self, length: int):
+        self.length = length
+        self.window = deque(maxlen=length)
+        self.total = 0.
+        self.nans = 0  # Missing values in the window
+        self.updates = 0
+        self.value = NAN
+
+    def seed(self, x: np.ndarray) -> np.ndarray:
+        self.window.clear()
+        self.window.extend(x[-self.length:].tolist())
+        self._resum()
+        means = indicator_engine.sma(x, self.length)
+        self.value = _last(means)
+        return means
+
+    def _resum(self):
+        self.total = math.fsum(v for v in self.window if v == v)
+        self.nans = sum(1 for v in self.window if v != v)
+        self.updates = 0
+
+    def update(self, x: float) -> float:
+        if len(self.window) == self.length:
+            dropped = self.window[0]
+            if dropped == dropped:
+                self.total -= dropped
+            else:
+                self.nans -= 1
+        self.window.append(x)
+        if x == x:
+            self.total += x
+        else:
+            self.nans += 1
+        self.updates += 1
+        if self.updates == self.length:
+            self._resum()
+
+        if len(self.window) < self.length or self.nans > 0:
+            self.value = NAN
+        else:
+            self.value = self.total / self.length
+        return self.value
+
+
+class RollingExtremum(Indicator):
+    """Minimum or maximum of the last length values, with a monotonic deque.
+
+    Args:
+        length (int): Window length.
+        maximum (bool, optional): Maximum instead of minimum. Defaults to False.
+    """
+
+    def __init__(self, length: int, maximum: bool = False):
+        self.length = length
+        self.maximum = maximum
+        self.count = 0
+        self.candidates = deque()  # (position, value), monotonic
+        self.nans = deque()  # Positions of the NaNs in the window
+        self.value = NAN
+
+    def seed(self, x: np.ndarray) -> np.ndarray:
+        # Only the last window matters to the deques
+        tail = x[-self.length:].tolist()
+        self.count = len(x) - len(tail)
+        self.candidates.clear()
+        self.nans.clear()
+        for value in tail:
+            self.update(value)
+        kernel = (indicator_engine.rolling_max if self.maximum
+                  else indicator_engine.rolling_min)
+        return kernel(x, self.length)
+
+    def update(self, x: float) -> float:
+        position = self.count
+        self.count += 1
+        start = position - self.length + 1  # First position in the window
+        while self.candidates and self.candidates[0][0] < start:
+            self.candidates.popleft()
+        while self.nans and self.nans[0] < start:
+            self.nans.popleft()
+
+        if x != x:
+            self.nans.append(position)
+        else:
+            while self.candidates and (
+                    self.candidates[-1][1] <= x if self.maximum
+                    else self.candidates[-1][1] >= x):
+                self.candidates.pop()
+            self.candidates.append((position, x))
+
+        if self.count < self.length or self.nans:
+            self.value = NAN
+        else:
+            self.value = self.candidates[0][1]
+        return self.value
+
+
+class EMA(Indicator):
+    """Exponential moving average, seeded by the SMA of its first values.
+
+    Args:
+        length (int, optional): Period. Defaults to 10.
+    """
+
+    def __init__(self, length: int = 10):
+        self.length = length
+        self.head = []
+        self.ewm = EWMean(span=length, adjust=False)
+        self.value = NAN
+
+    def seed(self, x: np.ndarray) -> np.ndarray:
+        out = np.full(len(x), NAN)
+        if len(x) < self.length:
+            self.head = x.tolist()
+            return out
+        # The first length values are replaced by their mean
+        head = x[:self.length]
+        valid = head[~np.isnan(head)]
+        seeded = np.empty(len(x) - self.length + 1)
+        seeded[0] = valid.mean() if len(valid) > 0 else NAN
+        seeded[1:] = x[self.length:]
+        self.head = None
+        out[self.length - 1:] = self.ewm.seed(seeded)
+        self.value = _last(out)
+        return out
+
+    def update(self, x: float) -> float:
+        if self.head is None:
+            self.value = self.ewm.update(x)
+            return self.value
+
+        self.head.append(x)
+        if len(self.head) == self.length:
+            valid = np.array([v for v in self.head if v == v])
+            seed = float(valid.mean()) if len(valid) > 0 else NAN
+            self.head = None
+            self.value = self.ewm.update(seed)
+        return self.value
+
+
+def moving_average(length: int, mamode: str = "sma") -> Indicator:
+    """Returns an incremental SMA or EMA.
+
+    Raises:
+        ValueError: Unsupported mamode.
+    """
+    if mamode not in MOVING_AVERAGES:
+        raise ValueError(f"Unsupported moving average: {mamode}")
+    return RollingMean(length) if mamode == "sma" else EMA(length)
+
+
+class _FromFirstValid(Indicator):
+    """Moving average started at the first valid value, as the batch one."""
+
+    def __init__(self, length: int, mamode: str = "sma"):
+        self.average = moving_average(length, mamode)
+        self.started = False
+        self.value = NAN
+
+    def seed(self, x: np.ndarray) -> np.ndarray:
+        out = np.full(len(x), NAN)
+        valid = np.flatnonzero(~np.isnan(x))
+        if len(valid) > 0:
+            self.started = True
+            out[valid[0]:] = self.average.seed(x[valid[0]:])
+            self.value = _last(out)
+        return out
+
+    def update(self, x: float) -> float:
+        self.started = self.started or x == x
+        if self.started:
+            self.value = self.average.update(x)
+        return self.value
+
+
+class SMA(RollingMean):
+    """Simple moving average of the close, see ``indicators.get_ma``.
+
+    Args:
+        length (int, optional): Period. Defaults to 30.
+    """
+
+    def __init__(self, length: int = 30):
+        super().__init__(length)
+
+
+class RSI(Indicator):
+    """Relative Strength Index, see ``indicators.get_rsi``.
+
+    Args:
+        length (int, optional): Period. Defaults to 14.
+        scalar (float, optional): Scale of the result. Defaults to 100.
+        drift (int, optional): Difference period. Defaults to 1.
+    """
+
+    def __init__(self, length: int = 14, scalar: float = 100,
+                 drift: int = 1):
+        self.scalar = scalar
+        self.closes = deque(maxlen=drift + 1)
+        self.positive = EWMean(alpha=1. / length, min_periods=length)
+        self.negative = EWMean(alpha=1. / length, min_periods=length)
+        self.value = NAN
+
+    def seed(self, close: np.ndarray) -> np.ndarray:
+        drift = self.closes.maxlen - 1
+        self.closes.extend(close[-(drift + 1):].tolist())
+        change = np.full(len(close), NAN)
+        change[drift:] = close[drift:] - close[:-drift]
+        positive_avg = self.positive.seed(np.where(change < 0, 0., change))
+        negative_avg = self.negative.seed(np.where(change > 0, 0., change))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = self.scalar * positive_avg / (positive_avg +
+                                                   np.abs(negative_avg))
+        self.value = _last(values)
+        return values
+
+    def update(self, close: float) -> float:
+        self.closes.append(close)
+        change = (close - self.closes[0]
+                  if len(self.closes) == self.closes.maxlen else NAN)
+        positive_avg = self.positive.update(0. if change < 0 else change)
+        negative_avg = self.negative.update(0. if change > 0 else change)
+        denominator = positive_avg + abs(negative_avg)
+        # 0 / 0 is NaN in the batch functions
+        self.value = (self.scalar * positive_avg / denominator
+                      if denominator != 0 else NAN)
+        return self.value
+
+
+class MACD(Indicator):
+    """Moving Average Convergence Divergence, see ``indicators.get_macd``.
+
+    ``update`` returns the MACD, histogram and signal values.
+
+    Args:
+        fast (int, optional): Period of the fast EMA. Defaults to 12.
+        slow (int, optional): Period of the slow EMA. Defaults to 26.
+        signal (int, optional): Period of the EMA of the MACD line. Defaults to 9.
+    """
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.signal = _FromFirstValid(signal, "ema")
+        self.value = (NAN, NAN, NAN)
+
+    def seed(self, close: np.ndarray) -> tuple:
+        macd = self.fast.seed(close) - self.slow.seed(close)
+        signal = self.signal.seed(macd)
+        lines = (macd, macd - signal, signal)
+        self.value = tuple(_last(line) for line in lines)
+        return lines
+
+    def update(self, close: float) -> tuple:
+        macd = self.fast.update(close) - self.slow.update(close)
+        signal = self.signal.update(macd)
+        self.value = (macd, macd - signal, signal)
+        return self.value
+
+
+class Stochastic(Indicator):
+    """Stochastic oscillator, see ``indicators.get_stochastic``.
+
+    ``update`` returns the %K and %D values. Like the batch function, the
+    high-low range is shifted by epsilon once it has been zero; the batch
+    function also shifts the bars preceding the first zero range, which
+    an incremental update cannot do for the bars after the history
+    (relative difference below 1e-11).
+
+    Args:
+        k (int, optional): The Fast %K period. Defaults to 14.
+        d (int, optional): The Slow %K period. Defaults to 3.
+        smooth_k (int, optional): The Slow %D period. Defaults to 3.
+        mamode (str, optional): 'sma' or 'ema'. Defaults to 'sma'.
+    """
+
+    columns = ("h", "l", "c")
+
+    def __init__(self, k: int = 14, d: int = 3, smooth_k: int = 3,
+                 mamode: str = "sma"):
+        self.lowest_low = RollingExtremum(k)
+        self.highest_high = RollingExtremum(k, maximum=True)
+        self.stoch_k = _FromFirstValid(smooth_k, mamode)
+        self.stoch_d = _FromFirstValid(d, mamode)
+        self.shifted = False
+        self.value = (NAN, NAN)
+
+    def seed(self, high: np.ndarray, low: np.ndarray,
+             close: np.ndarray) -> tuple:
+        lowest_low = self.lowest_low.seed(low)
+        price_range = self.highest_high.seed(high) - lowest_low
+        # A zero range anywhere shifts the whole batch computation
+        self.shifted = bool((price_range == 0).any())
+        if self.shifted:
+            price_range += sys.float_info.epsilon
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fast_k = 100 * (close - lowest_low) / price_range
+        stoch_k = self.stoch_k.seed(fast_k)
+        stoch_d = self.stoch_d.seed(stoch_k)
+        self.value = (_last(stoch_k), _last(stoch_d))
+        return stoch_k, stoch_d
+
+    def update(self, high: float, low: float, close: float) -> tuple:
+        lowest_low = self.lowest_low.update(low)
+        price_range = self.highest_high.update(high) - lowest_low
+        self.shifted = self.shifted or price_range == 0
+        if self.shifted:
+            price_range += sys.float_info.epsilon
+        # Never zero once shifted
+        fast_k = 100 * (close - lowest_low) / price_range
+        stoch_k = self.stoch_k.update(fast_k)
+        self.value = (stoch_k, self.stoch_d.update(stoch_k))
+        return self.value
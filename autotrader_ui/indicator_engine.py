@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Vectorized Indicator Engine.
+
+Computes RSI, MACD, stochastic, SMA and EMA on NumPy views of the
+``o/h/l/c/volume`` columns, without copying or renaming the OHLCV frame,
+and with the same results as pandas_ta (without TA-Lib):
+
+* Rolling means are differences of cumulative sums, and rolling minimums
+  and maximums go through the pandas ``rolling`` kernels (a monotonic
+  deque): all run in O(n), whatever the window length.
+* Exponential averages go through the pandas ``ewm`` kernel, on Series
+  wrapping the arrays, so that they match pandas_ta to the last bit.
+
+The kernels take and return float64 arrays, NaN where pandas_ta gives NaN.
+``IndicatorEngine`` names the results like pandas_ta (``RSI_14``,
+``MACD_12_26_9``...) and reuses the exponential averages it already
+computed.
+
+Usage:
+    engine = IndicatorEngine(df)
+    rsi = engine.rsi(14)
+    macd, histogram, signal = engine.macd(12, 26, 9)
+
+Todo:
+    * ...
+"""
+
+# Built-in modules
+import sys
+
+# Third-party modules
+import numpy as np
+import pandas as pd
+
+# Local modules
+
+COLUMNS = ("o", "h", "l", "c", "volume")
+MOVING_AVERAGES = ("sma", "ema")
+
+
+def _nan_like(x: np.ndarray) -> np.ndarray:
+    return np.full(len(x), np.nan)
+
+
+def _full_windows(x: np.ndarray, length: int) -> bool:
+    return 0 < length <= len(x)
+
+
+def sma(x: np.ndarray, length: int) -> np.ndarray:
+    """Simple moving average, NaN for windows with a missing value.
+
+    Each window sum is the difference of two cumulative sums. The values
+    are centred on the first valid one, so that the sums stay small and
+    keep their precision on long series.
+    """
+    out = _nan_like(x)
+    if not _full_windows(x, length):
+        return out
+    missing = np.isnan(x)
+    if missing.all():
+        return out
+    shift = x[np.argmin(missing)]
+    sums = np.concatenate(([0.], np.cumsum(np.where(missing, 0., x - shift))))
+    counts = np.concatenate(([0], np.cumsum(missing)))
+    means = (sums[length:] - sums[:-length]) / length + shift
+    out[length - 1:] = np.where(counts[length:] > counts[:-length], np.nan,
+                                means)
+    return out
+
+
+def rolling_min(x: np.ndarray, length: int) -> np.ndarray:
+    """Minimum of the last length values, NaN for windows with a missing value."""
+    if not _full_windows(x, length):
+        return _nan_like(x)
+    return pd.Series(x, copy=False).rolling(length).min().to_numpy()
+
+
+def rolling_max(x: np.ndarray, length: int) -> np.ndarray:
+    """Maximum of the last length values, NaN for windows with a missing value."""
+    if not _full_windows(x, length):
+        return _nan_like(x)
+    return pd.Series(x, copy=False).rolling(length).max().to_numpy()
+
+
+def ewm_mean(x: np.ndarray, **ewm_kwargs) -> np.ndarray:
+    """Exponentially weighted mean, see ``pd.Series.ewm``."""
+    return pd.Series(x, copy=False).ewm(**ewm_kwargs).mean().to_numpy()
+
+
+def ema(x: np.ndarray, length: int) -> np.ndarray:
+    """Exponential moving average, seeded by the SMA of the first values.
+
+    Like pandas_ta: the first length values are replaced by their mean,
+    then ``ewm(span=length, adjust=False)`` runs from there.
+    """
+    out = _nan_like(x)
+    if not _full_windows(x, length):
+        return out
+    head = x[:length]
+    head = head[~np.isnan(head)]
+    seeded = np.empty(len(x) - length + 1)
+    seeded[0] = head.mean() if len(head) > 0 else np.nan
+    seeded[1:] = x[length:]
+    out[length - 1:] = ewm_mean(seeded, span=length, adjust=False)
+    return out
+
+
+def rma(x: np.ndarray, length: int) -> np.ndarray:
+    """Wilder's moving average, as used by the RSI."""
+    return ewm_mean(x, alpha=1. / length, min_periods=length)
+
+
+def moving_average(x: np.ndarray, length: int,
+                   mamode: str = "sma") -> np.ndarray:
+    """SMA or EMA from the first valid value of x, like ``pandas_ta.ma``.
+
+    Raises:
+        ValueError: Unsupported mamode.
+    """
+    if mamode not in MOVING_AVERAGES:
+        raise ValueError(f"Unsupported moving average: {mamode}")
+    out = _nan_like(x)
+    valid = np.flatnonzero(~np.isnan(x))
+    if len(valid) == 0:
+        return out
+    first = valid[0]
+    kernel = sma if mamode == "sma" else ema
+    out[first:] = kernel(x[first:], length)
+    return out
+
+
+def rsi(close: np.ndarray, length: int = 14, scalar: float = 100,
+        drift: int = 1) -> np.ndarray:
+    """Relative Strength Index."""
+    change = _nan_like(close)
+    change[drift:] = close[drift:] - close[:-drift]
+    positive_avg = rma(np.where(change < 0, 0., change), length)
+    negative_avg = rma(np.where(change > 0, 0., change), length)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return scalar * positive_avg / (positive_avg + np.abs(negative_avg))
+
+
+def macd(close: np.ndarray, fast: int = 12, slow: int = 26,
+         signal: int = 9, fast_ema: np.ndarray = None,
+         slow_ema: np.ndarray = None) -> tuple:
+    """Moving Average Convergence Divergence.
+
+    Args:
+        close (np.ndarray): Close prices.
+        fast (int, optional): Period of the fast EMA. Defaults to 12.
+        slow (int, optional): Period of the slow EMA. Defaults to 26.
+        signal (int, optional): Period of the EMA of the MACD line. Defaults to 9.
+        fast_ema (np.ndarray, optional): Fast EMA, if already computed. Defaults to None.
+        slow_ema (np.ndarray, optional): Slow EMA, if already computed. Defaults to None.
+
+    Returns:
+        tuple: MACD line, histogram and signal line.
+    """
+    if fast_ema is None:
+        fast_ema = ema(close, fast)
+    if slow_ema is None:
+        slow_ema = ema(close, slow)
+    macd_line = fast_ema - slow_ema
+    signal_line = moving_average(macd_line, signal, "ema")
+    return macd_line, macd_line - signal_line, signal_line
+
+
+def stoch(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+          k: int = 14, d: int = 3, smooth_k: int = 3,
+          mamode: str = "sma") -> tuple:
+    """Stochastic oscillator.
+
+    Returns:
+        tuple: %K and %D lines.
+    """
+    lowest_low = rolling_min(low, k)
+    price_range = rolling_max(high, k) - lowest_low
+    if (price_range == 0).any():  # pandas_ta shifts the whole range
+        price_range += sys.float_info.epsilon
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fast_k = 100 * (close - lowest_low) / price_range
+    stoch_k = moving_average(fast_k, smooth_k, mamode)
+    stoch_d = moving_average(stoch_k, d, mamode)
+    return stoch_k, stoch_d
+
+
+class IndicatorEngine(object):
+    """Indicators of one OHLCV frame, computed on its column arrays.
+
+    The arrays are views of the frame's float64 columns (other dtypes are
+    converted once), and the exponential averages are kept, so that e.g.
+    ``ema(12)`` and ``macd(12, 26, 9)`` share their work.
+
+    Args:
+        df (pd.DataFrame): Data, with some of the o/h/l/c/volume columns.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.index = df.index
+        self.arrays = {column: df[column].to_numpy(dtype=np.float64,
+                                                   copy=False)
+                       for column in COLUMNS if column in df.columns}
+        self._emas = {}
+
+    def _series(self, values: np.ndarray, name: str,
+                offset: int = 0) -> pd.Series:
+        series = pd.Series(values, index=self.index, name=name, copy=False)
+        return series.shift(offset) if offset != 0 else series
+
+    def _ema(self, length: int, column: str = "c") -> np.ndarray:
+        key = (column, length)
+        if key not in self._emas:
+            self._emas[key] = ema(self.arrays[column], length)
+        return self._emas[key]
+
+    def rsi(self, length: int = 14, scalar: float = 100,
+            drift: int = 1) -> pd.Series:
+        """RSI of the close, named RSI_{length}."""
+        return self._series(rsi(self.arrays["c"], length, scalar, drift),
+                            f"RSI_{length}")
+
+    def sma(self, length: int = 10, offset: int = 0,
+            column: str = "c") -> pd.Series:
+        """SMA of a column, named SMA_{length}."""
+        return self._series(sma(self.arrays[column], length),
+                            f"SMA_{length}", offset)
+
+    def ema(self, length: int = 10, offset: int = 0,
+            column: str = "c") -> pd.Series:
+        """EMA of a column, named EMA_{length}."""
+        return self._series(self._ema(length, column), f"EMA_{length}",
+                            offset)
+
+    def macd(self, fast: int = 12, slow: int = 26, signal: int = 9) -> tuple:
+        """MACD of the close.
+
+        Returns:
+            tuple: MACD, histogram and signal Series, named
+            MACD/MACDh/MACDs_{fast}_{slow}_{signal}.
+        """
+        lines = macd(self.arrays["c"], fast, slow, signal,
+                     fast_ema=self._ema(fast), slow_ema=self._ema(slow))
+        suffix = f"_{fast}_{slow}_{signal}"
+        return tuple(self._series(values, prefix + suffix)
+                     for values, prefix in zip(lines,
+                                               ("MACD", "MACDh", "MACDs")))
+
+    def stoch(self, k: int = 14, d: int = 3, smooth_k: int = 3,
+              mamode: str = "sma", offset: int = 0) -> tuple:
+        """Stochastic oscillator.
+
+        Returns:
+            tuple: %K and %D Series, named STOCHk/STOCHd_{k}_{d}_{smooth_k}.
+        """
+        lines = stoch(self.arrays["h"], self.arrays["l"], self.arrays["c"],
+                      k, d, smooth_k, mamode)
+        suffix = f"_{k}_{d}_{smooth_k}"
+        return tuple(self._series(values, prefix + suffix, offset)
+                     for values, prefix in zip(lines, ("STOCHk", "STOCHd")))
@@ -1,5 +1,6 @@
 import pandas as pd
-import pandas_ta as ta
+
+from autotrader_ui.indicator_engine import MOVING_AVERAGES, IndicatorEngine
 
 pandas_ta_col_converter = {
     "o": "Open",
@@ -17,9 +18,7 @@ def get_rsi(df: pd.DataFrame, length: int = 14, scalar: int = 100,
     Args:
         df (pd.DataFrame): Data.
     """
-    df = df.copy()
-    df = df.rename(pandas_ta_col_converter, axis=1)
-    rsi = df.ta.rsi(length=length, scalar=scalar, drift=drift)
+    rsi = IndicatorEngine(df).rsi(length=length, scalar=scalar, drift=drift)
 
     return rsi
 
@@ -35,12 +34,8 @@ def get_macd(df: pd.DataFrame, fast: int = 12,
         signal (int, optional): Period of ema calculation on macd line. Defaults to 9.
     """
 
-    df = df.copy()
-    df = df.rename(pandas_ta_col_converter, axis=1)
-    macd_df = df.ta.macd(fast=fast, slow=slow, signal=signal)
-
-    macd = macd_df.iloc[:, 0]
-    macd_signal = macd_df.iloc[:, 2]
+    macd, _, macd_signal = IndicatorEngine(df).macd(fast=fast, slow=slow,
+                                                    signal=signal)
 
     return macd, macd_signal
 
@@ -78,13 +73,17 @@ def get_stochastic(df: pd.DataFrame, k: int = 14, d: int = 3, smooth_k: int = 3,
         offset (int, optional): How many periods to offset the result. Defaults to 0.
     """
 
-    df = df.copy()
-    df = df.rename(pandas_ta_col_converter, axis=1)
-    stoch = df.ta.stoch(k=k, d=d, smooth_k=smooth_k,
-                        mamode=mamode, offset=offset)
+    if mamode not in MOVING_AVERAGES:
+        # Other moving averages are only available in pandas_ta
+        import pandas_ta as ta
 
-    stoch_k = stoch.iloc[:, 0]
-    stoch_d = stoch.iloc[:, 1]
+        df = df.rename(pandas_ta_col_converter, axis=1)
+        stoch = df.ta.stoch(k=k, d=d, smooth_k=smooth_k,
+                            mamode=mamode, offset=offset)
+        return stoch.iloc[:, 0], stoch.iloc[:, 1]
+
+    stoch_k, stoch_d = IndicatorEngine(df).stoch(
+        k=k, d=d, smooth_k=smooth_k, mamode=mamode, offset=offset)
 
     return stoch_k, stoch_d
 
@@ -98,8 +97,20 @@ def get_ma(df: pd.DataFrame, length: int = 30, offset: int = 0) -> pd.DataFrame:
         offset (int, optional): How many periods to offset the results. Defaults to 0.
     """
 
-    df = df.copy()
-    df = df.rename(pandas_ta_col_converter, axis=1)
-    ma = df.ta.sma(length=length, offset=offset)
+    ma = IndicatorEngine(df).sma(length=length, offset=offset)
 
     return ma
+
+
+def get_ema(df: pd.DataFrame, length: int = 10, offset: int = 0) -> pd.Series:
+    """Calculates an EMA, seeded by the SMA of its first period.
+
+    Args:
+        df (pd.DataFrame): Data.
+        length (int, optional): Its period. Defaults to 10.
+        offset (int, optional): How many periods to offset the results. Defaults to 0.
+    """
+
+    ema = IndicatorEngine(df).ema(length=length, offset=offset)
+
+    return ema
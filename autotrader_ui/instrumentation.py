@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""OANDA Request Instrumentation.
+
+Records the latency, payload size, status and retries of every OANDA v20
+request, per endpoint family (candles, instruments, pricing, order,
+account, transaction, position...), into the in-process metrics registry.
+
+``tpqoa`` sends all its requests through ``InstrumentedContext``, so no
+call site needs to change. The recorded metrics are:
+
+* ``oanda.requests``: counter per endpoint and status ('error' when no
+  response was received).
+* ``oanda.request_latency``: seconds until the response headers (and the
+  whole body for non-streaming requests), per endpoint.
+* ``oanda.response_bytes``: body size of non-streaming responses.
+* ``oanda.stream_bytes``: counter of the bytes received by streams.
+* ``oanda.retries``: counter per endpoint of the requests retried after
+  a rate limit response, or of the reconnections of a stream.
+* ``oanda.queue_wait``: seconds waited for the request scheduler, per
+  endpoint.
+
+Usage:
+    api = tpqoa("oanda.cfg")
+    api.get_history(...)
+    stats = request_stats()
+
+Todo:
+    * ...
+"""
+
+# Built-in modules
+import re
+import time
+
+# Third-party modules
+import pandas as pd
+import v20
+
+# Local modules
+from autotrader_ui.metrics import METRICS
+from autotrader_ui.request_scheduler import endpoint_priority, retry_delay
+
+ENDPOINT_PATTERNS = [
+    ("candles", re.compile(r"^/v3/instruments/[^/]+/candles")),
+    ("pricing_stream", re.compile(r"^/v3/accounts/[^/]+/pricing/stream")),
+    ("pricing", re.compile(r"^/v3/accounts/[^/]+/pricing")),
+    ("instruments", re.compile(r"^/v3/accounts/[^/]+/instruments")),
+    ("order", re.compile(r"^/v3/accounts/[^/]+/(orders|pendingOrders)")),
+    ("trade", re.compile(r"^/v3/accounts/[^/]+/(trades|openTrades)")),
+    ("position", re.compile(r"^/v3/accounts/[^/]+/(positions|openPositions)")),
+    ("transaction", re.compile(r"^/v3/accounts/[^/]+/transactions")),
+    ("account", re.compile(r"^/v3/accounts")),
+]
+
+
+def endpoint_family(path: str) -> str:
+    """Returns the endpoint family of a v20 request path, or 'other'."""
+    for family, pattern in ENDPOINT_PATTERNS:
+        if pattern.match(path):
+            return family
+    return "other"
+
+
+def record_request(endpoint: str, status, seconds: float, size: int = None,
+                   metrics=METRICS):
+    """Records one OANDA request.
+
+    Args:
+        endpoint (str): Endpoint family, see ``endpoint_family``.
+        status (int, str): HTTP status, or 'error' if no response was received.
+        seconds (float): Request latency.
+        size (int, optional): Response body size, in bytes. Defaults to None (unknown).
+        metrics (MetricsRegistry, optional): Registry. Defaults to the process-wide one.
+    """
+    metrics.counter("oanda.requests", endpoint=endpoint,
+                    status=str(status)).inc()
+    metrics.histogram("oanda.request_latency",
+                      endpoint=endpoint).observe(seconds)
+    if size is not None:
+        metrics.histogram("oanda.response_bytes",
+                          endpoint=endpoint).observe(size)
+
+
+def record_queue_wait(endpoint: str, seconds: float, metrics=METRICS):
+    """Records the time a request waited for the request scheduler."""
+    metrics.histogram("oanda.queue_wait", endpoint=endpoint).observe(seconds)
+
+
+def record_retry(endpoint: str, metrics=METRICS):
+    """Records the retry of a request to an endpoint family."""
+    metrics.counter("oanda.retries", endpoint=endpoint).inc()
+
+
+class InstrumentedContext(v20.Context):
+    """v20 context recording every request it sends.
+
+    With a scheduler, non-streaming requests first wait for their turn in
+    the endpoint's priority lane, and rate limited requests are retried
+    after the delay advertised by OANDA instead of being returned.
+
+    Args:
+        metrics (MetricsRegistry, optional): Registry receiving the request
+            metrics. Defaults to the process-wide registry.
+        scheduler (RequestScheduler, optional): Scheduler shared by the
+            clients of the same token. Defaults to None (no scheduling).
+        *args, **kwargs: ``v20.Context`` arguments.
+    """
+
+    def __init__(self, *args, metrics=METRICS, scheduler=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = metrics
+        self.scheduler = scheduler
+
+    def request(self, request):
+        if self.scheduler is None or request.stream:
+            return self._send(request)
+
+        endpoint = endpoint_family(request.path)
+        priority = endpoint_priority(endpoint)
+        attempt = 0
+        while True:
+            waited = self.scheduler.acquire(priority)
+            record_queue_wait(endpoint, waited, self.metrics)
+            response = self._send(request)
+            delay = retry_delay(response.status, response.headers, attempt)
+            if delay is None:
+                return response
+            self.scheduler.pause(delay)
+            self.record_retry(endpoint)
+            attempt += 1
+
+    def _send(self, request):
+        endpoint = endpoint_family(request.path)
+        start = time.perf_counter()
+        try:
+            response = super().request(request)
+        except Exception:
+            record_request(endpoint, "error", time.perf_counter() - start,
+                           metrics=self.metrics)
+            raise
+        seconds = time.perf_counter() - start
+
+        if request.stream:
+            record_request(endpoint, response.status, seconds,
+                           metrics=self.metrics)
+            response.set_lines(self._count_bytes(endpoint, response.lines))
+        else:
+            size = len(response.raw_body or "")
+            record_request(endpoint, response.status, seconds, size,
+                           metrics=self.metrics)
+        return response
+
+    def _count_bytes(self, endpoint: str, lines):
+        counter = self.metrics.counter("oanda.stream_bytes",
+                                       endpoint=endpoint)
+        for line in lines:
+            counter.inc(len(line))
+            yield line
+
+    def record_retry(self, endpoint: str):
+        """Records the retry of a request to an endpoint family."""
+        record_retry(endpoint, self.metrics)
+
+
+def request_stats(metrics=METRICS) -> pd.DataFrame:
+    """Summarizes the recorded OANDA requests per endpoint family.
+
+    Args:
+        metrics (MetricsRegistry, optional): Registry. Defaults to the process-wide one.
+
+    Returns:
+        pd.DataFrame: Requests, errors (status >= 400 or no response),
+        retries, total and p50/p90/p99 latency (ms), total scheduler wait
+        (s) and mean response size (bytes), indexed by endpoint.
+    """
+    stats = {}
+
+    def endpoint_stats(endpoint: str) -> dict:
+        return stats.setdefault(endpoint, {
+            "requests": 0, "errors": 0, "retries": 0, "total_s": 0.,
+            "p50_ms": None, "p90_ms": None, "p99_ms": None, "queue_s": 0.,
+            "mean_bytes": None, "stream_bytes": 0})
+
+    for row in metrics.snapshot("oanda."):
+        endpoint = endpoint_stats(row["endpoint"])
+        name = row["name"]
+        if name == "oanda.requests":
+            endpoint["requests"] += row["count"]
+            if row["status"] == "error" or int(row["status"]) >= 400:
+                endpoint["errors"] += row["count"]
+        elif name == "oanda.retries":
+            endpoint["retries"] += row["count"]
+        elif name == "oanda.stream_bytes":
+            endpoint["stream_bytes"] += row["count"]
+        elif name == "oanda.queue_wait" and row["count"] > 0:
+            endpoint["queue_s"] = row["sum"]
+        elif name == "oanda.response_bytes" and row["count"] > 0:
+            endpoint["mean_bytes"] = row["mean"]
+        elif name == "oanda.request_latency" and row["count"] > 0:
+            endpoint["total_s"] = row["sum"]
+            for q in ("p50", "p90", "p99"):
+                endpoint[f"{q}_ms"] = row[q] * 1e3
+
+    data = pd.DataFrame.from_dict(stats, orient="index")
+    if len(data) == 0:
+        return data
+    data.index.name = "endpoint"
+    return data.sort_values("total_s", ascending=False)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""In-Process Metrics.
+
+Thread-safe counters and histograms, grouped in a registry that can be
+snapshotted into a table.
+
+Usage:
+    METRICS.counter("stream.ticks", instrument="EUR_USD").inc()
+    METRICS.histogram("stream.tick_latency").observe(0.012)
+    table = pd.DataFrame(METRICS.snapshot())
+
+Todo:
+    * ...
+"""
+
+# Built-in modules
+import bisect
+import math
+import threading
+
+# Third-party modules
+
+# Local modules
+
+HISTOGRAM_MIN = 1e-6
+HISTOGRAM_MAX = 1e6
+HISTOGRAM_GROWTH = 1.1  # Relative error of the quantiles
+
+
+def _histogram_bounds() -> list:
+    n = math.ceil(math.log(HISTOGRAM_MAX / HISTOGRAM_MIN) /
+                  math.log(HISTOGRAM_GROWTH))
+    return [HISTOGRAM_MIN * HISTOGRAM_GROWTH ** i for i in range(n + 1)]
+
+
+HISTOGRAM_BOUNDS = _histogram_bounds()
+
+
+class Counter(object):
+    """Monotonic counter."""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n: int = 1):
+        """Increments the counter by n."""
+        with self._lock:
+            self.value += n
+
+    def snapshot(self) -> dict:
+        """Returns the current value."""
+        return {"count": self.value}
+
+
+class Histogram(object):
+    """Distribution of observed values, with log-scaled buckets.
+
+    Quantiles are estimated from the buckets, within 10% of the true value,
+    in constant memory whatever the number of observations.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.
+        self.min = math.inf
+        self.max = -math.inf
+        self._buckets = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        """Records one value."""
+        i = bisect.bisect_left(HISTOGRAM_BOUNDS, value)
+        with self._lock:
+            self._buckets[i] += 1
+            self.count += 1
+            self.sum += value
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Returns the estimated q-quantile, 0 <= q <= 1, or NaN if empty."""
+        with self._lock:
+            if self.count == 0:
+                return math.nan
+            rank = q * self.count
+            seen = 0
+            for i, n in enumerate(self._buckets):
+                seen += n
+                if seen >= rank and n > 0:
+                    bound = HISTOGRAM_BOUNDS[min(i, len(HISTOGRAM_BOUNDS) - 1)]
+                    return min(max(bound, self.min), self.max)
+            return self.max
+
+    def snapshot(self) -> dict:
+        """Returns count, sum, mean, min, max and p50/p90/p99."""
+        if self.count == 0:
+            return {"count": 0}
+        return {"count": self.count, "sum": self.sum,
+                "mean": self.sum / self.count, "min": self.min,
+                "max": self.max, "p50": self.quantile(0.5),
+                "p90": self.quantile(0.9), "p99": self.quantile(0.99)}
+
+
+class MetricsRegistry(object):
+    """Named, labelled counters and histograms, created on first use."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, labels: dict):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = self._metrics[key] = cls()
+            return metric
+
+    def counter(self, name: str, **labels) -> Counter:
+        """Returns the counter for a name and labels."""
+        return self._get(Counter, name, labels)
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        """Returns the histogram for a name and labels."""
+        return self._get(Histogram, name, labels)
+
+    def snapshot(self, prefix: str = "") -> list:
+        """Returns one row per metric whose name starts with prefix.
+
+        Args:
+            prefix (str, optional): Name prefix, e.g. 'stream.'. Defaults to "".
+
+        Returns:
+            list: Dictionaries with name, type, labels and values.
+        """
+        with self._lock:
+            items = sorted(self._metrics.items(), key=lambda kv: kv[0])
+        rows = []
+        for (name, labels), metric in items:
+            if not name.startswith(prefix):
+                continue
+            row = {"name": name, "type": type(metric).__name__.lower()}
+            row.update(labels)
+            row.update(metric.snapshot())
+            rows.append(row)
+        return rows
+
+    def reset(self):
+        """Removes all the metrics."""
+        with self._lock:
+            self._metrics.clear()
+
+
+METRICS = MetricsRegistry()
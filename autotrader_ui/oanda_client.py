@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Shared OANDA Client.
+
+Process-wide tpqoa clients and instrument list cache, shared by every
+Streamlit session so that reruns do not rebuild v20 contexts or refetch
+the instruments.
+
+The shared clients are meant for REST requests only. Streaming keeps
+mutable state on the client (``stop_stream``, ``ticks``...), so every
+stream gets its own client from ``new_stream_client``.
+
+Todo:
+    * ...
+"""
+
+# Built-in modules
+import threading
+import time
+
+# Third-party modules
+
+# Local modules
+from autotrader_ui.tpqoa import tpqoa
+
+INSTRUMENTS_TTL = 3600  # seconds
+
+_clients = {}
+_instrument_caches = {}
+_lock = threading.Lock()
+
+
+def get_oanda_client(config: str = "oanda.cfg") -> tpqoa:
+    """Returns the process-wide client for a configuration file.
+
+    The client is created on first use, under a lock, so that concurrent
+    sessions never build two clients for the same file. Its v20 contexts
+    keep their HTTP connections alive, and are safe to share between
+    threads for REST requests. Do not stream with it, see
+    ``new_stream_client``.
+
+    Args:
+        config (str, optional): OANDA configuration file. Defaults to "oanda.cfg".
+
+    Returns:
+        tpqoa: Shared client.
+    """
+    with _lock:
+        if config not in _clients:
+            _clients[config] = tpqoa(config, raw_decoding=True)
+        return _clients[config]
+
+
+def new_stream_client(config: str = "oanda.cfg") -> tpqoa:
+    """Returns a new client, owned by one price stream.
+
+    ``tpqoa.stream_data`` and ``StreamMultiplexer`` keep their stream state
+    on the client, which therefore cannot be shared. REST requests of the
+    new client still go through the scheduler of its token.
+
+    Args:
+        config (str, optional): OANDA configuration file. Defaults to "oanda.cfg".
+
+    Returns:
+        tpqoa: Client not shared with anyone else.
+    """
+    return tpqoa(config, raw_decoding=True)
+
+
+class InstrumentCache(object):
+    """Instrument list of an account, refreshed in the background.
+
+    The first call fetches the instruments synchronously. Afterwards, the
+    cached list is always returned immediately, and a background refresh
+    is started once it is older than the TTL.
+    """
+
+    def __init__(self, config: str = "oanda.cfg",
+                 ttl: float = INSTRUMENTS_TTL):
+        self.config = config
+        self.ttl = ttl
+        self._instruments = None
+        self._fetched_at = 0.
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def _fetch(self):
+        instruments = get_oanda_client(self.config).get_instruments()
+        with self._lock:
+            self._instruments = instruments
+            self._fetched_at = time.monotonic()
+
+    def _refresh(self):
+        try:
+            self._fetch()
+        except Exception:
+            # Keep serving the previous list, retry on a later call
+            pass
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def get(self) -> list:
+        """Returns the cached (displayName, name) instrument pairs.
+
+        Returns:
+            list: Sorted list of (displayName, name) tuples.
+        """
+        with self._lock:
+            instruments = self._instruments
+            expired = time.monotonic() - self._fetched_at > self.ttl
+            start_refresh = (instruments is not None and expired
+                             and not self._refreshing)
+            if start_refresh:
+                self._refreshing = True
+
+        if instruments is None:
+            self._fetch()
+            return self._instruments
+        if start_refresh:
+            threading.Thread(target=self._refresh, daemon=True).start()
+        return instruments
+
+
+def get_instrument_cache(config: str = "oanda.cfg") -> InstrumentCache:
+    """Returns the process-wide instrument cache for a configuration file.
+
+    Args:
+        config (str, optional): OANDA configuration file. Defaults to "oanda.cfg".
+
+    Returns:
+        InstrumentCache: Shared instrument cache.
+    """
+    with _lock:
+        if config not in _instrument_caches:
+            _instrument_caches[config] = InstrumentCache(config)
+        return _instrument_caches[config]
@@ -0,0 +1,515 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Offline OANDA v20 Stand-In Server.
+
+Local HTTP server answering the v20 endpoints used by ``tpqoa`` with
+synthetic (or recorded) data, with configurable latency, jitter, rate
+limits and failures. Point a client at it with these ``[oanda]`` entries
+in its configuration file::
+
+    hostname = 127.0.0.1
+    stream_hostname = 127.0.0.1
+    port = 8080
+    ssl = false
+
+Usage:
+    python -m autotrader_ui.oanda_standin --port 8080 --latency 0.05
+
+Todo:
+    * ...
+"""
+
+# Built-in modules
+import argparse
+import json
+import multiprocessing
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Third-party modules
+import numpy as np
+import pandas as pd
+
+# Local modules
+from autotrader_ui.ticks import granularity_to_ns
+from autotrader_ui.tpqoa import MAX_REQUEST_COUNT, PRICE_COMPONENTS
+
+RFC3339_FORMAT = "%Y-%m-%dT%H:%M:%S.%f000Z"
+HEARTBEAT_INTERVAL = 5.  # seconds
+SPREAD = 2e-4
+INSTRUMENTS = ["AUD_USD", "EUR_GBP", "EUR_JPY", "EUR_USD", "GBP_USD",
+               "NZD_USD", "USD_CAD", "USD_CHF", "USD_JPY", "XAU_USD"]
+
+
+def format_time(time_ns) -> str:
+    """Formats nanoseconds since epoch as an RFC3339 time."""
+    return pd.Timestamp(int(time_ns)).strftime(RFC3339_FORMAT)
+
+
+def parse_time(value: str) -> int:
+    """Parses an RFC3339 or UNIX time to nanoseconds since epoch."""
+    try:
+        return int(float(value) * 1e9)
+    except ValueError:
+        ts = pd.Timestamp(value)
+        if ts.tzinfo is not None:
+            ts = ts.tz_convert("UTC").tz_localize(None)
+        return ts.value
+
+
+def synthetic_mid(instrument: str, time_ns: np.ndarray) -> np.ndarray:
+    """Deterministic synthetic mid prices of an instrument.
+
+    The same instrument and time always give the same price, so that
+    overlapping requests and repeated runs see consistent data.
+    """
+    base = 1 + (sum(map(ord, instrument)) % 100) / 10
+    t = np.asarray(time_ns, dtype=np.int64) // 10**9
+    noise = ((t * 2654435761) % 10007) / 10007 - .5
+    return base * (1 + 1e-2 * np.sin(t / 3600.) + 1e-4 * noise)
+
+
+def synthetic_candles(instrument: str, start_ns: int, end_ns: int,
+                      granularity: str, price: str) -> list:
+    """Generates the candles of [start, end), as sent by the v20 API.
+
+    Args:
+        instrument (str): Instrument name.
+        start_ns (int): Start time, nanoseconds since epoch.
+        end_ns (int): End time, nanoseconds since epoch.
+        granularity (str): A string like 'S5', 'M1' or 'H1'.
+        price (str): Price components, any of 'A', 'B' and 'M'.
+
+    Returns:
+        list: Candle dictionaries.
+    """
+    period = granularity_to_ns(granularity)
+    first = -(-start_ns // period) * period
+    times = np.arange(first, end_ns, period, dtype=np.int64)
+    times = times[:int(MAX_REQUEST_COUNT)]
+    now_ns = time.time_ns()
+
+    quarters = [synthetic_mid(instrument, times + period * k // 4)
+                for k in range(5)]
+    mid = {"o": quarters[0], "c": quarters[4],
+           "h": np.max(quarters, axis=0), "l": np.min(quarters, axis=0)}
+    offsets = {"M": 0., "B": -SPREAD / 2, "A": SPREAD / 2}
+
+    # Format whole columns at once, the server must not be the bottleneck
+    time_strs = np.char.add(
+        np.datetime_as_string(times.astype("datetime64[ns]")), "Z").tolist()
+    complete = (times + period <= now_ns).tolist()
+    volume = (10 + times // period % 90).tolist()
+    components = {
+        PRICE_COMPONENTS[component]: {
+            key: [f"{v:.5f}" for v in (values + offsets[component]).tolist()]
+            for key, values in mid.items()}
+        for component in price}
+
+    candles = []
+    for i in range(len(times)):
+        candle = {"complete": complete[i], "volume": volume[i],
+                  "time": time_strs[i]}
+        for name, values in components.items():
+            candle[name] = {key: column[i] for key, column in values.items()}
+        candles.append(candle)
+    return candles
+
+
+class StandinConfig(object):
+    """Behaviour of the stand-in server.
+
+    Args:
+        latency (float, optional): Delay added to every response, in seconds. Defaults to 0.
+        jitter (float, optional): Maximum random deviation of the delay, in seconds. Defaults to 0.
+        rate_limit (float, optional): Requests accepted per second before
+            answering 429 with a Retry-After header. Defaults to None (unlimited).
+        failure_rate (float, optional): Probability of answering 503. Defaults to 0.
+        tick_interval (float, optional): Seconds between two streamed price
+            updates of an instrument. Defaults to 0.25.
+        store (CandleStore, optional): Recorded candles served instead of
+            synthetic ones, where available. Defaults to None.
+        seed (int, optional): Seed of the latency and failure draws. Defaults to None.
+    """
+
+    def __init__(self, latency: float = 0., jitter: float = 0.,
+                 rate_limit: float = None, failure_rate: float = 0.,
+                 tick_interval: float = .25, store=None, seed: int = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.failure_rate = failure_rate
+        self.tick_interval = tick_interval
+        self.store = store
+        self.random = random.Random(seed)
+
+
+class StandinState(object):
+    """Account state shared by the request handlers."""
+
+    def __init__(self, config: StandinConfig):
+        self.config = config
+        self.lock = threading.Lock()
+        self.transactions = []
+        self.positions = {}
+        self.requests = 0
+        self._tokens = config.rate_limit or 0.
+        self._updated_at = time.monotonic()
+
+    def take_token(self) -> float:
+        """Returns 0 if a request is accepted, else seconds to wait."""
+        rate = self.config.rate_limit
+        if rate is None:
+            return 0.
+        with self.lock:
+            now = time.monotonic()
+            self._tokens = min(rate, self._tokens +
+                               (now - self._updated_at) * rate)
+            self._updated_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.
+            return (1 - self._tokens) / rate
+
+    def add_transaction(self, transaction: dict) -> dict:
+        """Assigns the next ID and time to a transaction and stores it."""
+        with self.lock:
+            transaction["id"] = str(len(self.transactions) + 1)
+            transaction["time"] = format_time(time.time_ns())
+            self.transactions.append(transaction)
+        return transaction
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """Answers the v20 endpoints used by tpqoa."""
+
+    protocol_version = "HTTP/1.1"
+    state = None  # StandinState, set by StandinServer
+
+    routes = [
+        ("GET", r"/v3/instruments/(?P<instrument>[^/]+)/candles$",
+         "candles"),
+        ("GET", r"/v3/accounts/(?P<account>[^/]+)/instruments$",
+         "instruments"),
+        ("GET", r"/v3/accounts/(?P<account>[^/]+)/pricing$", "pricing"),
+        ("GET", r"/v3/accounts/(?P<account>[^/]+)/pricing/stream$",
+         "pricing_stream"),
+        ("POST", r"/v3/accounts/(?P<account>[^/]+)/orders$", "orders"),
+        ("GET", r"/v3/accounts/(?P<account>[^/]+)/openPositions$",
+         "positions"),
+        ("GET", r"/v3/accounts/(?P<account>[^/]+)/transactions/sinceid$",
+         "transactions_since"),
+        ("GET", r"/v3/accounts/(?P<account>[^/]+)/transactions/(?P<tid>\d+)$",
+         "transaction"),
+        ("GET", r"/v3/accounts/(?P<account>[^/]+)(/summary)?$", "account"),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self, method: str):
+        state = self.state
+        config = state.config
+        with state.lock:
+            state.requests += 1
+
+        url = urlparse(self.path)
+        self.params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        self.body = json.loads(self.rfile.read(length)) if length else {}
+
+        wait = state.take_token()
+        if wait > 0:
+            self._send_json(429, {"errorMessage": "Rate limit exceeded"},
+                            {"Retry-After": f"{wait:.3f}"})
+            return
+        delay = config.latency + config.random.uniform(-config.jitter,
+                                                       config.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if config.random.random() < config.failure_rate:
+            self._send_json(503, {"errorMessage": "Service unavailable"})
+            return
+
+        for route_method, pattern, name in self.routes:
+            match = re.match(pattern, url.path)
+            if route_method == method and match:
+                getattr(self, "_" + name)(**{
+                    k: v for k, v in match.groupdict().items()
+                    if k in ("instrument", "tid")})
+                return
+        self._send_json(404, {"errorMessage": f"No route for {url.path}"})
+
+    def _candles(self, instrument: str):
+        granularity = self.params.get("granularity", "S5")
+        price = self.params.get("price", "M")
+        period = granularity_to_ns(granularity)
+        if "from" in self.params:
+            start = parse_time(self.params["from"])
+            end = parse_time(self.params["to"]) if "to" in self.params \
+                else start + period * int(self.params.get("count", 500))
+        else:
+            end = parse_time(self.params["to"]) if "to" in self.params \
+                else time.time_ns()
+            start = end - period * int(self.params.get("count", 500))
+        if (end - start) // period > MAX_REQUEST_COUNT:
+            self._send_json(400, {"errorMessage":
+                                  "Maximum value for 'count' exceeded"})
+            return
+
+        store = self.state.config.store
+        candles = None
+        if store is not None and len(price) == 1:
+            start_ts, end_ts = pd.Timestamp(start), pd.Timestamp(end)
+            if len(store.missing_intervals(instrument, start_ts, end_ts,
+                                           granularity, price)) == 0:
+                data = store.load(instrument, start_ts, end_ts, granularity,
+                                  price)
+                candles = [{"complete": bool(row.complete),
+                            "volume": int(row.volume),
+                            "time": format_time(t.value),
+                            PRICE_COMPONENTS[price]: {
+                                k: f"{getattr(row, k):.5f}" for k in "ohlc"}}
+                           for t, row in zip(data.index,
+                                             data.itertuples())]
+        if candles is None:
+            candles = synthetic_candles(instrument, start, end, granularity,
+                                        price)
+        self._send_json(200, {"instrument": instrument,
+                              "granularity": granularity,
+                              "candles": candles})
+
+    def _instruments(self):
+        instruments = [{"name": name, "type": "CFD",
+                        "displayName": name.replace("_", "/")}
+                       for name in INSTRUMENTS]
+        self._send_json(200, {"instruments": instruments,
+                              "lastTransactionID": "0"})
+
+    def _price(self, instrument: str, now_ns: int) -> dict:
+        mid = float(synthetic_mid(instrument, [now_ns])[0])
+        bid, ask = f"{mid - SPREAD / 2:.5f}", f"{mid + SPREAD / 2:.5f}"
+        return {"type": "PRICE", "instrument": instrument,
+                "time": format_time(now_ns), "tradeable": True,
+                "bids": [{"price": bid, "liquidity": 1000000}],
+                "asks": [{"price": ask, "liquidity": 1000000}],
+                "closeoutBid": bid, "closeoutAsk": ask}
+
+    def _pricing(self):
+        now_ns = time.time_ns()
+        instruments = self.params.get("instruments", "").split(",")
+        self._send_json(200, {
+            "time": format_time(now_ns),
+            "prices": [self._price(i, now_ns) for i in instruments if i]})
+
+    def _pricing_stream(self):
+        instruments = self.params.get("instruments", "").split(",")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        interval = self.state.config.tick_interval
+        last_heartbeat = time.monotonic()
+        try:
+            while True:
+                now_ns = time.time_ns()
+                lines = [self._price(i, now_ns) for i in instruments if i]
+                if time.monotonic() - last_heartbeat >= HEARTBEAT_INTERVAL:
+                    lines.append({"type": "HEARTBEAT",
+                                  "time": format_time(now_ns)})
+                    last_heartbeat = time.monotonic()
+                chunk = "".join(json.dumps(line) + "\n"
+                                for line in lines).encode()
+                self.wfile.write(f"{len(chunk):X}\r\n".encode() + chunk +
+                                 b"\r\n")
+                self.wfile.flush()
+                time.sleep(interval)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def _orders(self):
+        state = self.state
+        order = self.body.get("order", {})
+        instrument = order.get("instrument")
+        units = float(order.get("units", 0))
+        order_type = order.get("type", "MARKET")
+
+        client_ext = order.get("clientExtensions")
+        create = {"type": order_type + "_ORDER", "instrument": instrument,
+                  "units": order.get("units"), "reason": "CLIENT_ORDER"}
+        if client_ext:
+            create["clientExtensions"] = client_ext
+        create = state.add_transaction(create)
+        body = {"orderCreateTransaction": create,
+                "relatedTransactionIDs": [create["id"]]}
+        if order_type == "MARKET":
+            now_ns = time.time_ns()
+            price = self._price(instrument, now_ns)
+            fill_price = price["asks" if units > 0 else "bids"][0]["price"]
+            fill = {"type": "ORDER_FILL", "orderID": create["id"],
+                    "instrument": instrument, "units": order.get("units"),
+                    "price": fill_price, "pl": "0.0000",
+                    "reason": "MARKET_ORDER"}
+            if client_ext and "id" in client_ext:
+                fill["clientOrderID"] = client_ext["id"]
+            fill = state.add_transaction(fill)
+            with state.lock:
+                state.positions[instrument] = \
+                    state.positions.get(instrument, 0.) + units
+            body["orderFillTransaction"] = fill
+            body["relatedTransactionIDs"].append(fill["id"])
+        body["lastTransactionID"] = state.transactions[-1]["id"]
+        self._send_json(201, body)
+
+    def _positions(self):
+        positions = []
+        with self.state.lock:
+            items = list(self.state.positions.items())
+        for instrument, units in items:
+            if units == 0:
+                continue
+            positions.append({
+                "instrument": instrument, "pl": "0.0000",
+                "unrealizedPL": "0.0000",
+                "long": {"units": str(max(units, 0.)), "pl": "0.0000"},
+                "short": {"units": str(min(units, 0.)), "pl": "0.0000"}})
+        self._send_json(200, {"positions": positions,
+                              "lastTransactionID": str(
+                                  len(self.state.transactions))})
+
+    def _transactions_since(self):
+        since = int(self.params.get("id", 0))
+        with self.state.lock:
+            transactions = self.state.transactions[since:since + 1000]
+            last_id = str(len(self.state.transactions))
+        self._send_json(200, {"transactions": transactions,
+                              "lastTransactionID": last_id})
+
+    def _transaction(self, tid: str):
+        with self.state.lock:
+            transactions = self.state.transactions
+            found = 0 < int(tid) <= len(transactions)
+            transaction = transactions[int(tid) - 1] if found else None
+        if transaction is None:
+            self._send_json(404, {"errorMessage": "Transaction not found"})
+        else:
+            self._send_json(200, {"transaction": transaction,
+                                  "lastTransactionID": str(
+                                      len(self.state.transactions))})
+
+    def _account(self):
+        with self.state.lock:
+            last_id = str(len(self.state.transactions))
+        self._send_json(200, {"account": {
+            "id": "000-000-0000000-000", "currency": "USD",
+            "balance": "100000.0000", "NAV": "100000.0000",
+            "lastTransactionID": last_id}, "lastTransactionID": last_id})
+
+
+class StandinServer(object):
+    """Runs the stand-in in a background thread or process.
+
+    Args:
+        host (str, optional): Listening address. Defaults to "127.0.0.1".
+        port (int, optional): Listening port, 0 for any free one. Defaults to 0.
+        config (StandinConfig, optional): Server behaviour. Defaults to None (no latency, no failures).
+        process (bool, optional): Serve from a forked process, so that the
+            server does not compete with the measured client for the GIL
+            (POSIX only). Defaults to False.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 config: StandinConfig = None, process: bool = False):
+        self.state = StandinState(config or StandinConfig())
+        handler = type("Handler", (StandinHandler,), {"state": self.state})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.process = process
+        self._runner = None
+
+    @property
+    def host(self) -> str:
+        return self.httpd.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def write_config(self, path: str, account_id: str = "000-000-0000000-000"):
+        """Writes a tpqoa configuration file pointing at the server."""
+        with open(path, "w") as f:
+            f.write("[oanda]\n"
+                    f"account_id = {account_id}\n"
+                    "access_token = standin\n"
+                    "account_type = practice\n"
+                    f"hostname = {self.host}\n"
+                    f"stream_hostname = {self.host}\n"
+                    f"port = {self.port}\n"
+                    "ssl = false\n")
+        return path
+
+    def start(self):
+        """Starts serving in a daemon thread or process."""
+        if self.process:
+            # The listening socket is inherited by the forked child
+            self._runner = multiprocessing.get_context("fork").Process(
+                target=self.httpd.serve_forever, daemon=True)
+        else:
+            self._runner = threading.Thread(target=self.httpd.serve_forever,
+                                            daemon=True)
+        self._runner.start()
+        return self
+
+    def stop(self):
+        """Stops serving."""
+        if self.process:
+            self._runner.terminate()
+            self._runner.join()
+        else:
+            self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.)
+    parser.add_argument("--jitter", type=float, default=0.)
+    parser.add_argument("--rate-limit", type=float, default=None)
+    parser.add_argument("--failure-rate", type=float, default=0.)
+    args = parser.parse_args()
+
+    server = StandinServer(args.host, args.port, StandinConfig(
+        latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit,
+        failure_rate=args.failure_rate))
+    print(f"Serving OANDA v20 stand-in on {server.host}:{server.port}")
+    server.httpd.serve_forever()
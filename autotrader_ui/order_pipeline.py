@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Low-Latency Order Pipeline.
+
+Submits orders concurrently from a pool of threads sharing the client's
+warm keep-alive connection, without printing on the hot path, and records
+where the time between the signal and the fill goes:
+
+* ``order.queue_wait``: from ``submit`` until a worker sends the request.
+* ``order.round_trip``: HTTP round trip of the order request.
+* ``order.submit_to_fill``: from ``submit`` until the fill time reported by
+  OANDA in ``orderFillTransaction`` (wall clocks, so it includes the clock
+  offset between this host and OANDA).
+* ``order.status``: counter per instrument and outcome.
+
+Every order carries a client-side ID, so that its transactions can be
+matched even when the response is lost.
+
+Usage:
+    with OrderPipeline(get_oanda_client()) as pipeline:
+        future = pipeline.submit("EUR_USD", 100)
+        result = future.result()
+
+Todo:
+    * ...
+"""
+
+# Built-in modules
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Third-party modules
+import pandas as pd
+
+# Local modules
+from autotrader_ui.metrics import METRICS
+from autotrader_ui.ticks import time_to_ns
+
+MAX_WORKERS = 4  # Below the 10 pooled connections of a v20 context
+CLIENT_ID_PREFIX = "at"
+
+
+def new_client_id(prefix: str = CLIENT_ID_PREFIX) -> str:
+    """Returns a unique client-side order ID."""
+    return f"{prefix}-{uuid.uuid4().hex}"
+
+
+class OrderPipeline(object):
+    """Concurrent order submission with a timing breakdown.
+
+    Args:
+        api (tpqoa): Client sending the orders.
+        max_workers (int, optional): Orders sent concurrently. Defaults to 4.
+        warm (bool, optional): Open the client's connection on creation, so
+            that the first order does not pay for the TCP and TLS
+            handshakes. Defaults to True.
+        metrics (MetricsRegistry, optional): Registry receiving the order
+            metrics. Defaults to the process-wide registry.
+    """
+
+    def __init__(self, api, max_workers: int = MAX_WORKERS,
+                 warm: bool = True, metrics=METRICS):
+        self.api = api
+        self.metrics = metrics
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="order")
+        if warm:
+            self.warm_up()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self, wait: bool = True):
+        """Stops accepting orders, waiting for the pending ones by default."""
+        self._executor.shutdown(wait=wait)
+
+    def warm_up(self):
+        """Opens (or refreshes) the keep-alive connection used by orders."""
+        self.api.ctx.account.summary(self.api.account_id)
+
+    def submit(self, instrument: str, units: int, client_id: str = None,
+               **order_kwargs) -> Future:
+        """Queues an order.
+
+        Args:
+            instrument (str): Valid instrument name.
+            units (int): Units to buy (positive) or sell (negative).
+            client_id (str, optional): Client-side order ID. Defaults to None (generated).
+            **order_kwargs: Other ``tpqoa.create_order`` arguments (price,
+                sl_distance, tsl_distance, tp_price, comment, touch).
+
+        Returns:
+            Future: Resolves to the order result, see ``_send``.
+        """
+        submitted_ns = time.time_ns()
+        submitted_at = time.perf_counter()
+        if client_id is None:
+            client_id = new_client_id()
+        return self._executor.submit(self._send, instrument, units, client_id,
+                                     submitted_ns, submitted_at, order_kwargs)
+
+    def submit_many(self, orders: list) -> list:
+        """Sends orders concurrently and waits for all of them.
+
+        Args:
+            orders (list): Dictionaries of ``submit`` arguments.
+
+        Returns:
+            list: Order results, in the order of the requests.
+        """
+        futures = [self.submit(**order) for order in orders]
+        return [future.result() for future in futures]
+
+    def _send(self, instrument: str, units: int, client_id: str,
+              submitted_ns: int, submitted_at: float,
+              order_kwargs: dict) -> dict:
+        """Sends one order and returns its result.
+
+        Returns:
+            dict: client_id, instrument, units, status (the transaction type,
+            e.g. 'ORDER_FILL' or 'MARKET_ORDER_REJECT'), transaction (dict),
+            submitted_at (UTC), queue_s, round_trip_s, fill_time (UTC, None
+            if not filled) and submit_to_fill_s.
+        """
+        sent_at = time.perf_counter()
+        response = self.api._submit_order(instrument, units,
+                                          client_id=client_id, **order_kwargs)
+        round_trip = time.perf_counter() - sent_at
+        queue_wait = sent_at - submitted_at
+
+        transaction = self.api.order_transaction(response)
+        transaction = transaction.dict() if transaction is not None else {}
+        status = transaction.get("type", f"HTTP_{response.status}")
+        fill_time = submit_to_fill = None
+        if "orderFillTransaction" in response.body:
+            fill_time = response.get("orderFillTransaction").time
+            submit_to_fill = (time_to_ns(fill_time) - submitted_ns) / 1e9
+
+        self.metrics.counter("order.status", instrument=instrument,
+                             status=status).inc()
+        self.metrics.histogram("order.queue_wait").observe(queue_wait)
+        self.metrics.histogram("order.round_trip").observe(round_trip)
+        if submit_to_fill is not None:
+            # Clock offsets can make it negative, the histogram needs > 0
+            self.metrics.histogram("order.submit_to_fill").observe(
+                max(submit_to_fill, 0.))
+
+        return {"client_id": client_id, "instrument": instrument,
+                "units": units, "status": status,
+                "transaction": transaction,
+                "submitted_at": pd.Timestamp(submitted_ns, tz="UTC"),
+                "queue_s": queue_wait, "round_trip_s": round_trip,
+                "fill_time": (pd.Timestamp(fill_time)
+                              if fill_time is not None else None),
+                "submit_to_fill_s": submit_to_fill}
@@ -4,20 +4,20 @@ import streamlit as st
 import traceback
 from autotrader_ui.db_utils import (
     connect_to_firebase_db_and_authenticate,
-    create_live
+    create_live,
+    get_collection_mirror
 )
+from autotrader_ui.data_utils import get_oanda_instruments
 from autotrader_ui.market_info import (
     MARKET_OPEN_HOURS,
     INSTRUMENT_MARKETS_DICT
 )
 
-from autotrader_ui.tpqoa import tpqoa
 
 st.header("🛰 Deployments")
 
 db = connect_to_firebase_db_and_authenticate(project_name="autotrader")
-oanda = tpqoa('oanda.cfg')
-indices_list = oanda.get_instruments()
+indices_list = get_oanda_instruments()
 clean_indices_list = [i for i in indices_list if i[1]
                       in INSTRUMENT_MARKETS_DICT.keys()]
 
@@ -136,3 +136,24 @@ if submitted:
         except:
             st.error("Error in deployment !")
             st.error(traceback.format_exc())
+
+st.header("Deployed Agents")
+
+MIRROR_READY_TIMEOUT = 5  # seconds
+
+# Kept up to date by a listener, reading it costs no query
+mirror = get_collection_mirror(db, "Live", ("status", "created_at"))
+if not mirror.wait_ready(MIRROR_READY_TIMEOUT):
+    st.info("Waiting for the deployed agents ...")
+    st.stop()
+all_lives = mirror.snapshot()
+df = pd.DataFrame({
+    "Agent Name": list(all_lives.keys()),
+    "Current Status": [v.get("status") for v in all_lives.values()],
+    "Created At (UTC)": [v.get("created_at") for v in all_lives.values()]
+}).sort_values("Created At (UTC)", ascending=False, ignore_index=True)
+
+if len(df) == 0:
+    st.write("There are currently no deployed agents.")
+else:
+    st.dataframe(df, use_container_width=True)
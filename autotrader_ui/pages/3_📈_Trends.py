@@ -4,19 +4,18 @@ import plotly.graph_objects as go
 import plotly.express as px
 import traceback
 
-from autotrader_ui.data_utils import get_oanda_data
-from autotrader_ui.tpqoa import tpqoa
+from autotrader_ui.data_utils import get_historical_data, get_oanda_instruments
 
 from autotrader_ui.market_info import (
     INSTRUMENT_MARKETS_DICT
 )
 
-@st.cache(hash_funcs={dict: lambda _: None})
+@st.cache_data()
 def plot_instrument_data(instrument, start_str, end_str, chart_type):
-    df = get_oanda_data(instrument=instrument,
-                        start=start_str,
-                        end=end_str,
-                        granularity='M1')
+    df = get_historical_data('oanda', {'instrument': instrument,
+                                       'start': start_str,
+                                       'end': end_str,
+                                       'granularity': 'M1'})
 
     if chart_type == "Candlestick":
         fig = go.Figure(data=[go.Candlestick(x=df.index,
@@ -45,8 +44,7 @@ def plot_instrument_data(instrument, start_str, end_str, chart_type):
 
 st.header("📈 Trends")
 
-oanda = tpqoa('oanda.cfg')
-indices_list = oanda.get_instruments()
+indices_list = get_oanda_instruments()
 clean_indices_list = [i for i in indices_list if i[1] in INSTRUMENT_MARKETS_DICT.keys()]
 
 with st.sidebar:
@@ -4,15 +4,15 @@ import streamlit as st
 import traceback
 from autotrader_ui.db_utils import (
     connect_to_firebase_db_and_authenticate,
-    create_backtest,
-    get_all_backtests
+    get_collection_mirror
 )
+from autotrader_ui.repositories import get_repositories
+from autotrader_ui.data_utils import get_oanda_instruments
 from autotrader_ui.market_info import (
     MARKET_OPEN_HOURS,
     INSTRUMENT_MARKETS_DICT
 )
 
-from autotrader_ui.tpqoa import tpqoa
 
 def get_def_config_values(dict_name, key, value):
     if dict_name in st.session_state.keys() and key in st.session_state[dict_name]:
@@ -24,8 +24,8 @@ def get_def_config_values(dict_name, key, value):
 
 st.title("🕟 Backtesting")
 db = connect_to_firebase_db_and_authenticate(project_name="autotrader")
-oanda = tpqoa('oanda.cfg')
-indices_list = oanda.get_instruments()
+backtests = get_repositories(db)["Backtest"]
+indices_list = get_oanda_instruments()
 clean_indices_list = [i for i in indices_list if i[1]
                       in INSTRUMENT_MARKETS_DICT.keys()]
 
@@ -152,7 +152,7 @@ if submitted:
                 "created_at": dt.datetime.utcnow().strftime(DT_STR_FORMAT)
             }
 
-            create_backtest(db, backtest_name=exp_name, data=data_dict)
+            backtests.create(exp_name, data_dict)
             st.success("Experiment successfuly submitted !")
 
         except:
@@ -161,22 +161,76 @@ if submitted:
 
 st.header("Pending Backtests")
 
-with st.spinner("Loading ..."):
-    all_backtests = get_all_backtests(db)
-    backtest_name = list(all_backtests.keys())
-    backtest_statuses = [v["status"] for v in all_backtests.values()]
-    backtest_times = [v["created_at"] for v in all_backtests.values()]
+BACKTESTS_PAGE_SIZE = 50
+BACKTESTS_SUMMARY_FIELDS = ["status", "created_at"]
+LIVE_UPDATES_INTERVAL = 5  # seconds
+MIRROR_READY_TIMEOUT = 5  # seconds
+
+
+def show_backtests(all_backtests: dict, more: bool = False):
     df = pd.DataFrame({
-        "Experiment Name": backtest_name,
-        "Current Status": backtest_statuses,
-        "Created At (UTC)": backtest_times
-    })
+        "Experiment Name": list(all_backtests.keys()),
+        "Current Status": [v.get("status") for v in all_backtests.values()],
+        "Created At (UTC)": [v.get("created_at")
+                             for v in all_backtests.values()]
+    }).sort_values("Created At (UTC)", ascending=False, ignore_index=True)
 
     if len(df) == 0:
         st.write("There are currently no pending backtests.")
     else:
-        st.write("There are currently ", len(df), " pending backtest(s).")
+        st.write("There are currently ", len(df), " pending backtest(s)" +
+                 (" shown." if more else "."))
     st.dataframe(df, use_container_width=True)
 
-    if st.button("Refresh Table"):
-        st.experimental_rerun()
+
+def list_backtests(start_after=None) -> tuple:
+    # Newest first, only the fields shown
+    return backtests.list(fields=BACKTESTS_SUMMARY_FIELDS,
+                          order_by="created_at", descending=True,
+                          limit=BACKTESTS_PAGE_SIZE, start_after=start_after)
+
+
+@st.fragment(run_every=LIVE_UPDATES_INTERVAL)
+def show_live_backtests():
+    # Kept up to date by a listener, reading it costs no query. Only used
+    # with live updates: listeners transfer whole documents
+    mirror = get_collection_mirror(db, "Backtest",
+                                   tuple(BACKTESTS_SUMMARY_FIELDS))
+    if not mirror.wait_ready(MIRROR_READY_TIMEOUT):
+        st.info("Waiting for the live backtests ...")
+        return
+    show_backtests(mirror.snapshot())
+
+
+_, col41, col42, _ = st.columns((1, 5, 5, 3))
+live_updates = col42.checkbox("Live updates", False)
+
+if live_updates:
+    show_live_backtests()
+    st.stop()
+
+# Pages already loaded in this session, newest backtests first
+if "backtests" not in st.session_state.keys() or submitted:
+    st.session_state["backtests"] = {}
+    st.session_state["backtests_cursor"] = None
+    st.session_state["backtests_loaded"] = False
+
+with st.spinner("Loading ..."):
+    if not st.session_state["backtests_loaded"]:
+        page, cursor = list_backtests()
+        st.session_state["backtests"] = page
+        st.session_state["backtests_cursor"] = cursor
+        st.session_state["backtests_loaded"] = True
+
+    show_backtests(st.session_state["backtests"],
+                   more=st.session_state["backtests_cursor"] is not None)
+
+    if col41.button("Refresh Table"):
+        st.session_state["backtests_loaded"] = False
+        st.rerun()
+    if st.session_state["backtests_cursor"] is not None \
+            and col41.button("Load More"):
+        page, cursor = list_backtests(st.session_state["backtests_cursor"])
+        st.session_state["backtests"].update(page)
+        st.session_state["backtests_cursor"] = cursor
+        st.rerun()
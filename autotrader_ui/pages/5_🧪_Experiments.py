@@ -6,35 +6,40 @@ import json
 import os
 import plotly.express as px
 import plotly.graph_objects as go
-from autotrader_ui.data_utils import get_oanda_data
-from autotrader_ui.tpqoa import tpqoa
+from autotrader_ui.data_utils import get_historical_data, get_oanda_instruments
 
 from autotrader_ui.market_info import INSTRUMENT_MARKETS_DICT
-from autotrader_ui.db_utils import (
-    connect_to_firebase_db_and_authenticate,
-    get_all_experiments,
-    get_all_experiments_name,
-    get_specific_experiment,
-    delete_experiment
-)
-
-@st.cache_resource()
+from autotrader_ui.db_utils import connect_to_firebase_db_and_authenticate
+from autotrader_ui.repositories import get_repositories
+
+# Not cached by Streamlit: the summary is a field-masked read, and the
+# transactions are served by the document cache while they are up to date
 def get_experiment_values(experiment_name):
 
     db = connect_to_firebase_db_and_authenticate(project_name="autotrader")
-    exp_dict = get_specific_experiment(db, experiment_name)
-    exp_values = exp_dict[experiment_name]
+    return get_repositories(db)["Experiment"].get_summary(experiment_name)
+
+def get_experiment_version(experiment_name):
+
+    db = connect_to_firebase_db_and_authenticate(project_name="autotrader")
+    return get_repositories(db)["Experiment"].version(experiment_name)
 
-    return exp_values
+def get_experiment_transaction_values(experiment_name):
+
+    db = connect_to_firebase_db_and_authenticate(project_name="autotrader")
+    return get_repositories(db)["Experiment"].get_transactions(
+        experiment_name)
 
 @st.cache_data()
-def generate_experiment_df(experiment_name: str, experiment_values: dict,
-                           start: str, end: str):
+def generate_experiment_df(experiment_name: str, instrument: str,
+                           start: str, end: str, version: str = None):
+    # version: of the experiment document, part of the cache key. It
+    # changes on every write, including legacy documents without chunks
 
-    df = get_oanda_data(instrument=instrument,
-                        start=start,
-                        end=end,
-                        granularity='M1')
+    df = get_historical_data('oanda', {'instrument': instrument,
+                                       'start': start,
+                                       'end': end,
+                                       'granularity': 'M1'})
 
     df = df[~df.index.duplicated(keep='first')].asfreq(
         "1T").interpolate(limit=5)
@@ -47,7 +52,7 @@ def generate_experiment_df(experiment_name: str, experiment_values: dict,
     df['positive_transaction'] = np.nan
     df['negative_transaction'] = np.nan
 
-    transactions = exp_values["transactions"]
+    transactions = get_experiment_transaction_values(experiment_name)
     for i in range(len(df)):
         idx = df.index[i]
         idx_str = idx.strftime(DICT_DT_STR_FORMAT)
@@ -120,8 +125,8 @@ DT_STR_FORMAT = "%Y-%m-%d %H:%M"
 DICT_DT_STR_FORMAT = "%Y-%m-%d %H:%M:%S"
 
 db = connect_to_firebase_db_and_authenticate(project_name="autotrader")
-oanda = tpqoa('oanda.cfg')
-indices_list = oanda.get_instruments()
+experiments = get_repositories(db)["Experiment"]
+indices_list = get_oanda_instruments()
 clean_indices_list = [i for i in indices_list if i[1]
                       in INSTRUMENT_MARKETS_DICT.keys()]
 
@@ -138,11 +143,16 @@ with st.sidebar:
         "Default instrument", clean_indices_list, index=instrument_idx)[1]
 
 col00, _, _ = st.columns((2, 1, 1))
-experiments_list = get_all_experiments_name(db)
+experiments_list = experiments.names()
 experiment_name = col00.selectbox("Select experiment", experiments_list)
 if col00.button("Delete Experiment"):
-    delete_experiment(db, experiment_name=experiment_name)
-    st.experimental_rerun()
+    experiments.delete(experiment_name)
+    st.rerun()
+with col00.expander("Bulk delete"):
+    to_delete = st.multiselect("Experiments to delete", experiments_list)
+    if st.button("Delete Selected") and len(to_delete) > 0:
+        experiments.bulk_delete(to_delete)
+        st.rerun()
 exp_values = get_experiment_values(experiment_name=experiment_name)
 
 
@@ -156,19 +166,12 @@ else:
     end = exp_values['end']
     instrument = exp_values["execution"]["instrument"]
 
-    df = generate_experiment_df(experiment_name=experiment_name,
-                                experiment_values=exp_values,
-                                start=start, end=end)
-
     final_capital = exp_values["execution"]["final_capital"]
     initial_capital = exp_values["execution"]["initial_capital"]
     initial_stocks = exp_values["execution"]["initial_stocks"]
     final_stocks = exp_values["execution"]["final_stocks"]
     final_bid_price = exp_values["execution"]["final_bid_price"]
     gain = final_capital - initial_capital
-    # TODO: Update this to use first BUYING
-    first_transaction_cost = df[df.opening == 1]['c'].values[0]
-    gain_perc = (gain / first_transaction_cost) * 100
 
     col_ratios = (1, 5, 1, 5, 5)
 
@@ -183,8 +186,9 @@ else:
             end, DICT_DT_STR_FORMAT), label_visibility="collapsed", disabled=True)
 
     with col12:
-        st.metric("Gain ($)", round(gain, 2),
-                  str(round(gain_perc, 3)) + "%")
+        # Filled in once the transactions are loaded
+        gain_metric = st.empty()
+        gain_metric.metric("Gain ($)", round(gain, 2))
         st.write("**Initial capital ($)**: ", round(initial_capital, 2))
         st.write("**Final capital ($)**: ", round(final_capital, 2))
     with col13:
@@ -200,6 +204,15 @@ else:
         st.write(exp_values["agent"])
 
     st.subheader("Transactions")
+    df = generate_experiment_df(
+        experiment_name=experiment_name, instrument=instrument,
+        start=start, end=end,
+        version=get_experiment_version(experiment_name))
+    # TODO: Update this to use first BUYING
+    first_transaction_cost = df[df.opening == 1]['c'].values[0]
+    gain_perc = (gain / first_transaction_cost) * 100
+    gain_metric.metric("Gain ($)", round(gain, 2),
+                       str(round(gain_perc, 3)) + "%")
 
     if df["opening"].count() == 0:
         st.warning("No transactions were done during this experiment.")
@@ -0,0 +1,42 @@
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+
+from autotrader_ui.instrumentation import request_stats
+from autotrader_ui.metrics import METRICS
+from autotrader_ui.oanda_client import get_oanda_client
+
+
+st.header("🩺 Diagnostics")
+
+with st.sidebar:
+    st.title("AutoTrader")
+    if st.button("Reset metrics"):
+        METRICS.reset()
+
+st.subheader("OANDA requests")
+stats = request_stats()
+if len(stats) == 0:
+    st.info("No OANDA request recorded yet in this process.")
+else:
+    col01, col02, col03 = st.columns(3)
+    col01.metric("Requests", int(stats["requests"].sum()))
+    col02.metric("Errors", int(stats["errors"].sum()))
+    col03.metric("Time in OANDA calls (s)", f"{stats['total_s'].sum():.2f}")
+
+    fig = px.bar(stats.reset_index(), x="endpoint", y="total_s",
+                 title="Wall time per endpoint (s)")
+    st.plotly_chart(fig, use_container_width=True)
+    st.dataframe(stats.style.format(precision=1))
+
+scheduler = get_oanda_client().scheduler
+st.subheader("Request scheduler")
+col01, col02, col03 = st.columns(3)
+col01.metric("Configured rate (req/s)", f"{scheduler.rate:.0f}")
+col02.metric("Current rate (req/s)", f"{scheduler.current_rate:.1f}")
+col03.metric("Waiting requests", scheduler.waiting)
+
+streams = pd.DataFrame(METRICS.snapshot("stream."))
+if len(streams) > 0:
+    st.subheader("Price streams")
+    st.dataframe(streams)
@@ -0,0 +1,409 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Document Repositories.
+
+Collection-level interface to the Backtest, Experiment and Live documents,
+so that page logic does not depend on Firestore:
+
+* ``FirestoreRepository``: the Firestore collections, through ``db_utils``.
+* ``SQLiteRepository``: a SQLite (in-memory by default) collection with the
+  same behaviour, to benchmark or load-test without Google Cloud.
+
+Documents keep the Firestore layout (e.g. ``{experiment_name: values}``
+for experiments), and fields are designated by dotted field paths. Pages
+are walked with opaque cursors, which work the same with both backends.
+
+Usage:
+    experiments = get_repositories(db)["Experiment"]
+    experiments = SQLiteRepository("Experiment")
+    names = experiments.names()
+    summary = experiments.get_summary(names[0])
+
+Todo:
+    * ...
+"""
+
+# Built-in modules
+import abc
+import copy
+import hashlib
+import pickle
+import sqlite3
+import threading
+
+# Third-party modules
+
+# Local modules
+
+COLLECTIONS = ("Backtest", "Experiment", "Live")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    collection TEXT NOT NULL,
+    name TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (collection, name)
+);
+"""
+
+
+def get_field(data: dict, field_path: str, default=None):
+    """Returns the value of a dotted field path, or default."""
+    for key in field_path.split("."):
+        if not isinstance(data, dict) or key not in data:
+            return default
+        data = data[key]
+    return data
+
+
+def set_field(data: dict, field_path: str, value):
+    """Sets the value of a dotted field path, creating the parent maps."""
+    *parents, key = field_path.split(".")
+    for parent in parents:
+        data = data.setdefault(parent, {})
+    data[key] = value
+
+
+def project(data: dict, fields: list) -> dict:
+    """Keeps only some field paths of a document, like a Firestore field mask."""
+    projected = {}
+    missing = object()
+    for field_path in fields:
+        value = get_field(data, field_path, missing)
+        if value is not missing:
+            set_field(projected, field_path, value)
+    return projected
+
+
+class Cursor(object):
+    """Position of the last document of a page, to get the next page.
+
+    Opaque: only the repository that returned it reads its position, and
+    only for the same collection and sort field.
+    """
+
+    def __init__(self, collection: str, order_by: str, position):
+        self._collection = collection
+        self._order_by = order_by
+        self._position = position
+
+
+class Repository(abc.ABC):
+    """Interface of a document collection.
+
+    ``list`` and ``bulk_*`` take the same arguments as the ``db_utils``
+    functions of the same names, without the database and collection.
+
+    Args:
+        collection (str): Collection name.
+    """
+
+    def __init__(self, collection: str):
+        self.collection = collection
+
+    @abc.abstractmethod
+    def get(self, name: str) -> dict:
+        """Returns a document, None if it does not exist."""
+
+    @abc.abstractmethod
+    def version(self, name: str) -> str:
+        """Returns a string changing on every write of a document.
+
+        None if the document does not exist. Used to key caches of values
+        derived from the document.
+        """
+
+    @abc.abstractmethod
+    def list(self, fields: list = None, order_by: str = None,
+             descending: bool = False, limit: int = None,
+             start_after: Cursor = None) -> tuple:
+        """Lists documents, see ``db_utils.list_documents``.
+
+        Returns:
+            tuple: Dictionary of the documents data by name, and the cursor
+            of the next page (None if this is the last page).
+        """
+
+    def _cursor(self, order_by: str, position) -> Cursor:
+        return Cursor(self.collection, order_by, position)
+
+    def _position(self, cursor: Cursor, order_by: str):
+        """Returns the position of a cursor returned by this collection."""
+        if cursor is None:
+            return None
+        if not isinstance(cursor, Cursor) or \
+                cursor._collection != self.collection or \
+                cursor._order_by != order_by:
+            raise ValueError(
+                f"Cursor not returned by a {self.collection} listing "
+                f"ordered by {order_by}.")
+        return cursor._position
+
+    def names(self) -> list:
+        """Returns the names of all the documents."""
+        documents, _ = self.list(fields=[])
+        return list(documents)
+
+    def get_summary(self, name: str) -> dict:
+        """Returns the values of an experiment, without its transactions."""
+        data = self.get(name)
+        if data is None:
+            return None
+        values = dict(data.get(name, {}))
+        values.pop("transactions", None)
+        return values
+
+    def get_transactions(self, name: str) -> dict:
+        """Returns the transactions of an experiment, by time string."""
+        data = self.get(name) or {}
+        return data.get(name, {}).get("transactions", {})
+
+    def create(self, name: str, data: dict):
+        """Creates or overwrites a document."""
+        self.bulk_create({name: data})
+
+    def update(self, name: str, fields: dict):
+        """Updates fields (dotted field paths) of an existing document."""
+        self.bulk_update({name: fields})
+
+    def delete(self, name: str):
+        """Deletes a document."""
+        self.bulk_delete([name])
+
+    @abc.abstractmethod
+    def bulk_create(self, documents: dict) -> int:
+        """Creates or overwrites documents, returns their number."""
+
+    @abc.abstractmethod
+    def bulk_update(self, updates: dict) -> int:
+        """Updates fields of existing documents, returns their number."""
+
+    @abc.abstractmethod
+    def bulk_delete(self, names: list) -> int:
+        """Deletes documents, returns their number."""
+
+
+class FirestoreRepository(Repository):
+    """Firestore collection, read and written through ``db_utils``.
+
+    Experiments keep their chunked transactions and the local document
+    cache is used where ``db_utils`` uses it.
+
+    Args:
+        db: Firebase database instance.
+        collection (str): Collection name.
+    """
+
+    def __init__(self, db, collection: str):
+        super().__init__(collection)
+        # Imported here, the other repositories work without Firestore
+        from autotrader_ui import db_utils
+        self.db = db
+        self._db_utils = db_utils
+
+    def get(self, name: str) -> dict:
+        if self.collection == "Experiment":
+            return self._db_utils.get_specific_experiment(self.db, name)
+        if self.collection == "Backtest":
+            return self._db_utils.get_specific_backtest(self.db, name)
+        return self.db.collection(self.collection).document(name).get() \
+            .to_dict()
+
+    def version(self, name: str) -> str:
+        # Update time, from a read without fields
+        return self._db_utils.get_document_version(self.db, self.collection,
+                                                   name)
+
+    def list(self, fields: list = None, order_by: str = None,
+             descending: bool = False, limit: int = None,
+             start_after: Cursor = None) -> tuple:
+        documents, snapshot = self._db_utils.list_documents(
+            self.db, self.collection, fields, order_by, descending, limit,
+            self._position(start_after, order_by))
+        # The position is the snapshot of the last document
+        cursor = (self._cursor(order_by, snapshot)
+                  if snapshot is not None else None)
+        return documents, cursor
+
+    def get_summary(self, name: str) -> dict:
+        if self.collection == "Experiment":
+            # Field-masked read, the transactions are not transferred
+            return self._db_utils.get_experiment_summary(self.db, name)
+        return super().get_summary(name)
+
+    def get_transactions(self, name: str) -> dict:
+        if self.collection == "Experiment":
+            return self._db_utils.get_experiment_transactions(self.db, name)
+        return super().get_transactions(name)
+
+    def create(self, name: str, data: dict):
+        if self.collection == "Experiment":
+            self._db_utils.create_experiment(self.db, name, data)
+        elif self.collection == "Backtest":
+            self._db_utils.create_backtest(self.db, name, data)
+        else:
+            self.bulk_create({name: data})
+
+    def bulk_create(self, documents: dict) -> int:
+        if self.collection == "Experiment":
+            # Transactions are split into chunks, one experiment at a time
+            for name, data in documents.items():
+                self._db_utils.create_experiment(self.db, name, data)
+            return len(documents)
+        return self._db_utils.bulk_create(self.db, self.collection,
+                                          documents)
+
+    def bulk_update(self, updates: dict) -> int:
+        return self._db_utils.bulk_update(self.db, self.collection, updates)
+
+    def bulk_delete(self, names: list) -> int:
+        if self.collection == "Experiment":
+            self._db_utils.delete_experiments(self.db, names)
+            return len(names)
+        return self._db_utils.bulk_delete(self.db, self.collection, names)
+
+
+class SQLiteRepository(Repository):
+    """SQLite collection with the behaviour of the Firestore one.
+
+    Documents are stored pickled. Field masks, sorting and pagination are
+    applied like Firestore does: documents missing the sort field are left
+    out, and pages follow the (sort value, name) order.
+
+    Args:
+        collection (str): Collection name.
+        path (str, optional): SQLite database file. Defaults to ":memory:".
+    """
+
+    def __init__(self, collection: str, path: str = ":memory:"):
+        super().__init__(collection)
+        self.path = path
+        self._lock = threading.Lock()
+        # A single connection, an in-memory database lives as long as it
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def _load(self, names: list = None) -> dict:
+        """Returns the documents (or some of them) by name, unpickled."""
+        query = "SELECT name, data FROM documents WHERE collection = ?"
+        params = [self.collection]
+        if names is not None:
+            query += f" AND name IN ({', '.join('?' * len(names))})"
+            params.extend(names)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY name",
+                                      params).fetchall()
+        return {name: pickle.loads(data) for name, data in rows}
+
+    def _store(self, documents: dict) -> int:
+        rows = [(self.collection, name,
+                 pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+                for name, data in documents.items()]
+        with self._lock, self._conn:  # One transaction
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    def get(self, name: str) -> dict:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM documents WHERE collection = ? "
+                "AND name = ?", (self.collection, name)).fetchone()
+        return pickle.loads(row[0]) if row is not None else None
+
+    def version(self, name: str) -> str:
+        # Digest of the stored document, changing with its content
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM documents WHERE collection = ? "
+                "AND name = ?", (self.collection, name)).fetchone()
+        return hashlib.sha1(row[0]).hexdigest() if row is not None else None
+
+    def list(self, fields: list = None, order_by: str = None,
+             descending: bool = False, limit: int = None,
+             start_after: Cursor = None) -> tuple:
+        start_after = self._position(start_after, order_by)
+        if order_by is None and fields is not None and len(fields) == 0:
+            # Names only, without loading the documents
+            query = "SELECT name FROM documents WHERE collection = ?"
+            params = [self.collection]
+            if start_after is not None:
+                query += " AND name > ?"
+                params.append(start_after[1])
+            query += " ORDER BY name"
+            if limit is not None:
+                query += f" LIMIT {int(limit)}"
+            with self._lock:
+                rows = self._conn.execute(query, params).fetchall()
+            documents = {name: {} for name, in rows}
+            keys = [(None, name) for name in documents]
+        else:
+            if fields is not None and order_by is not None \
+                    and order_by not in fields:
+                fields = list(fields) + [order_by]  # As list_documents
+            missing = object()
+            keys = []
+            for name, data in self._load().items():
+                value = (get_field(data, order_by, missing)
+                         if order_by is not None else None)
+                if value is not missing:
+                    keys.append(((value, name), data))
+            keys.sort(key=lambda item: item[0], reverse=descending)
+            if start_after is not None:
+                keys = [item for item in keys
+                        if (item[0] < start_after if descending
+                            else item[0] > start_after)]
+            if limit is not None:
+                keys = keys[:limit]
+            documents = {key[1]: (project(data, fields)
+                                  if fields is not None else data)
+                         for key, data in keys}
+            keys = [key for key, _ in keys]
+
+        # The position is the (sort value, name) of the last document
+        cursor = (self._cursor(order_by, keys[-1])
+                  if limit is not None and len(keys) == limit else None)
+        return documents, cursor
+
+    def bulk_create(self, documents: dict) -> int:
+        return self._store({name: copy.deepcopy(data)
+                            for name, data in documents.items()})
+
+    def bulk_update(self, updates: dict) -> int:
+        documents = self._load(list(updates))
+        missing = set(updates) - set(documents)
+        if len(missing) > 0:  # Like Firestore's NotFound
+            raise KeyError(f"No document to update: {sorted(missing)}")
+        for name, fields in updates.items():
+            for field_path, value in fields.items():
+                set_field(documents[name], field_path, copy.deepcopy(value))
+        return self._store(documents)
+
+    def bulk_delete(self, names: list) -> int:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM documents WHERE collection = ? AND name = ?",
+                [(self.collection, name) for name in names])
+        return len(names)
+
+
+def get_repositories(db=None, path: str = ":memory:") -> dict:
+    """Returns the repositories of the Backtest, Experiment and Live collections.
+
+    Args:
+        db (optional): Firebase database instance. Defaults to None (SQLite).
+        path (str, optional): SQLite database file, without db. Defaults to ":memory:".
+
+    Returns:
+        dict: Repository by collection name.
+    """
+    if db is not None:
+        return {collection: FirestoreRepository(db, collection)
+                for collection in COLLECTIONS}
+    return {collection: SQLiteRepository(collection, path)
+            for collection in COLLECTIONS}
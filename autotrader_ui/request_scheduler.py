@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Shared OANDA Request Scheduler.
+
+Token bucket shared by every client of the same OANDA token in the
+process (Streamlit sessions, history backfills, spread and position
+lookups), so that their requests add up to a steady rate instead of
+bursts tripping the API rate limits.
+
+Waiting requests are served by priority lane: order placement first,
+history backfill last. When OANDA answers 429 (or 503 with a Retry-After
+header), the whole bucket pauses for the advertised delay and the request
+is retried instead of failing. Each such response also halves the rate,
+which then recovers additively, so that a configured rate above the real
+limit converges to it instead of hitting it repeatedly.
+
+Usage:
+    scheduler = get_request_scheduler(api.access_token)
+    waited = scheduler.acquire(endpoint_priority("order"))
+
+Todo:
+    * ...
+"""
+
+# Built-in modules
+import heapq
+import itertools
+import random
+import threading
+import time
+
+# Third-party modules
+
+# Local modules
+
+REQUESTS_PER_SECOND = 100.  # OANDA allows 100 requests/s per connection
+BURST = 20
+MAX_RETRIES = 5
+RETRY_BASE = 0.5  # seconds, when no Retry-After is sent
+RETRY_MAX = 30.  # seconds
+RATE_RECOVERY = 0.01  # Fraction of the rate recovered per granted request
+MIN_RATE_FRACTION = 1 / 16
+
+# Lower values are served first
+ENDPOINT_PRIORITIES = {
+    "order": 0,
+    "trade": 1,
+    "position": 1,
+    "pricing": 1,
+    "account": 2,
+    "transaction": 2,
+    "instruments": 2,
+    "candles": 3,
+}
+DEFAULT_PRIORITY = 2
+
+_SCHEDULERS = {}
+_SCHEDULERS_LOCK = threading.Lock()
+
+
+def endpoint_priority(endpoint: str) -> int:
+    """Returns the priority lane of an endpoint family."""
+    return ENDPOINT_PRIORITIES.get(endpoint, DEFAULT_PRIORITY)
+
+
+def retry_delay(status: int, headers: dict, attempt: int) -> float:
+    """Returns how long to wait before retrying a response, or None.
+
+    Args:
+        status (int): HTTP status of the response.
+        headers (dict): Response headers.
+        attempt (int): Number of retries so far, from 0.
+
+    Returns:
+        float: Seconds to wait, None if the response must not be retried.
+    """
+    retry_after = headers.get("Retry-After") if headers else None
+    if status != 429 and not (status == 503 and retry_after is not None):
+        return None
+    if attempt >= MAX_RETRIES:
+        return None
+    try:
+        return min(RETRY_MAX, max(0., float(retry_after)))
+    except (TypeError, ValueError):
+        return random.uniform(0, min(RETRY_MAX, RETRY_BASE * 2 ** attempt))
+
+
+class RequestScheduler(object):
+    """Thread-safe token bucket with priority lanes.
+
+    Args:
+        rate (float, optional): Requests allowed per second. Defaults to 100.
+        burst (int, optional): Requests allowed at once after idling. Defaults to 20.
+    """
+
+    def __init__(self, rate: float = REQUESTS_PER_SECOND, burst: int = BURST):
+        self.rate = rate
+        self.burst = burst
+        self.current_rate = rate
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.
+        self._waiting = []  # Heap of (priority, sequence) tickets
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens +
+                           (now - self._updated_at) * self.current_rate)
+        self._updated_at = now
+
+    def acquire(self, priority: int = DEFAULT_PRIORITY) -> float:
+        """Waits for the right to send one request.
+
+        Requests of a lower priority value are served first, and requests
+        of the same priority in arrival order.
+
+        Args:
+            priority (int, optional): Priority lane. Defaults to 2.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        start = time.monotonic()
+        with self._cond:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = max(self._paused_until - now,
+                           (1 - self._tokens) / self.current_rate)
+                if wait <= 0 and self._waiting[0] == ticket:
+                    heapq.heappop(self._waiting)
+                    self._tokens -= 1
+                    self.current_rate = min(
+                        self.rate,
+                        self.current_rate + RATE_RECOVERY * self.rate)
+                    # Let the next waiter check for a remaining token
+                    self._cond.notify_all()
+                    return now - start
+                # Woken up early when the head of the queue is served
+                self._cond.wait(wait if wait > 0 else None)
+
+    def pause(self, seconds: float):
+        """Holds all requests for seconds and halves the rate.
+
+        Called after a rate limit response.
+        """
+        with self._cond:
+            self._paused_until = max(self._paused_until,
+                                     time.monotonic() + seconds)
+            self._tokens = min(self._tokens, 0.)
+            self.current_rate = max(self.rate * MIN_RATE_FRACTION,
+                                    self.current_rate / 2)
+
+    @property
+    def waiting(self) -> int:
+        """Number of requests currently waiting."""
+        with self._cond:
+            return len(self._waiting)
+
+
+def get_request_scheduler(token: str, rate: float = REQUESTS_PER_SECOND,
+                          burst: int = BURST) -> RequestScheduler:
+    """Returns the process-wide scheduler of an OANDA token.
+
+    Args:
+        token (str): OANDA access token.
+        rate (float, optional): Rate of a new scheduler. Defaults to 100.
+        burst (int, optional): Burst of a new scheduler. Defaults to 20.
+
+    Returns:
+        RequestScheduler: Scheduler shared by all the clients of the token.
+    """
+    with _SCHEDULERS_LOCK:
+        scheduler = _SCHEDULERS.get(token)
+        if scheduler is None:
+            scheduler = _SCHEDULERS[token] = RequestScheduler(rate, burst)
+        return scheduler
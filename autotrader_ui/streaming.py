@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Multi-Instrument Price Streaming.
+
+A single OANDA pricing stream shared by any number of subscribers, each
+receiving the ticks of one instrument through its own queue. The stream
+is supervised: silent connections are dropped and reopened with jittered
+exponential backoff, and tick latency, gaps and reconnections are recorded
+as metrics.
+
+Usage:
+    mux = StreamMultiplexer(new_stream_client())
+    eur_usd = mux.subscribe("EUR_USD")
+    instrument, time, bid, ask = eur_usd.get()
+
+Todo:
+    * ...
+"""
+
+# Built-in modules
+import queue
+import random
+import threading
+import time
+import traceback
+
+# Third-party modules
+
+# Local modules
+from autotrader_ui.instrumentation import InstrumentedContext
+from autotrader_ui.metrics import METRICS
+from autotrader_ui.ticks import time_to_ns
+
+HEARTBEAT_TIMEOUT = 10.  # seconds, OANDA sends a heartbeat every 5 seconds
+BACKOFF_BASE = 1.  # seconds
+BACKOFF_MAX = 60.  # seconds
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE,
+                  maximum: float = BACKOFF_MAX) -> float:
+    """Returns a jittered exponential backoff delay ("full jitter").
+
+    Args:
+        attempt (int): Number of consecutive failures so far, from 0.
+        base (float, optional): Delay scale, in seconds. Defaults to 1.
+        maximum (float, optional): Delay cap, in seconds. Defaults to 60.
+
+    Returns:
+        float: Delay to wait, in seconds.
+    """
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
+
+
+class StreamMultiplexer(object):
+    """Dispatches one pricing stream to per-instrument subscriber queues.
+
+    The stream covers the union of the subscribed instruments. It is
+    reopened only when that set changes, at the latest on the next message
+    (OANDA sends a heartbeat every 5 seconds).
+
+    If nothing, not even a heartbeat, is received for ``heartbeat_timeout``
+    seconds, the read times out and the stream is reopened. Every reopening
+    that is not due to a subscription change waits a jittered exponential
+    backoff, whether the stream failed or ended cleanly, which grows until
+    a tick is received again. The following metrics are recorded in
+    ``metrics``:
+
+    * ``stream.connects``, ``stream.failures``, ``stream.heartbeats``: counters.
+    * ``stream.ticks``: counter per instrument.
+    * ``stream.tick_latency``: local receive time minus server tick time, in seconds.
+    * ``stream.tick_gap``: seconds between consecutive ticks of an instrument.
+    * ``stream.heartbeat_gap``: seconds between consecutive heartbeats.
+
+    A slow feed keeps its heartbeats with large tick gaps, while a dead one
+    shows failures and a growing ``last_message_age``.
+
+    Args:
+        api (tpqoa): Client providing the account and the stream server
+            settings. The multiplexer opens its streams with its own v20
+            context, leaving the client's contexts untouched.
+        snapshot (bool, optional): Start every stream with the current prices. Defaults to True.
+        queue_size (int, optional): Capacity of the subscriber queues. When a
+            queue is full, its oldest tick is dropped. Defaults to 10000.
+        heartbeat_timeout (float, optional): Silence, in seconds, after which
+            the stream is considered dead. Applied as the read timeout of the
+            multiplexer's stream context. Defaults to 10.
+        metrics (MetricsRegistry, optional): Registry receiving the stream
+            metrics. Defaults to the process-wide registry.
+    """
+
+    def __init__(self, api, snapshot: bool = True, queue_size: int = 10000,
+                 heartbeat_timeout: float = HEARTBEAT_TIMEOUT,
+                 metrics=METRICS):
+        self.api = api
+        self.snapshot = snapshot
+        self.queue_size = queue_size
+        self.heartbeat_timeout = heartbeat_timeout
+        self.metrics = metrics
+        # Own context, the timeout must not apply to the client's streams
+        self.ctx = InstrumentedContext(
+            hostname=api.stream_hostname, port=api.port, ssl=api.ssl,
+            token=api.access_token, metrics=metrics)
+        self.ctx.set_stream_timeout(heartbeat_timeout)
+        self._last_message = None
+        self._last_tick = {}
+        self._ticked = False
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def instruments(self) -> list:
+        """Sorted list of the instruments currently streamed."""
+        with self._lock:
+            return sorted(self._subscribers)
+
+    def subscribe(self, instrument: str) -> queue.Queue:
+        """Subscribes to the ticks of an instrument.
+
+        Args:
+            instrument (str): Instrument name.
+
+        Returns:
+            queue.Queue: Queue receiving (instrument, time, bid, ask) tuples.
+        """
+        subscriber = queue.Queue(self.queue_size)
+        with self._lock:
+            if instrument not in self._subscribers:
+                self._subscribers[instrument] = set()
+                self._changed.set()
+            self._subscribers[instrument].add(subscriber)
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run,
+                                                daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, instrument: str, subscriber: queue.Queue):
+        """Removes a subscriber queue returned by ``subscribe``."""
+        with self._lock:
+            subscribers = self._subscribers.get(instrument, set())
+            subscribers.discard(subscriber)
+            if len(subscribers) == 0 and instrument in self._subscribers:
+                del self._subscribers[instrument]
+                self._changed.set()
+
+    @property
+    def last_message_age(self) -> float:
+        """Seconds since the last tick or heartbeat, None before any."""
+        if self._last_message is None:
+            return None
+        return time.monotonic() - self._last_message
+
+    def stop(self, timeout: float = None):
+        """Stops streaming, after the next message at the latest."""
+        self._stopped.set()
+        self._changed.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _dispatch(self, tick: tuple):
+        with self._lock:
+            subscribers = list(self._subscribers.get(tick[0], ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(tick)
+            except queue.Full:
+                # Slow subscriber, keep the most recent ticks
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    pass
+                subscriber.put_nowait(tick)
+
+    def _stream(self, instruments: list):
+        response = self.ctx.pricing.stream(
+            self.api.account_id, snapshot=self.snapshot,
+            instruments=",".join(instruments))
+        self.metrics.counter("stream.connects").inc()
+        last_heartbeat = None
+        for msg_type, msg in response.parts():
+            now = time.monotonic()
+            self._last_message = now
+            if msg_type == 'pricing.ClientPrice':
+                self._ticked = True
+                self._record_tick(msg.instrument, msg.time, now)
+                self._dispatch((msg.instrument, msg.time,
+                                float(msg.bids[0].dict()['price']),
+                                float(msg.asks[0].dict()['price'])))
+            elif msg_type == 'pricing.PricingHeartbeat':
+                self.metrics.counter("stream.heartbeats").inc()
+                if last_heartbeat is not None:
+                    self.metrics.histogram("stream.heartbeat_gap").observe(
+                        now - last_heartbeat)
+                last_heartbeat = now
+            if self._changed.is_set():
+                break
+
+    def _record_tick(self, instrument: str, server_time: str, now: float):
+        latency = (time.time_ns() - time_to_ns(server_time)) / 1e9
+        self.metrics.counter("stream.ticks", instrument=instrument).inc()
+        self.metrics.histogram("stream.tick_latency",
+                               instrument=instrument).observe(latency)
+        last_tick = self._last_tick.get(instrument)
+        if last_tick is not None:
+            self.metrics.histogram("stream.tick_gap",
+                                   instrument=instrument).observe(
+                now - last_tick)
+        self._last_tick[instrument] = now
+
+    def _run(self):
+        attempt = 0  # Connections since the last tick
+        while not self._stopped.is_set():
+            self._changed.clear()
+            instruments = self.instruments
+            if len(instruments) == 0:
+                self._changed.wait()
+                continue
+            self._ticked = False
+            try:
+                self._stream(instruments)
+            except Exception:
+                print(traceback.format_exc())
+                self.metrics.counter("stream.failures").inc()
+            if self._changed.is_set() and not self._stopped.is_set():
+                # Subscriptions changed: reopen at once, not a failure
+                continue
+            if self._ticked:
+                attempt = 0
+            # Also after a clean end, or a server closing streams at once
+            # would be reconnected to in a tight loop
+            self._stopped.wait(backoff_delay(attempt))
+            attempt += 1
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tick Buffers and Bar Aggregation.
+
+Fixed-capacity NumPy ring buffers holding the latest ticks of streamed
+instruments, and incremental aggregation of those ticks into OHLC bars.
+
+Usage:
+    aggregator = TickAggregator(granularities=("S5", "M1", "M5"))
+    new_stream_client().stream_data("EUR_USD", callback=aggregator.on_tick)
+    bars = aggregator.get_bars("EUR_USD", "M1")
+
+Todo:
+    * ...
+"""
+
+# Built-in modules
+import threading
+
+# Third-party modules
+import numpy as np
+import pandas as pd
+
+# Local modules
+
+TICK_FIELDS = {"time": "int64", "bid": "float64", "ask": "float64"}
+BAR_FIELDS = {"time": "int64", "o": "float64", "h": "float64",
+              "l": "float64", "c": "float64", "volume": "int64"}
+GRANULARITY_UNITS_NS = {"S": 10**9, "M": 60 * 10**9, "H": 3600 * 10**9}
+
+
+def granularity_to_ns(granularity: str) -> int:
+    """Returns the duration of an OANDA granularity, in nanoseconds.
+
+    Args:
+        granularity (str): A string like 'S5', 'M1' or 'H4'.
+
+    Returns:
+        int: Bar duration, in nanoseconds.
+    """
+    unit = granularity[0]
+    if unit not in GRANULARITY_UNITS_NS or not granularity[1:].isdigit():
+        raise ValueError(f"Unsupported granularity: {granularity}")
+    return int(granularity[1:]) * GRANULARITY_UNITS_NS[unit]
+
+
+def time_to_ns(time: str) -> int:
+    """Converts an RFC3339 time sent by OANDA to nanoseconds since epoch.
+
+    Args:
+        time (str): Time like '2023-01-02T10:00:00.123456789Z'.
+
+    Returns:
+        int: Nanoseconds since epoch.
+    """
+    return int(np.datetime64(time.rstrip("Z"), "ns").astype(np.int64))
+
+
+class RingBuffer(object):
+    """Fixed-capacity columnar buffer keeping the latest rows.
+
+    Appending is O(1) and never allocates: once full, the oldest row is
+    overwritten.
+
+    Args:
+        capacity (int): Maximum number of rows held.
+        fields (dict): Column names and their NumPy dtypes.
+    """
+
+    def __init__(self, capacity: int, fields: dict):
+        self.capacity = capacity
+        self.fields = list(fields)
+        self._columns = [np.zeros(capacity, dtype=dtype)
+                         for dtype in fields.values()]
+        self._next = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, *values):
+        """Appends one row, given in the order of the fields."""
+        i = self._next
+        for column, value in zip(self._columns, values):
+            column[i] = value
+        self._next = (i + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def last(self, n: int = None) -> dict:
+        """Returns copies of the latest n rows, oldest first.
+
+        Args:
+            n (int, optional): Number of rows. Defaults to None (all).
+
+        Returns:
+            dict: NumPy array per field.
+        """
+        n = self._count if n is None else min(n, self._count)
+        idx = (self._next - n + np.arange(n)) % self.capacity
+        return {name: column[idx]
+                for name, column in zip(self.fields, self._columns)}
+
+    def to_frame(self, n: int = None) -> pd.DataFrame:
+        """Returns the latest n rows as a DataFrame indexed by time (UTC)."""
+        data = self.last(n)
+        index = pd.to_datetime(data.pop("time"), unit="ns")
+        return pd.DataFrame(data, index=pd.DatetimeIndex(index, name="time"))
+
+
+class BarAggregator(object):
+    """Builds OHLC bars of one granularity incrementally from prices.
+
+    Prices are expected in chronological order. A bar is closed, stored and
+    returned once a price of a later bar arrives; the bar in progress is
+    available through ``current_bar``. Volume is the number of ticks, as in
+    OANDA candles.
+
+    Args:
+        granularity (str, optional): Bar granularity, e.g. 'S5', 'M1' or 'M5'. Defaults to "M1".
+        capacity (int, optional): Number of closed bars kept. Defaults to 10000.
+    """
+
+    def __init__(self, granularity: str = "M1", capacity: int = 10000):
+        self.granularity = granularity
+        self.period = granularity_to_ns(granularity)
+        self.bars = RingBuffer(capacity, BAR_FIELDS)
+        self._bar = None
+
+    @property
+    def current_bar(self) -> tuple:
+        """(time, o, h, l, c, volume) of the bar in progress, or None."""
+        return tuple(self._bar) if self._bar is not None else None
+
+    def update(self, time_ns: int, price: float) -> tuple:
+        """Adds a price to the bars.
+
+        Args:
+            time_ns (int): Time of the price, nanoseconds since epoch.
+            price (float): Price.
+
+        Returns:
+            tuple: The (time, o, h, l, c, volume) bar closed by this
+                price, or None.
+        """
+        bar_time = time_ns - time_ns % self.period
+        bar = self._bar
+        if bar is not None and bar_time == bar[0]:
+            if price > bar[2]:
+                bar[2] = price
+            if price < bar[3]:
+                bar[3] = price
+            bar[4] = price
+            bar[5] += 1
+            return None
+
+        closed = None
+        if bar is not None:
+            closed = tuple(bar)
+            self.bars.append(*closed)
+        self._bar = [bar_time, price, price, price, price, 1]
+        return closed
+
+    def to_frame(self, n: int = None, include_current: bool = False):
+        """Returns the latest n closed bars as a DataFrame.
+
+        Args:
+            n (int, optional): Number of bars. Defaults to None (all).
+            include_current (bool, optional): Append the bar in progress. Defaults to False.
+
+        Returns:
+            pd.DataFrame: Bars with o, h, l, c, volume and complete columns.
+        """
+        data = self.bars.to_frame(n)
+        data["complete"] = True
+        if include_current and self._bar is not None:
+            current = pd.DataFrame(
+                [self._bar[1:] + [False]], columns=data.columns,
+                index=pd.DatetimeIndex(pd.to_datetime([self._bar[0]],
+                                                      unit="ns"),
+                                       name="time"))
+            data = pd.concat([data, current])
+        return data
+
+
+class TickAggregator(object):
+    """Per-instrument tick ring buffers and bar aggregators.
+
+    ``on_tick`` has the signature of the ``tpqoa.stream_data`` callback.
+    Bars are built on the mid price, like OANDA 'M' candles.
+
+    Args:
+        granularities (tuple, optional): Bar granularities to build. Defaults to ("S5", "M1", "M5").
+        tick_capacity (int, optional): Ticks kept per instrument. Defaults to 100000.
+        bar_capacity (int, optional): Bars kept per instrument and granularity. Defaults to 10000.
+        on_bar (callable, optional): Called as ``on_bar(instrument, granularity, bar)``
+            for every closed bar. Defaults to None.
+    """
+
+    def __init__(self, granularities: tuple = ("S5", "M1", "M5"),
+                 tick_capacity: int = 100000, bar_capacity: int = 10000,
+                 on_bar=None):
+        self.granularities = tuple(granularities)
+        self.tick_capacity = tick_capacity
+        self.bar_capacity = bar_capacity
+        self.on_bar = on_bar
+        self._ticks = {}
+        self._bars = {}
+        self._lock = threading.Lock()
+
+    def _add_instrument(self, instrument: str):
+        self._ticks[instrument] = RingBuffer(self.tick_capacity, TICK_FIELDS)
+        self._bars[instrument] = {
+            granularity: BarAggregator(granularity, self.bar_capacity)
+            for granularity in self.granularities}
+
+    def on_tick(self, instrument: str, time, bid: float, ask: float):
+        """Adds a tick. Time is an RFC3339 string or nanoseconds."""
+        time_ns = time_to_ns(time) if isinstance(time, str) else int(time)
+        mid = (bid + ask) / 2
+        closed_bars = []
+        with self._lock:
+            if instrument not in self._ticks:
+                self._add_instrument(instrument)
+            self._ticks[instrument].append(time_ns, bid, ask)
+            for granularity, aggregator in self._bars[instrument].items():
+                bar = aggregator.update(time_ns, mid)
+                if bar is not None:
+                    closed_bars.append((granularity, bar))
+        if self.on_bar is not None:
+            for granularity, bar in closed_bars:
+                self.on_bar(instrument, granularity, bar)
+
+    def get_ticks(self, instrument: str, n: int = None) -> pd.DataFrame:
+        """Returns the latest n ticks of instrument, with bid and ask."""
+        with self._lock:
+            return self._ticks[instrument].to_frame(n)
+
+    def get_bars(self, instrument: str, granularity: str = "M1",
+                 n: int = None, include_current: bool = False):
+        """Returns the latest n bars of instrument for a granularity."""
+        with self._lock:
+            return self._bars[instrument][granularity].to_frame(
+                n, include_current)
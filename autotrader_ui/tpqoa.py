@@ -30,16 +30,26 @@
 import _thread
 import configparser
 import json
+import random
 import signal
 import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from time import sleep
 
+import numpy as np
 import pandas as pd
-import v20
+from v20.errors import ResponseUnexpectedStatus
+from v20.request import Request
 from v20.transaction import StopLossDetails, ClientExtensions
 from v20.transaction import TrailingStopLossDetails, TakeProfitDetails
 
+from autotrader_ui.instrumentation import InstrumentedContext
+from autotrader_ui.request_scheduler import get_request_scheduler
+
 MAX_REQUEST_COUNT = float(5000)
+PRICE_COMPONENTS = {'A': 'ask', 'B': 'bid', 'M': 'mid'}
 
 
 class Job(threading.Thread):
@@ -93,18 +103,25 @@ def service_shutdown(signum, frame):
 class tpqoa(object):
     ''' tpqoa is a Python wrapper class for the Oanda v20 API. '''
 
-    def __init__(self, conf_file):
+    def __init__(self, conf_file, raw_decoding=False):
         ''' Init function is expecting a configuration file with
         the following content:
         [oanda]
         account_id = XYZ-ABC-...
         access_token = ZYXCAB...
         account_type = practice (default) or live
+        and optionally hostname, stream_hostname, port and ssl to
+        target another server than Oanda's, and rate_limit (requests
+        per second shared by all the clients of the token, default 100).
         Parameters
         ==========
         conf_file: string
             path to and filename of the configuration file,
             e.g. '/home/me/oanda.cfg'
+        raw_decoding: boolean
+            whether retrieve_data decodes the raw JSON body of the
+            candles response directly into NumPy arrays, instead of
+            going through v20 objects (same output, less overhead)
         '''
         self.config = configparser.ConfigParser()
         self.config.read(conf_file)
@@ -119,20 +136,37 @@ class tpqoa(object):
             self.hostname = 'api-fxpractice.oanda.com'
             self.stream_hostname = 'stream-fxpractice.oanda.com'
 
-        self.ctx = v20.Context(
+        # Optional overrides, e.g. to target a local stand-in server
+        self.hostname = self.config['oanda'].get('hostname', self.hostname)
+        self.stream_hostname = self.config['oanda'].get(
+            'stream_hostname', self.stream_hostname)
+        self.port = self.config['oanda'].getint('port', 443)
+        self.ssl = self.config['oanda'].getboolean('ssl', True)
+
+        # All REST calls of the token share one rate-limited scheduler
+        self.scheduler = get_request_scheduler(
+            self.access_token,
+            rate=self.config['oanda'].getfloat('rate_limit', 100.))
+
+        # Contexts recording the latency, size and status of every request
+        self.ctx = InstrumentedContext(
+            scheduler=self.scheduler,
             hostname=self.hostname,
-            port=443,
+            port=self.port,
+            ssl=self.ssl,
             token=self.access_token,
             poll_timeout=10
         )
-        self.ctx_stream = v20.Context(
+        self.ctx_stream = InstrumentedContext(
             hostname=self.stream_hostname,
-            port=443,
+            port=self.port,
+            ssl=self.ssl,
             token=self.access_token,
         )
 
         self.suffix = '.000000000Z'
         self.stop_stream = False
+        self.raw_decoding = raw_decoding
 
     def get_instruments(self):
         ''' Retrieves and returns all instruments for the given account. '''
@@ -151,6 +185,34 @@ class tpqoa(object):
         ask = float(r['prices'][0]['closeoutAsk'])
         return r['time'], bid, ask
 
+    def get_price_snapshot(self, instruments):
+        ''' Returns the current BID/ASK prices for several instruments,
+        retrieved with a single request.
+        Parameters
+        ==========
+        instruments: list or string
+            valid instrument names, or a comma-separated string
+        Returns
+        =======
+        data: pd.DataFrame
+            one row per instrument with columns instrument, time, bid,
+            ask and spread
+        '''
+        if not isinstance(instruments, str):
+            instruments = ','.join(instruments)
+        r = self.ctx.pricing.get(self.account_id, instruments=instruments)
+        r = json.loads(r.raw_body)
+        prices = r['prices']
+        bid = np.array([p['closeoutBid'] for p in prices], dtype=float)
+        ask = np.array([p['closeoutAsk'] for p in prices], dtype=float)
+        return pd.DataFrame({
+            'instrument': [p['instrument'] for p in prices],
+            'time': pd.to_datetime([p['time'] for p in prices]),
+            'bid': bid,
+            'ask': ask,
+            'spread': ask - bid
+        })
+
     def transform_datetime(self, dati):
         ''' Transforms Python datetime object to string. '''
         if isinstance(dati, str):
@@ -158,6 +220,9 @@ class tpqoa(object):
         return dati.isoformat('T') + self.suffix
 
     def retrieve_data(self, instrument, start, end, granularity, price):
+        if self.raw_decoding:
+            return self._retrieve_data_raw(instrument, start, end,
+                                           granularity, price)
         raw = self.ctx.instrument.candles(
             instrument=instrument,
             fromTime=start, toTime=end,
@@ -188,8 +253,54 @@ class tpqoa(object):
             data[col] = data[col].astype(float)
         return data
 
-    def get_history(self, instrument, start, end,
-                    granularity, price, localize=True):
+    def _retrieve_data_raw(self, instrument, start, end, granularity, price):
+        ''' Same as retrieve_data, but decodes the raw JSON body of the
+        response straight into NumPy arrays instead of v20 objects. '''
+        if price not in PRICE_COMPONENTS:
+            raise ValueError("price must be either 'B', 'A' or 'M'.")
+        request = Request('GET', '/v3/instruments/{instrument}/candles')
+        request.set_path_param('instrument', instrument)
+        request.set_param('price', price)
+        request.set_param('granularity', granularity)
+        request.set_param('from', start)
+        request.set_param('to', end)
+        response = self.ctx.request(request)
+        if str(response.status) != '200':
+            raise ResponseUnexpectedStatus(response, 200)
+        return self.decode_candles(response.raw_body, price)
+
+    @staticmethod
+    def decode_candles(raw_body, price):
+        ''' Decodes the JSON body of a candles response into the same
+        DataFrame as retrieve_data, using preallocated NumPy arrays. '''
+        candles = json.loads(raw_body)['candles']
+        n = len(candles)
+        if n == 0:
+            return pd.DataFrame()  # return empty DataFrame if no data
+        component = PRICE_COMPONENTS[price]
+
+        # RFC3339 times, e.g. '2023-01-02T00:00:00.000000000Z'
+        time = np.array([cs['time'][:-1] for cs in candles],
+                        dtype='datetime64[ns]')
+        complete = np.fromiter((cs['complete'] for cs in candles),
+                               dtype=bool, count=n)
+        volume = np.fromiter((cs['volume'] for cs in candles),
+                             dtype=np.int64, count=n)
+        ohlc = np.empty((4, n), dtype=np.float64)
+        for i, cs in enumerate(candles):
+            prices = cs[component]
+            ohlc[0, i] = prices['o']
+            ohlc[1, i] = prices['h']
+            ohlc[2, i] = prices['l']
+            ohlc[3, i] = prices['c']
+
+        index = pd.DatetimeIndex(time, name='time').tz_localize('UTC')
+        return pd.DataFrame({'volume': volume, 'complete': complete,
+                             'o': ohlc[0], 'h': ohlc[1],
+                             'l': ohlc[2], 'c': ohlc[3]}, index=index)
+
+    def get_history(self, instrument, start, end, granularity, price,
+                    localize=True, store=None, max_workers=None):
         ''' Retrieves historical data for instrument.
         Parameters
         ==========
@@ -201,11 +312,33 @@ class tpqoa(object):
             a string like 'S5', 'M1' or 'D'
         price: string
             one of 'A' (ask), 'B' (bid) or 'M' (middle)
+        localize: boolean
+            whether to drop the UTC timezone from the index
+        store: CandleStore
+            optional local candle store to read through; only the
+            intervals it does not hold yet are requested from Oanda
+        max_workers: int
+            if set, the batches of long ranges are retrieved concurrently
+            by up to max_workers threads instead of one after the other
         Returns
         =======
         data: pd.DataFrame
             pandas DataFrame object with data
         '''
+        fetch = partial(self._fetch_history, max_workers=max_workers)
+        if store is not None:
+            data = store.read_through(fetch, instrument, start, end,
+                                      granularity, price)
+        else:
+            data = fetch(instrument, start, end, granularity, price)
+        if localize:
+            data.index = data.index.tz_localize(None)
+
+        return data[['o', 'h', 'l', 'c', 'volume', 'complete']]
+
+    def _history_batches(self, start, end, granularity):
+        ''' Splits [start, end] into (batch_start, batch_end) string pairs
+        of at most MAX_REQUEST_COUNT candles each. '''
         if granularity.startswith('S') or granularity.startswith('M') \
                 or granularity.startswith('H'):
             multiplier = float("".join(filter(str.isdigit, granularity)))
@@ -215,32 +348,110 @@ class tpqoa(object):
             else:
                 # freq = 'D'
                 freq = f"{int(MAX_REQUEST_COUNT * multiplier / float(1440))}D"
-            data = pd.DataFrame()
             dr = pd.date_range(start, end, freq=freq)
 
+            batches = []
             for t in range(len(dr)):
                 batch_start = self.transform_datetime(dr[t])
                 if t != len(dr) - 1:
                     batch_end = self.transform_datetime(dr[t + 1])
                 else:
                     batch_end = self.transform_datetime(end)
-
-                batch = self.retrieve_data(instrument, batch_start, batch_end,
-                                           granularity, price)
-                data = pd.concat([data, batch])
-        else:
-            start = self.transform_datetime(start)
-            end = self.transform_datetime(end)
-            data = self.retrieve_data(instrument, start, end,
+                batches.append((batch_start, batch_end))
+            return batches
+        return [(self.transform_datetime(start), self.transform_datetime(end))]
+
+    def _iter_batches(self, instrument, start, end, granularity, price,
+                      max_workers=None):
+        ''' Yields the non-empty batches of historical data for instrument
+        in chronological order. With max_workers, up to that many batches
+        are retrieved ahead concurrently. '''
+        batches = self._history_batches(start, end, granularity)
+
+        def retrieve(batch):
+            return self.retrieve_data(instrument, batch[0], batch[1],
                                       granularity, price)
-        if localize:
-            data.index = data.index.tz_localize(None)
 
-        return data[['o', 'h', 'l', 'c', 'volume', 'complete']]
+        def retrieve_ahead():
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+            pending = deque()
+            try:
+                for batch in batches:
+                    pending.append(executor.submit(retrieve, batch))
+                    # Bound the number of batches held in memory
+                    if len(pending) >= max_workers:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+                executor.shutdown(wait=False)
+
+        if max_workers is not None and len(batches) > 1:
+            results = retrieve_ahead()
+        else:
+            results = (retrieve(batch) for batch in batches)
+
+        last_time = None
+        for data in results:
+            # Consecutive batches share their boundary candle
+            if last_time is not None and len(data) > 0:
+                data = data[data.index > last_time]
+            if len(data) == 0:
+                continue
+            last_time = data.index[-1]
+            yield data
+
+    def _fetch_history(self, instrument, start, end, granularity, price,
+                       max_workers=None):
+        ''' Retrieves historical data for instrument from Oanda,
+        in batches of at most MAX_REQUEST_COUNT candles. With max_workers,
+        the batches are retrieved concurrently by that many threads. '''
+        frames = list(self._iter_batches(instrument, start, end,
+                                         granularity, price, max_workers))
+        if len(frames) == 0:
+            return pd.DataFrame()  # return empty DataFrame if no data
+        if len(frames) == 1:
+            return frames[0]
+        return pd.concat(frames)
+
+    def iter_history(self, instrument, start, end, granularity, price,
+                     localize=True, records=False, max_workers=None):
+        ''' Retrieves historical data for instrument batch by batch,
+        so that long ranges can be processed in constant memory.
+        Parameters
+        ==========
+        instrument: string
+            valid instrument name
+        start, end: datetime, str
+            Python datetime or string objects for start and end
+        granularity: string
+            a string like 'S5', 'M1' or 'D'
+        price: string
+            one of 'A' (ask), 'B' (bid) or 'M' (middle)
+        localize: boolean
+            whether to drop the UTC timezone from the index
+        records: boolean
+            whether to yield NumPy record arrays instead of DataFrames
+        max_workers: int
+            if set, up to max_workers batches are retrieved ahead
+            concurrently
+        Yields
+        ======
+        data: pd.DataFrame or np.recarray
+            the candles of one batch, in chronological order
+        '''
+        for data in self._iter_batches(instrument, start, end,
+                                       granularity, price, max_workers):
+            if localize:
+                data.index = data.index.tz_localize(None)
+            data = data[['o', 'h', 'l', 'c', 'volume', 'complete']]
+            yield data.to_records() if records else data
 
     def create_order(self, instrument, units, price=None, sl_distance=None,
                      tsl_distance=None, tp_price=None, comment=None,
-                     touch=False, suppress=False, ret=False):
+                     touch=False, suppress=False, ret=False, client_id=None):
         ''' Places order with Oanda.
         Parameters
         ==========
@@ -266,9 +477,28 @@ class tpqoa(object):
             whether to suppress print out
         ret: boolean
             whether to return the order object
+        client_id: str
+            client-side ID of the order, echoed in its transactions
         '''
+        request = self._submit_order(instrument, units, price, sl_distance,
+                                     tsl_distance, tp_price, comment, touch,
+                                     client_id)
+        order = self.order_transaction(request)
+
+        if not suppress and order is not None:
+            print('\n\n', order.dict(), '\n')
+        if ret is True:
+            return order.dict() if order is not None else None
+
+    def _submit_order(self, instrument, units, price=None, sl_distance=None,
+                      tsl_distance=None, tp_price=None, comment=None,
+                      touch=False, client_id=None):
+        ''' Sends an order request and returns the v20 response,
+        without printing (see create_order for the parameters). '''
         client_ext = ClientExtensions(
             comment=comment) if comment is not None else None
+        order_ext = ClientExtensions(
+            id=client_id) if client_id is not None else None
         sl_details = (StopLossDetails(distance=sl_distance,
                                       clientExtensions=client_ext)
                       if sl_distance is not None else None)
@@ -286,6 +516,7 @@ class tpqoa(object):
                 stopLossOnFill=sl_details,
                 trailingStopLossOnFill=tsl_details,
                 takeProfitOnFill=tp_details,
+                clientExtensions=order_ext
             )
         elif touch:
             request = self.ctx.order.market_if_touched(
@@ -295,7 +526,8 @@ class tpqoa(object):
                 units=units,
                 stopLossOnFill=sl_details,
                 trailingStopLossOnFill=tsl_details,
-                takeProfitOnFill=tp_details
+                takeProfitOnFill=tp_details,
+                clientExtensions=order_ext
             )
         else:
             request = self.ctx.order.limit(
@@ -305,24 +537,26 @@ class tpqoa(object):
                 units=units,
                 stopLossOnFill=sl_details,
                 trailingStopLossOnFill=tsl_details,
-                takeProfitOnFill=tp_details
+                takeProfitOnFill=tp_details,
+                clientExtensions=order_ext
             )
+        return request
 
+    @staticmethod
+    def order_transaction(response):
+        ''' Returns the reject, fill or create transaction of an order
+        response, in this order of precedence, or None. '''
         # First checking if the order is rejected
-        if 'orderRejectTransaction' in request.body:
-            order = request.get('orderRejectTransaction')
-        elif 'orderFillTransaction' in request.body:
-            order = request.get('orderFillTransaction')
-        elif 'orderCreateTransaction' in request.body:
-            order = request.get('orderCreateTransaction')
+        if 'orderRejectTransaction' in response.body:
+            order = response.get('orderRejectTransaction')
+        elif 'orderFillTransaction' in response.body:
+            order = response.get('orderFillTransaction')
+        elif 'orderCreateTransaction' in response.body:
+            order = response.get('orderCreateTransaction')
         else:
             # This case does not happen.  But keeping this for completeness.
             order = None
-
-        if not suppress and order is not None:
-            print('\n\n', order.dict(), '\n')
-        if ret is True:
-            return order.dict() if order is not None else None
+        return order
 
     def stream_data(self, instrument, stop=None, ret=False, callback=None):
         ''' Starts a real-time data stream.
@@ -330,6 +564,13 @@ class tpqoa(object):
         ==========
         instrument: string
             valid instrument name
+        stop: int
+            number of ticks after which the stream is stopped
+        ret: boolean
+            whether to return the received messages (kept in memory)
+        callback: callable
+            called as callback(instrument, time, bid, ask) for every tick,
+            e.g. ticks.TickAggregator.on_tick to buffer ticks into bars
         '''
         self.stream_instrument = instrument
         self.ticks = 0
@@ -338,7 +579,9 @@ class tpqoa(object):
             instruments=instrument)
         msgs = []
         for msg_type, msg in response.parts():
-            msgs.append(msg)
+            # Messages are only kept when returned, to bound memory
+            if ret:
+                msgs.append(msg)
             # print(msg_type, msg)
             if msg_type == 'pricing.ClientPrice':
                 self.ticks += 1
@@ -365,11 +608,16 @@ class tpqoa(object):
         try:
             print("Starting price streaming")
             self.stream_data(args[0], callback=args[1])
+            self._stream_failures = 0
         except Exception as e:
             import sys
             import traceback
             print(traceback.format_exc())
-            sleep(3)
+            # Jittered exponential backoff before the job loop reconnects
+            failures = getattr(self, '_stream_failures', 0)
+            self.ctx_stream.record_retry('pricing_stream')
+            sleep(random.uniform(0, min(60, 2 ** failures)))
+            self._stream_failures = failures + 1
             return
 
     def stream_data_failsafe(self, instrument, callback=None):
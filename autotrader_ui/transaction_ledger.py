@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Local Transaction Ledger.
+
+Append-only SQLite copy of the OANDA account transactions. Each sync only
+requests the transactions newer than the last stored ID, and queries are
+answered from the local copy.
+
+Usage:
+    ledger = TransactionLedger("transactions.sqlite")
+    ledger.sync(get_oanda_client())
+    fills = ledger.query(api.account_id, instrument="EUR_USD")
+
+Todo:
+    * ...
+"""
+
+# Built-in modules
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Third-party modules
+import pandas as pd
+
+# Local modules
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    account_id TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    time TEXT NOT NULL,
+    type TEXT,
+    instrument TEXT,
+    units REAL,
+    pl REAL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (account_id, id)
+);
+CREATE INDEX IF NOT EXISTS transactions_instrument
+    ON transactions (account_id, instrument, time);
+CREATE INDEX IF NOT EXISTS transactions_time
+    ON transactions (account_id, time);
+"""
+
+
+def _to_rfc3339(value) -> str:
+    """Formats a date like the times sent by OANDA, for comparisons."""
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert("UTC").tz_localize(None)
+    return ts.strftime(TIME_FORMAT) + "000Z"
+
+
+def _to_float(value):
+    return float(value) if value is not None else None
+
+
+class TransactionLedger(object):
+    """SQLite ledger of the transactions of one or several accounts.
+
+    Args:
+        path (str, optional): SQLite database file. Defaults to "transactions.sqlite".
+    """
+
+    def __init__(self, path: str = "transactions.sqlite"):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:  # Commits, or rolls back on errors
+                yield conn
+        finally:
+            conn.close()
+
+    def last_id(self, account_id: str) -> int:
+        """Returns the last stored transaction ID of an account, or 0."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT MAX(id) FROM transactions WHERE account_id = ?",
+                (account_id,)).fetchone()
+        return row[0] or 0
+
+    def append(self, account_id: str, transactions: list) -> int:
+        """Stores transactions, as returned by ``tpqoa.get_transactions``.
+
+        Args:
+            account_id (str): Account of the transactions.
+            transactions (list): Transaction dictionaries.
+
+        Returns:
+            int: Number of transactions which were not stored yet.
+        """
+        rows = [(account_id, int(t["id"]), t["time"], t.get("type"),
+                 t.get("instrument"), _to_float(t.get("units")),
+                 _to_float(t.get("pl")), json.dumps(t))
+                for t in transactions]
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO transactions VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            return conn.total_changes - before
+
+    def sync(self, api) -> int:
+        """Retrieves the transactions newer than the last stored one.
+
+        Args:
+            api (tpqoa): Client of the account to synchronize.
+
+        Returns:
+            int: Number of new transactions.
+        """
+        # One sync at a time, so that IDs are only requested once
+        with self._lock:
+            added = 0
+            while True:
+                transactions = api.get_transactions(
+                    tid=self.last_id(api.account_id))
+                new = self.append(api.account_id, transactions)
+                if new == 0:
+                    return added
+                added += new
+
+    def _where(self, account_id: str, instrument: str, start, end,
+               types: list) -> tuple:
+        clauses, params = ["account_id = ?"], [account_id]
+        if instrument is not None:
+            clauses.append("instrument = ?")
+            params.append(instrument)
+        if start is not None:
+            clauses.append("time >= ?")
+            params.append(_to_rfc3339(start))
+        if end is not None:
+            clauses.append("time <= ?")
+            params.append(_to_rfc3339(end))
+        if types is not None:
+            clauses.append(f"type IN ({', '.join('?' * len(types))})")
+            params.extend(types)
+        return " AND ".join(clauses), params
+
+    def query(self, account_id: str, instrument: str = None, start=None,
+              end=None, types: list = None) -> list:
+        """Returns the stored transactions matching the filters.
+
+        Args:
+            account_id (str): Account of the transactions.
+            instrument (str, optional): Instrument name. Defaults to None (all).
+            start (datetime, str, optional): Earliest time, UTC. Defaults to None.
+            end (datetime, str, optional): Latest time, UTC. Defaults to None.
+            types (list, optional): Transaction types, e.g. ['ORDER_FILL']. Defaults to None (all).
+
+        Returns:
+            list: Transaction dictionaries, by increasing ID.
+        """
+        where, params = self._where(account_id, instrument, start, end, types)
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT data FROM transactions WHERE {where} ORDER BY id",
+                params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def to_frame(self, account_id: str, instrument: str = None, start=None,
+                 end=None, types: list = None) -> pd.DataFrame:
+        """Same as ``query``, as a DataFrame of the indexed columns."""
+        where, params = self._where(account_id, instrument, start, end, types)
+        with self._connect() as conn:
+            data = pd.read_sql_query(
+                "SELECT id, time, type, instrument, units, pl "
+                f"FROM transactions WHERE {where} ORDER BY id", conn,
+                params=params)
+        data["time"] = pd.to_datetime(data["time"])
+        return data.set_index("id")
+
+    def realized_pl(self, account_id: str, instrument: str = None,
+                    start=None, end=None) -> float:
+        """Returns the realized profit/loss of the matching transactions."""
+        where, params = self._where(account_id, instrument, start, end, None)
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT SUM(pl) FROM transactions WHERE {where}",
+                params).fetchone()
+        return row[0] or 0.
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+"""Shared fixtures: a local OANDA stand-in server and a tpqoa config for it,
+an in-memory Firestore client and a local document cache."""
+
+# Third-party modules
+import pytest
+
+# Local modules
+from autotrader_ui import db_utils
+from autotrader_ui.doc_cache import DocumentCache
+from autotrader_ui.metrics import MetricsRegistry
+from autotrader_ui.oanda_standin import StandinConfig, StandinServer
+from firestore_fake import FakeFirestore
+
+
+@pytest.fixture
+def standin():
+    """Stand-in server answering immediately, in a background thread."""
+    with StandinServer(config=StandinConfig(tick_interval=.02,
+                                            seed=0)) as server:
+        yield server
+
+
+@pytest.fixture
+def standin_config(standin, tmp_path):
+    """Path of a tpqoa configuration file targeting the stand-in."""
+    return standin.write_config(str(tmp_path / "standin.cfg"))
+
+
+@pytest.fixture
+def firestore_db():
+    """Empty in-memory Firestore client."""
+    return FakeFirestore()
+
+
+@pytest.fixture
+def document_cache(tmp_path, monkeypatch):
+    """Document cache in a temporary file, used by db_utils."""
+    cache = DocumentCache(str(tmp_path / "documents.sqlite"),
+                          metrics=MetricsRegistry())
+    monkeypatch.setattr(db_utils, "get_document_cache", lambda: cache)
+    return cache
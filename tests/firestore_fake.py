@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+
+"""In-memory stand-in of the Firestore client, for the db_utils tests.
+
+Implements the subset of the ``google.cloud.firestore`` API used by the
+app: document references and snapshots with field masks and update times,
+subcollections, projected, ordered and paginated queries, write batches,
+``get_all`` and transactions. Reads and writes are counted, so that tests can check
+what is transferred.
+"""
+
+# Built-in modules
+import copy
+import datetime as dt
+import itertools
+import threading
+
+# Third-party modules
+from google.api_core.exceptions import Aborted, NotFound
+from google.cloud.firestore_v1.field_path import FieldPath
+
+# Local modules
+
+MAX_BATCH_WRITES = 500
+_MISSING = object()
+
+
+def _parts(path: str) -> tuple:
+    return FieldPath.from_string(path).parts
+
+
+def _get(data: dict, parts: tuple, default=_MISSING):
+    for part in parts:
+        if not isinstance(data, dict) or part not in data:
+            return default
+        data = data[part]
+    return data
+
+
+def _set(data: dict, parts: tuple, value):
+    for part in parts[:-1]:
+        data = data.setdefault(part, {})
+    data[parts[-1]] = value
+
+
+def _project(data: dict, field_paths: list) -> dict:
+    projected = {}
+    for path in field_paths:
+        parts = _parts(path)
+        value = _get(data, parts)
+        if value is not _MISSING:
+            _set(projected, parts, copy.deepcopy(value))
+    return projected
+
+
+def _merge(target: dict, data: dict):
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = copy.deepcopy(value)
+
+
+class WriteResult(object):
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+class FakeSnapshot(object):
+    def __init__(self, reference, data, update_time, field_paths=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self.update_time = update_time
+        if data is not None and field_paths is not None:
+            data = _project(data, field_paths)
+        self._data = copy.deepcopy(data)
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+    def get(self, field_path: str):
+        value = _get(self._data or {}, _parts(field_path))
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+
+class FakeDocumentReference(object):
+    def __init__(self, client, path: str):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def __eq__(self, other):
+        return isinstance(other, FakeDocumentReference) \
+            and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def collection(self, name: str):
+        return FakeCollectionReference(self._client, f"{self.path}/{name}")
+
+    def get(self, field_paths=None, transaction=None):
+        snapshot = self._client._read(self, field_paths)
+        if transaction is not None:
+            transaction._reads.setdefault(self.path, snapshot.update_time)
+        return snapshot
+
+    def set(self, data: dict, merge: bool = False):
+        return self._client._apply([("set", self, data, merge)])
+
+    def update(self, fields: dict):
+        return self._client._apply([("update", self, fields, False)])
+
+    def delete(self):
+        return self._client._apply([("delete", self, None, False)])
+
+
+class FakeQuery(object):
+    def __init__(self, client, path: str, fields=None, orders=(),
+                 cursor=None, limit=None):
+        self._client = client
+        self._path = path
+        self._fields = fields
+        self._orders = tuple(orders)
+        self._cursor = cursor
+        self._limit = limit
+
+    def _copy(self, **changes):
+        state = {"fields": self._fields, "orders": self._orders,
+                 "cursor": self._cursor, "limit": self._limit}
+        state.update(changes)
+        return FakeQuery(self._client, self._path, **state)
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING"):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def start_after(self, snapshot):
+        return self._copy(cursor=snapshot)
+
+    def limit(self, count: int):
+        return self._copy(limit=count)
+
+    def _key(self, doc_id: str, data: dict) -> tuple:
+        return tuple(_get(data, _parts(path)) for path, _ in self._orders) \
+            + (doc_id,)
+
+    def stream(self):
+        with self._client._lock:
+            documents = self._client._collection(self._path)
+        rows = []
+        for doc_id, (data, _) in documents.items():
+            key = self._key(doc_id, data)
+            if _MISSING not in key:  # Missing sort fields are left out
+                rows.append((key, doc_id))
+        descending = any(direction == "DESCENDING"
+                         for _, direction in self._orders)
+        rows.sort(reverse=descending)
+        if self._cursor is not None:
+            with self._client._lock:
+                data, _ = self._client._documents[self._cursor.reference.path]
+            cursor = self._key(self._cursor.id, data)
+            rows = [row for row in rows
+                    if (row[0] < cursor if descending else row[0] > cursor)]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        for _, doc_id in rows:
+            ref = FakeDocumentReference(self._client,
+                                        f"{self._path}/{doc_id}")
+            fields = self._fields
+            if fields == ["__name__"]:
+                fields = []
+            yield self._client._read(ref, fields)
+
+    def get(self):
+        return list(self.stream())
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, client, path: str):
+        super().__init__(client, path)
+        self.id = path.rsplit("/", 1)[-1]
+
+    def document(self, doc_id: str):
+        return FakeDocumentReference(self._client, f"{self._path}/{doc_id}")
+
+    def list_documents(self):
+        with self._client._lock:
+            ids = list(self._client._collection(self._path))
+        return [self.document(doc_id) for doc_id in ids]
+
+
+class FakeWriteBatch(object):
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference, data: dict, merge: bool = False):
+        self._writes.append(("set", reference, data, merge))
+
+    def update(self, reference, fields: dict):
+        self._writes.append(("update", reference, fields, False))
+
+    def delete(self, reference):
+        self._writes.append(("delete", reference, None, False))
+
+    def commit(self):
+        if len(self._writes) > MAX_BATCH_WRITES:
+            raise ValueError("maximum 500 writes allowed per request")
+        self._client.batches.append(len(self._writes))
+        return self._client._apply(self._writes)
+
+
+class FakeTransaction(FakeWriteBatch):
+    """Optimistic transaction, run by ``firestore.transactional``.
+
+    The commit is aborted, and retried by the decorator, when a document
+    read in the transaction was written since.
+    """
+
+    def __init__(self, client, max_attempts: int = 5):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._read_only = False
+        self._id = None
+        self._reads = {}  # path: update_time when first read
+
+    def _clean_up(self):
+        self._writes = []
+        self._reads = {}
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._id = next(self._client._clock)
+
+    def _rollback(self):
+        self._clean_up()
+
+    def _commit(self):
+        try:
+            if self._writes:
+                self._client.batches.append(len(self._writes))
+                return self._client._apply(self._writes, self._reads)
+        except Aborted:
+            self._client.aborts += 1
+            raise
+        finally:
+            self._clean_up()
+
+
+class FakeFirestore(object):
+    """Thread-safe in-memory Firestore client."""
+
+    def __init__(self):
+        self._documents = {}  # path: (data, update_time)
+        self._lock = threading.Lock()
+        self._clock = itertools.count(1)
+        self.reads = []  # (path, field_paths) of every document read
+        self.batches = []  # Number of writes of every committed batch
+        self.fail_after = None  # Writes accepted before failing
+        self.aborts = 0  # Number of aborted transaction commits
+
+    def collection(self, path: str):
+        return FakeCollectionReference(self, path)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def transaction(self, max_attempts: int = 5):
+        return FakeTransaction(self, max_attempts)
+
+    def get_all(self, references, field_paths=None):
+        for reference in references:
+            yield self._read(reference, field_paths)
+
+    def _now(self):
+        return dt.datetime(2023, 1, 1, tzinfo=dt.timezone.utc) + \
+            dt.timedelta(microseconds=next(self._clock))
+
+    def _collection(self, path: str) -> dict:
+        prefix = path + "/"
+        return {key[len(prefix):]: value
+                for key, value in self._documents.items()
+                if key.startswith(prefix) and "/" not in key[len(prefix):]}
+
+    def _read(self, reference, field_paths=None):
+        with self._lock:
+            self.reads.append((reference.path, field_paths))
+            data, update_time = self._documents.get(reference.path,
+                                                    (None, None))
+        return FakeSnapshot(reference, data, update_time, field_paths)
+
+    def _apply(self, writes: list, reads: dict = None):
+        """Applies writes atomically, like a commit.
+
+        Args:
+            writes (list): (method, reference, data, merge) of every write.
+            reads (dict, optional): Update times the documents must still have, by path.
+        """
+        with self._lock:
+            for path, update_time in (reads or {}).items():
+                if self._documents.get(path, (None, None))[1] != update_time:
+                    raise Aborted(f"Document changed since read: {path}")
+            if self.fail_after is not None:
+                if self.fail_after < len(writes):
+                    self.fail_after = None
+                    raise ConnectionError("commit failed")
+                self.fail_after -= len(writes)
+            for method, reference, _, _ in writes:
+                if method == "update" and \
+                        reference.path not in self._documents:
+                    raise NotFound(f"No document to update: {reference.path}")
+            update_time = self._now()
+            for method, reference, data, merge in writes:
+                if method == "delete":
+                    self._documents.pop(reference.path, None)
+                    continue
+                current = self._documents.get(reference.path, (None,))[0]
+                if method == "update":
+                    current = copy.deepcopy(current)
+                    for path, value in data.items():
+                        _set(current, _parts(path), copy.deepcopy(value))
+                elif merge and current is not None:
+                    current = copy.deepcopy(current)
+                    _merge(current, data)
+                else:
+                    current = copy.deepcopy(data)
+                self._documents[reference.path] = (current, update_time)
+        return WriteResult(update_time)
+
+    def paths(self, prefix: str = "") -> list:
+        """Returns the sorted paths of the stored documents."""
+        with self._lock:
+            return sorted(path for path in self._documents
+                          if path.startswith(prefix))
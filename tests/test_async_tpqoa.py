@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+# Built-in modules
+import asyncio
+import threading
+
+# Third-party modules
+import pandas as pd
+
+# Local modules
+from autotrader_ui.async_tpqoa import async_tpqoa
+from autotrader_ui.tpqoa import tpqoa
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_history_matches_tpqoa(standin_config):
+    async def main():
+        async with async_tpqoa(standin_config) as api:
+            return await api.get_history("EUR_USD", "2023-01-02",
+                                         "2023-01-05", "M1", "M")
+
+    expected = tpqoa(standin_config, raw_decoding=True).get_history(
+        "EUR_USD", "2023-01-02", "2023-01-05", "M1", "M")
+    pd.testing.assert_frame_equal(run(main()), expected)
+
+
+def test_requests_run_on_the_dedicated_pool(standin_config):
+    threads = set()
+
+    async def main():
+        async with async_tpqoa(standin_config, max_connections=2) as api:
+            request = api._session.request
+
+            def recording(*args, **kwargs):
+                threads.add(threading.current_thread().name)
+                return request(*args, **kwargs)
+
+            api._session.request = recording
+            return await asyncio.gather(*[api.get_prices("EUR_USD")
+                                          for _ in range(10)])
+
+    prices = run(main())
+    assert len(prices) == 10 and all(bid < ask for _, bid, ask in prices)
+    assert 0 < len(threads) <= 2
+    assert all(name.startswith("async_tpqoa_") for name in threads)
+
+
+def test_streams_do_not_hold_the_request_threads(standin_config):
+    async def main():
+        async with async_tpqoa(standin_config, max_connections=1) as api:
+            stream = api.stream_prices(["EUR_USD", "GBP_USD"])
+            ticks = [await stream.__anext__() for _ in range(4)]
+            # The single request thread is still free while streaming
+            instruments = await asyncio.wait_for(api.get_instruments(), 5)
+            await stream.aclose()
+            return ticks, instruments
+
+    ticks, instruments = run(main())
+    assert {tick[0] for tick in ticks} == {"EUR_USD", "GBP_USD"}
+    assert ("EUR/USD", "EUR_USD") in instruments
+
+
+def test_create_order(standin, standin_config):
+    async def main():
+        async with async_tpqoa(standin_config) as api:
+            return await api.create_order("EUR_USD", 100)
+
+    fill = run(main())
+    assert fill["type"] == "ORDER_FILL"
+    assert standin.state.positions == {"EUR_USD": 100.}
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+# Third-party modules
+import numpy as np
+import pandas as pd
+
+# Local modules
+from autotrader_ui.candle_store import (DEFAULT_ROOT, CandleStore,
+                                        merge_intervals)
+from autotrader_ui.tpqoa import tpqoa
+
+T = pd.Timestamp
+
+
+def candles(start, end, freq="1min", complete=True):
+    index = pd.date_range(start, end, freq=freq, tz="UTC", name="time")
+    values = np.arange(len(index), dtype=float)
+    return pd.DataFrame({"o": values, "h": values + 1, "l": values - 1,
+                         "c": values, "volume": 1, "complete": complete},
+                        index=index)
+
+
+class RecordingFetch(object):
+    """Fake API returning minute candles and recording the requested intervals."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, instrument, start, end, granularity, price):
+        self.calls.append((start, end))
+        return candles(start, end)
+
+
+def test_default_root_does_not_depend_on_the_working_directory():
+    assert DEFAULT_ROOT.endswith(".candle_store")
+    assert CandleStore().root == DEFAULT_ROOT
+    assert DEFAULT_ROOT.startswith("/") or ":" in DEFAULT_ROOT
+
+
+def test_merge_intervals():
+    intervals = [(T("2023-01-02"), T("2023-01-03")),
+                 (T("2023-01-01"), T("2023-01-02")),
+                 (T("2023-01-05"), T("2023-01-06")),
+                 (T("2023-01-04"), T("2023-01-04"))]  # Empty, dropped
+    assert merge_intervals(intervals) == [
+        (T("2023-01-01"), T("2023-01-03")),
+        (T("2023-01-05"), T("2023-01-06"))]
+
+
+def test_coverage_merges_saved_intervals(tmp_path):
+    store = CandleStore(str(tmp_path))
+    store.save("EUR_USD", candles("2023-01-02 00:00", "2023-01-02 01:00"),
+               "2023-01-02 00:00", "2023-01-02 01:00", "M1", "M")
+    store.save("EUR_USD", candles("2023-01-02 03:00", "2023-01-02 04:00"),
+               "2023-01-02 03:00", "2023-01-02 04:00", "M1", "M")
+    store.save("EUR_USD", candles("2023-01-02 01:00", "2023-01-02 02:00"),
+               "2023-01-02 01:00", "2023-01-02 02:00", "M1", "M")
+    assert store.get_coverage("EUR_USD", "M1", "M") == [
+        (T("2023-01-02 00:00"), T("2023-01-02 02:00")),
+        (T("2023-01-02 03:00"), T("2023-01-02 04:00"))]
+    assert store.missing_intervals("EUR_USD", "2023-01-01 23:00",
+                                   "2023-01-02 05:00", "M1", "M") == [
+        (T("2023-01-01 23:00"), T("2023-01-02 00:00")),
+        (T("2023-01-02 02:00"), T("2023-01-02 03:00")),
+        (T("2023-01-02 04:00"), T("2023-01-02 05:00"))]
+    # No temporary file is left behind
+    partition = tmp_path / "EUR_USD" / "M1" / "M"
+    assert not [p for p in partition.iterdir() if p.suffix == ".tmp"]
+
+
+def test_read_through_only_fetches_partial_gaps(tmp_path):
+    store = CandleStore(str(tmp_path))
+    fetch = RecordingFetch()
+    first = store.read_through(fetch, "EUR_USD", "2023-01-02 01:00",
+                               "2023-01-02 02:00", "M1", "M")
+    assert fetch.calls == [(T("2023-01-02 01:00"), T("2023-01-02 02:00"))]
+    assert len(first) == 61
+
+    fetch.calls.clear()
+    data = store.read_through(fetch, "EUR_USD", "2023-01-02 00:30",
+                              "2023-01-02 03:00", "M1", "M")
+    assert fetch.calls == [(T("2023-01-02 00:30"), T("2023-01-02 01:00")),
+                           (T("2023-01-02 02:00"), T("2023-01-02 03:00"))]
+    assert data.index.is_monotonic_increasing and data.index.is_unique
+    assert data.index[0] == T("2023-01-02 00:30", tz="UTC")
+    assert data.index[-1] == T("2023-01-02 03:00", tz="UTC")
+
+    fetch.calls.clear()
+    again = store.read_through(fetch, "EUR_USD", "2023-01-02 00:30",
+                               "2023-01-02 03:00", "M1", "M")
+    assert fetch.calls == []
+    pd.testing.assert_frame_equal(again, data)
+
+
+def test_incomplete_candles_are_fetched_again(tmp_path):
+    store = CandleStore(str(tmp_path))
+    data = candles("2023-01-02 00:00", "2023-01-02 01:00")
+    data.loc[data.index[-10:], "complete"] = False
+    store.save("EUR_USD", data, "2023-01-02 00:00", "2023-01-02 01:00",
+               "M1", "M")
+    assert store.missing_intervals("EUR_USD", "2023-01-02 00:00",
+                                   "2023-01-02 01:00", "M1", "M") == [
+        (T("2023-01-02 00:51"), T("2023-01-02 01:00"))]
+
+
+def test_future_is_never_covered(tmp_path):
+    store = CandleStore(str(tmp_path))
+    end = pd.Timestamp.now("UTC").tz_localize(None) + pd.Timedelta(days=1)
+    store.save("EUR_USD", pd.DataFrame(), end - pd.Timedelta(days=2), end,
+               "M1", "M")
+    (_, covered_end), = store.get_coverage("EUR_USD", "M1", "M")
+    assert covered_end < end
+
+
+def test_get_history_reads_through_the_store(standin, standin_config,
+                                             tmp_path):
+    store = CandleStore(str(tmp_path))
+    api = tpqoa(standin_config, raw_decoding=True)
+    direct = api.get_history("EUR_USD", "2023-01-02 00:00",
+                             "2023-01-02 06:00", "M5", "M")
+    stored = api.get_history("EUR_USD", "2023-01-02 00:00",
+                             "2023-01-02 06:00", "M5", "M", store=store)
+    requests = standin.state.requests
+    cached = api.get_history("EUR_USD", "2023-01-02 00:00",
+                             "2023-01-02 06:00", "M5", "M", store=store)
+    assert standin.state.requests == requests
+    pd.testing.assert_frame_equal(stored, direct, check_dtype=False)
+    pd.testing.assert_frame_equal(cached, stored)
+
+
+def _save_hour(root, hour):
+    start = T("2023-01-02") + pd.Timedelta(hours=hour)
+    end = start + pd.Timedelta(hours=1)
+    CandleStore(root).save("EUR_USD", candles(start, end), start, end,
+                           "M1", "M")
+
+
+def test_concurrent_processes_keep_each_others_coverage(tmp_path):
+    import multiprocessing
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_save_hour,
+                                 args=(str(tmp_path), hour))
+                 for hour in range(0, 12, 2)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert all(process.exitcode == 0 for process in processes)
+    coverage = CandleStore(str(tmp_path)).get_coverage("EUR_USD", "M1", "M")
+    assert coverage == [(T("2023-01-02") + pd.Timedelta(hours=hour),
+                         T("2023-01-02") + pd.Timedelta(hours=hour + 1))
+                        for hour in range(0, 12, 2)]
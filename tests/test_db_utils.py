@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+# Built-in modules
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Third-party modules
+import pytest
+from google.api_core.exceptions import NotFound
+
+# Local modules
+from autotrader_ui import db_utils
+
+
+def test_commit_in_batches_splits_writes(firestore_db):
+    col_ref = firestore_db.collection("Backtest")
+    operations = (("set", col_ref.document(f"bt{i:04d}"), ({"i": i},))
+                  for i in range(1201))
+
+    assert db_utils._commit_in_batches(firestore_db, operations) == 1201
+    assert firestore_db.batches == [500, 500, 201]
+    assert len(firestore_db.paths("Backtest/")) == 1201
+
+
+def test_commit_in_batches_without_operations(firestore_db):
+    assert db_utils._commit_in_batches(firestore_db, iter(())) == 0
+    assert firestore_db.batches == []
+
+
+def test_commit_in_batches_exact_multiple(firestore_db):
+    col_ref = firestore_db.collection("Backtest")
+    db_utils._commit_in_batches(firestore_db, [
+        ("set", col_ref.document(str(i)), ({},)) for i in range(1000)])
+
+    assert firestore_db.batches == [500, 500]
+
+
+def test_bulk_create_update_delete(firestore_db):
+    documents = {f"bt{i:03d}": {"status": "Ready to start",
+                                "execution": {"status": "new", "n": i}}
+                 for i in range(600)}
+
+    assert db_utils.bulk_create(firestore_db, "Backtest", documents) == 600
+    updated = db_utils.bulk_update(firestore_db, "Backtest", {
+        name: {"execution.status": "done"} for name in documents})
+    assert updated == 600
+    assert firestore_db.batches == [500, 100, 500, 100]
+
+    doc = firestore_db.collection("Backtest").document("bt042").get()
+    # Field paths only replace the nested field
+    assert doc.to_dict() == {"status": "Ready to start",
+                             "execution": {"status": "done", "n": 42}}
+
+    deleted = db_utils.bulk_delete(firestore_db, "Backtest",
+                                   list(documents)[:550])
+    assert deleted == 550
+    assert firestore_db.paths("Backtest/") == [
+        f"Backtest/bt{i:03d}" for i in range(550, 600)]
+
+
+def test_bulk_update_of_missing_document_fails(firestore_db):
+    db_utils.bulk_create(firestore_db, "Backtest", {"a": {"status": "x"}})
+
+    with pytest.raises(NotFound):
+        db_utils.bulk_update(firestore_db, "Backtest", {
+            "a": {"status": "y"}, "missing": {"status": "y"}})
+    # The batch is atomic
+    doc = firestore_db.collection("Backtest").document("a").get()
+    assert doc.get("status") == "x"
+
+
+def test_update_specific_live_merges(firestore_db):
+    db_utils.create_live(firestore_db, "agent", {
+        "status": "Running", "execution": {"instrument": "EUR_USD",
+                                           "capital": 1000}})
+
+    db_utils.update_specific_live(firestore_db, "agent", {
+        "execution": {"capital": 1100}, "last_update": "now"})
+
+    assert db_utils.get_specific_live(firestore_db, "agent") == {
+        "status": "Running", "last_update": "now",
+        "execution": {"instrument": "EUR_USD", "capital": 1100}}
+
+
+def test_status_updates(firestore_db, document_cache):
+    db_utils.create_live(firestore_db, "agent", {"status": "Running"})
+    db_utils.create_backtest(firestore_db, "bt", {"status": "Ready to start",
+                                                  "created_at": "1"})
+
+    db_utils.update_live_status(firestore_db, "agent", "Stopped",
+                                stopped_at="2")
+    db_utils.update_backtest_status(firestore_db, "bt", "Done")
+
+    assert db_utils.get_specific_live(firestore_db, "agent") == {
+        "status": "Stopped", "stopped_at": "2"}
+    assert db_utils.get_specific_backtest(firestore_db, "bt") == {
+        "status": "Done", "created_at": "1"}
+    with pytest.raises(NotFound):
+        db_utils.update_backtest_status(firestore_db, "missing", "Done")
+
+
+def test_list_documents_pages(firestore_db):
+    db_utils.bulk_create(firestore_db, "Backtest", {
+        f"bt{i}": {"status": "s", "created_at": f"2023-01-{i + 1:02d}",
+                   "agent_config": {"big": "x" * 100}}
+        for i in range(7)})
+    firestore_db.collection("Backtest").document("undated").set({})
+
+    pages, cursor = [], None
+    while True:
+        page, cursor = db_utils.get_backtests_summary(
+            firestore_db, limit=3, start_after=cursor)
+        pages.append(list(page))
+        if cursor is None:
+            break
+
+    # Newest first, without the undated document, nor the other fields
+    assert pages == [["bt6", "bt5", "bt4"], ["bt3", "bt2", "bt1"], ["bt0"]]
+    assert page["bt0"] == {"status": "s", "created_at": "2023-01-01"}
+    assert db_utils.get_all_experiments_name(firestore_db) == []
+    assert db_utils.list_documents(firestore_db, "Backtest", fields=[])[0][
+        "bt3"] == {}
+
+
+def test_claim_backtest(firestore_db, document_cache):
+    db_utils.create_backtest(firestore_db, "bt", {"status": "Ready to start"})
+
+    assert db_utils.claim_backtest(firestore_db, "bt")
+    assert not db_utils.claim_backtest(firestore_db, "bt")
+    assert not db_utils.claim_backtest(firestore_db, "missing")
+    assert firestore_db.collection("Backtest").document("bt").get().to_dict() \
+        == {"status": "Running"}
+    assert db_utils.claim_backtest(firestore_db, "bt", "Running", "Done")
+
+
+def test_competing_claims_have_one_winner(firestore_db, document_cache):
+    db_utils.create_backtest(firestore_db, "bt", {"status": "Ready to start"})
+    # Both workers read the status before either commits
+    barrier = threading.Barrier(2)
+    first_reads = iter(range(2))
+    read = firestore_db._read
+
+    def interleaved(reference, field_paths=None):
+        snapshot = read(reference, field_paths)
+        if next(first_reads, None) is not None:
+            barrier.wait(timeout=5)
+        return snapshot
+
+    firestore_db._read = interleaved
+    with ThreadPoolExecutor(2) as executor:
+        claims = list(executor.map(
+            lambda _: db_utils.claim_backtest(firestore_db, "bt"), range(2)))
+
+    assert sorted(claims) == [False, True]
+    assert firestore_db.aborts == 1  # The loser retried and saw "Running"
+    assert firestore_db.collection("Backtest").document("bt").get().get(
+        "status") == "Running"
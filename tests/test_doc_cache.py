@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+# Built-in modules
+import os
+
+# Local modules
+from autotrader_ui import db_utils
+from autotrader_ui.doc_cache import DocumentCache, version_key
+from autotrader_ui.metrics import MetricsRegistry
+
+
+def lookups(cache: DocumentCache, result: str,
+            namespace: str = "document") -> int:
+    return cache.metrics.counter("doc_cache.lookups", namespace=namespace,
+                                 result=result).value
+
+
+def full_reads(db, path: str) -> int:
+    return sum(1 for read, fields in db.reads
+               if read == path and fields is None)
+
+
+def test_hit_only_reads_metadata(firestore_db, document_cache):
+    doc_ref = firestore_db.collection("Backtest").document("bt")
+    doc_ref.set({"status": "Ready to start"})
+
+    assert document_cache.get(doc_ref) == {"status": "Ready to start"}
+    assert document_cache.get(doc_ref) == {"status": "Ready to start"}
+
+    assert lookups(document_cache, "miss") == 1
+    assert lookups(document_cache, "hit") == 1
+    assert full_reads(firestore_db, "Backtest/bt") == 1
+    # The revalidation transfers no field
+    assert firestore_db.reads.count(("Backtest/bt", [])) == 2
+
+
+def test_revalidated_by_update_time(firestore_db, document_cache):
+    doc_ref = firestore_db.collection("Backtest").document("bt")
+    doc_ref.set({"status": "Ready to start"})
+    document_cache.get(doc_ref)
+
+    doc_ref.update({"status": "Running"})
+
+    assert document_cache.get(doc_ref) == {"status": "Running"}
+    assert lookups(document_cache, "stale") == 1
+    stored_time, _ = document_cache.lookup("Backtest/bt")
+    assert stored_time == version_key(doc_ref.get().update_time)
+    assert document_cache.get(doc_ref) == {"status": "Running"}
+    assert lookups(document_cache, "hit") == 1
+
+
+def test_missing_document_is_invalidated(firestore_db, document_cache):
+    doc_ref = firestore_db.collection("Backtest").document("bt")
+    doc_ref.set({"status": "Ready to start"})
+    document_cache.get(doc_ref)
+
+    doc_ref.delete()
+
+    assert document_cache.get(doc_ref) is None
+    assert document_cache.lookup("Backtest/bt") is None
+    assert lookups(document_cache, "missing") == 1
+
+
+def test_namespaces_share_the_document_version(firestore_db, document_cache):
+    doc_ref = firestore_db.collection("Experiment").document("exp")
+    doc_ref.set({"exp": {"transactions": {"t": 1}}})
+
+    def load(snapshot):
+        return len(snapshot.to_dict()["exp"]["transactions"])
+
+    assert document_cache.get(doc_ref) == {"exp": {"transactions": {"t": 1}}}
+    assert document_cache.get(doc_ref, load, namespace="count") == 1
+    assert document_cache.get(doc_ref, load, namespace="count") == 1
+    assert lookups(document_cache, "hit", "count") == 1
+
+    doc_ref.set({"exp": {"transactions": {"t": 1, "u": 2}}})
+    assert document_cache.get(doc_ref, load, namespace="count") == 2
+    assert lookups(document_cache, "stale", "count") == 1
+    # Invalidating a document drops all its namespaces
+    document_cache.invalidate("Experiment/exp")
+    assert document_cache.lookup("Experiment/exp") is None
+    assert document_cache.lookup("Experiment/exp", "count") is None
+
+
+def test_survives_reopening(firestore_db, tmp_path):
+    path = str(tmp_path / "documents.sqlite")
+    doc_ref = firestore_db.collection("Backtest").document("bt")
+    doc_ref.set({"status": "Ready to start"})
+    DocumentCache(path, metrics=MetricsRegistry()).get(doc_ref)
+
+    cache = DocumentCache(path, metrics=MetricsRegistry())
+    assert cache.get(doc_ref) == {"status": "Ready to start"}
+    assert lookups(cache, "hit") == 1
+
+
+def test_write_through_and_delete(firestore_db, document_cache):
+    db_utils.create_backtest(firestore_db, "bt", {"status": "Ready to start"})
+
+    assert db_utils.get_specific_backtest(firestore_db, "bt") == {
+        "status": "Ready to start"}
+    assert lookups(document_cache, "hit") == 1
+    assert full_reads(firestore_db, "Backtest/bt") == 0
+
+    db_utils.delete_backtest(firestore_db, "bt")
+    assert document_cache.lookup("Backtest/bt") is None
+
+
+def test_experiment_transactions_follow_rewrites(firestore_db,
+                                                 document_cache):
+    data = {"exp": {"failure": None,
+                    "transactions": {"2023-01-01 00:00:00": {"price": 1.}}}}
+    db_utils.create_experiment(firestore_db, "exp", data)
+    assert db_utils.get_experiment_transactions(firestore_db, "exp") == \
+        data["exp"]["transactions"]
+    assert db_utils.get_experiment_transactions(firestore_db, "exp") == \
+        data["exp"]["transactions"]
+    assert lookups(document_cache, "hit", "transactions") == 1
+
+    data["exp"]["transactions"]["2023-01-01 00:01:00"] = {"price": 2.}
+    db_utils.create_experiment(firestore_db, "exp", data)
+
+    assert db_utils.get_experiment_transactions(firestore_db, "exp") == \
+        data["exp"]["transactions"]
+    assert lookups(document_cache, "stale", "transactions") == 1
+
+
+def test_default_path_does_not_depend_on_the_working_directory():
+    assert os.path.isabs(db_utils.DOCUMENT_CACHE_PATH)
+    assert os.path.dirname(db_utils.DOCUMENT_CACHE_PATH) == \
+        os.path.dirname(os.path.abspath(db_utils.__file__))
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+# Third-party modules
+import pytest
+
+# Local modules
+from autotrader_ui import db_utils
+
+CHUNKS_PREFIX = "Experiment/exp/transactions/"
+
+
+def make_experiment(count: int, price: float = 1.) -> dict:
+    transactions = {f"2023-01-01 {i // 3600:02d}:{i // 60 % 60:02d}:"
+                    f"{i % 60:02d}": {"price": price + i, "units": 1}
+                    for i in range(count)}
+    # Columns missing from some transactions are left out on reading
+    transactions[min(transactions)]["signal"] = "buy"
+    return {"exp": {"execution": {"instrument": "EUR_USD"},
+                    "agent": {"rsi": 50}, "start": "s", "end": "e",
+                    "failure": None, "transactions": transactions}}
+
+
+def test_round_trip(firestore_db, document_cache):
+    data = make_experiment(12001)
+    db_utils.create_experiment(firestore_db, "exp", data)
+
+    summary = db_utils.get_experiment_summary(firestore_db, "exp")
+    assert summary["transactions_count"] == 12001
+    assert summary["transactions_chunks"] == 3
+    assert "transactions" not in summary
+    transactions = db_utils.get_experiment_transactions(firestore_db, "exp")
+    assert transactions == data["exp"]["transactions"]
+    # Inlined again by get_specific_experiment, as in the legacy format
+    assert db_utils.get_specific_experiment(
+        firestore_db, "exp", use_cache=False)["exp"]["transactions"] == \
+        data["exp"]["transactions"]
+
+
+def test_rewrite_replaces_chunks(firestore_db, document_cache):
+    db_utils.create_experiment(firestore_db, "exp", make_experiment(12000))
+    first = db_utils.get_experiment_summary(firestore_db, "exp")
+    data = make_experiment(10, price=2.)
+    db_utils.create_experiment(firestore_db, "exp", data)
+
+    summary = db_utils.get_experiment_summary(firestore_db, "exp")
+    assert summary["transactions_generation"] != \
+        first["transactions_generation"]
+    assert firestore_db.paths(CHUNKS_PREFIX) == [
+        CHUNKS_PREFIX + summary["transactions_generation"] + "-00000"]
+    assert db_utils.get_experiment_transactions(firestore_db, "exp") == \
+        data["exp"]["transactions"]
+
+
+def test_summary_is_written_after_the_chunks(firestore_db, document_cache):
+    data = make_experiment(10)
+    db_utils.create_experiment(firestore_db, "exp", data)
+    writes = []
+    apply = firestore_db._apply
+
+    def record(operations):
+        writes.extend((method, ref.path) for method, ref, _, _ in operations)
+        return apply(operations)
+
+    firestore_db._apply = record
+    db_utils.create_experiment(firestore_db, "exp", make_experiment(10001))
+
+    sets = [path for method, path in writes if method == "set"]
+    deletes = [path for method, path in writes if method == "delete"]
+    assert sets[-1] == "Experiment/exp"
+    assert len(sets) == 4 and len(deletes) == 1
+    assert writes.index(("set", "Experiment/exp")) < \
+        writes.index(("delete", deletes[0]))
+
+
+def test_failed_rewrite_keeps_previous_transactions(firestore_db,
+                                                    document_cache):
+    data = make_experiment(6000)
+    db_utils.create_experiment(firestore_db, "exp", data)
+
+    # The chunks are written, the summary write fails
+    firestore_db.fail_after = 1
+    with pytest.raises(ConnectionError):
+        db_utils.create_experiment(firestore_db, "exp", make_experiment(3))
+
+    assert db_utils.get_experiment_summary(
+        firestore_db, "exp")["transactions_count"] == 6000
+    assert db_utils.get_experiment_transactions(firestore_db, "exp") == \
+        data["exp"]["transactions"]
+    # The orphan chunk is removed with the experiment
+    db_utils.delete_experiment(firestore_db, "exp")
+    assert firestore_db.paths("Experiment/") == []
+
+
+def test_stale_summary_is_refreshed(firestore_db, document_cache):
+    db_utils.create_experiment(firestore_db, "exp", make_experiment(10))
+    summary = db_utils.get_experiment_summary(firestore_db, "exp")
+    data = make_experiment(20, price=3.)
+    db_utils.create_experiment(firestore_db, "exp", data)
+
+    assert db_utils.get_experiment_transactions(
+        firestore_db, "exp", summary, use_cache=False) == \
+        data["exp"]["transactions"]
+
+
+def test_migrate_legacy_experiment(firestore_db, document_cache):
+    data = make_experiment(10)
+    firestore_db.collection("Experiment").document("exp").set(data)
+    assert db_utils.get_experiment_transactions(firestore_db, "exp") == \
+        data["exp"]["transactions"]
+
+    assert db_utils.migrate_experiment(firestore_db, "exp")
+    assert not db_utils.migrate_experiment(firestore_db, "exp")
+
+    doc = firestore_db.collection("Experiment").document("exp").get()
+    assert "transactions" not in doc.to_dict()["exp"]
+    assert len(firestore_db.paths(CHUNKS_PREFIX)) == 1
+    assert db_utils.get_experiment_transactions(firestore_db, "exp") == \
+        data["exp"]["transactions"]
+
+
+def test_unversioned_chunks_are_read_and_replaced(firestore_db,
+                                                  document_cache):
+    doc_ref = firestore_db.collection("Experiment").document("exp")
+    data = make_experiment(10)
+    chunk, = db_utils._transactions_to_chunks(data["exp"]["transactions"])
+    doc_ref.collection("transactions").document("00000").set(chunk)
+    doc_ref.set({"exp": {"transactions_count": 10,
+                         "transactions_chunks": 1}})
+    assert db_utils.get_experiment_transactions(firestore_db, "exp") == \
+        data["exp"]["transactions"]
+
+    db_utils.create_experiment(firestore_db, "exp", make_experiment(5))
+
+    paths = firestore_db.paths(CHUNKS_PREFIX)
+    assert len(paths) == 1 and paths[0].endswith("-00000")
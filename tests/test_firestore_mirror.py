@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+# Built-in modules
+import threading
+import time
+from types import SimpleNamespace
+
+# Local modules
+from autotrader_ui.firestore_mirror import CollectionMirror
+
+
+class FakeWatch(object):
+    def __init__(self, callback):
+        self.callback = callback
+        self.unsubscribed = False
+
+    def unsubscribe(self):
+        self.unsubscribed = True
+
+
+class FakeCollection(object):
+    def __init__(self):
+        self.watch = None
+
+    def on_snapshot(self, callback):
+        self.watch = FakeWatch(callback)
+        return self.watch
+
+
+class FakeDb(object):
+    """Firestore client whose listener is fed by the tests."""
+
+    def __init__(self):
+        self.collections = {}
+
+    def collection(self, name):
+        return self.collections.setdefault(name, FakeCollection())
+
+    def push(self, name, *changes):
+        """Calls the listener with (type, id, data) changes."""
+        changes = [SimpleNamespace(
+            type=SimpleNamespace(name=change_type),
+            document=SimpleNamespace(id=doc_id, to_dict=lambda d=data: d))
+            for change_type, doc_id, data in changes]
+        self.collections[name].watch.callback([], changes, None)
+
+
+def test_mirror_applies_the_change_deltas():
+    db = FakeDb()
+    mirror = CollectionMirror(db, "Backtest", fields=["status"])
+    assert not mirror.wait_ready(timeout=0)
+    assert mirror.snapshot() == {}
+
+    db.push("Backtest", ("ADDED", "a", {"status": "Ready", "big": [1] * 10}),
+            ("ADDED", "b", {"status": "Running"}))
+    assert mirror.wait_ready(timeout=0)
+    assert mirror.version == 1
+    assert mirror.snapshot() == {"a": {"status": "Ready"},
+                                 "b": {"status": "Running"}}
+
+    db.push("Backtest", ("MODIFIED", "a", {"status": "Done"}),
+            ("REMOVED", "b", None))
+    assert mirror.snapshot() == {"a": {"status": "Done"}}
+    assert mirror.get("a") == {"status": "Done"}
+    assert mirror.get("b") is None
+    # Copies, the mirror is not modified by its readers
+    mirror.snapshot()["a"]["status"] = "Changed"
+    assert mirror.get("a") == {"status": "Done"}
+
+    mirror.close()
+    assert db.collections["Backtest"].watch.unsubscribed
+
+
+def test_wait_for_change():
+    db = FakeDb()
+    mirror = CollectionMirror(db, "Live")
+    assert mirror.wait_for_change(0, timeout=.01) == 0
+
+    def push_later():
+        time.sleep(.05)
+        db.push("Live", ("ADDED", "agent", {"status": "Running"}))
+
+    thread = threading.Thread(target=push_later)
+    thread.start()
+    start = time.monotonic()
+    assert mirror.wait_for_change(0, timeout=5) == 1
+    assert time.monotonic() - start < 1
+    thread.join()
+    assert mirror.snapshot() == {"agent": {"status": "Running"}}
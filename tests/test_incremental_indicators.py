@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+# Third-party modules
+import numpy as np
+import pandas as pd
+import pytest
+
+# Local modules
+from autotrader_ui.incremental_indicators import (
+    EMA,
+    MACD,
+    RSI,
+    SMA,
+    EWMean,
+    Indicator,
+    RollingMean,
+    Stochastic
+)
+from autotrader_ui.indicator_engine import IndicatorEngine
+
+HISTORY = 500
+NAN = float("nan")
+
+
+@pytest.fixture
+def bars() -> pd.DataFrame:
+    rng = np.random.default_rng(2)
+    close = 1.1 + rng.normal(0, 1e-3, 1500).cumsum()
+    spread = np.abs(rng.normal(0, 5e-4, (2, 1500)))
+    return pd.DataFrame({"o": close, "h": close + spread[0],
+                         "l": close - spread[1], "c": close,
+                         "volume": rng.integers(1, 100, 1500)},
+                        index=pd.date_range("2023-01-02", periods=1500,
+                                            freq="min"))
+
+
+def test_indicator_is_abstract():
+    with pytest.raises(TypeError):
+        Indicator()
+
+
+def replay(indicator_cls, bars: pd.DataFrame, history: int = HISTORY,
+           **params) -> list:
+    """Seeds an indicator with the first bars, then updates it bar by bar."""
+    indicator = indicator_cls.from_history(bars.iloc[:history], **params)
+    values = [indicator.value]
+    for bar in bars.iloc[history:].itertuples():
+        values.append(indicator.update_bar(
+            (bar.Index, bar.o, bar.h, bar.l, bar.c, bar.volume)))
+    return values
+
+
+def batch_tail(values, history: int = HISTORY) -> np.ndarray:
+    """Batch values from the last bar of the history on."""
+    return np.asarray(values, dtype=np.float64)[history - 1:]
+
+
+@pytest.mark.parametrize("length", [3, 30])
+def test_sma_matches_batch(bars, length):
+    expected = IndicatorEngine(bars).sma(length)
+    np.testing.assert_allclose(replay(SMA, bars, length=length),
+                               batch_tail(expected), rtol=1e-9)
+
+
+@pytest.mark.parametrize("length", [3, 10])
+def test_ema_matches_batch(bars, length):
+    expected = IndicatorEngine(bars).ema(length)
+    np.testing.assert_allclose(replay(EMA, bars, length=length),
+                               batch_tail(expected), rtol=1e-9)
+
+
+def test_rsi_matches_batch(bars):
+    expected = IndicatorEngine(bars).rsi(14)
+    np.testing.assert_allclose(replay(RSI, bars, length=14),
+                               batch_tail(expected), rtol=1e-9)
+
+
+def test_macd_matches_batch(bars):
+    expected = IndicatorEngine(bars).macd(12, 26, 9)
+    values = np.array(replay(MACD, bars))
+    for line, batch in zip(values.T, expected):
+        np.testing.assert_allclose(line, batch_tail(batch), rtol=1e-9,
+                                   atol=1e-12)
+
+
+@pytest.mark.parametrize("mamode", ["sma", "ema"])
+def test_stochastic_matches_batch(bars, mamode):
+    expected = IndicatorEngine(bars).stoch(14, 3, 3, mamode)
+    values = np.array(replay(Stochastic, bars, mamode=mamode))
+    for line, batch in zip(values.T, expected):
+        np.testing.assert_allclose(line, batch_tail(batch), rtol=1e-9)
+
+
+def test_short_history(bars):
+    # Fewer bars than the periods: seeded before any value
+    values = replay(MACD, bars, history=5)
+    expected = IndicatorEngine(bars).macd(12, 26, 9)
+    np.testing.assert_allclose(np.array(values)[:, 0],
+                               batch_tail(expected[0], 5), rtol=1e-9,
+                               atol=1e-12)
+    assert np.isnan(replay(EMA, bars.iloc[:0], history=0, length=3)[0])
+
+
+@pytest.mark.parametrize("params", [
+    {"alpha": 1 / 14, "min_periods": 14}, {"span": 3, "adjust": False},
+    {"span": 5, "adjust": False}, {"com": 5}])
+def test_ewmean_seed_with_missing_values(params):
+    x = 1.1 + np.random.default_rng(3).normal(0, 1e-3, 300).cumsum()
+    x[[0, 50, 51, 199]] = np.nan
+    expected = pd.Series(x).ewm(**params).mean().to_numpy()
+
+    ewm = EWMean(**params)
+    seeded = ewm.seed(x[:200])
+    values = [ewm.update(v) for v in x[200:].tolist()]
+
+    np.testing.assert_array_equal(seeded, expected[:200])
+    np.testing.assert_allclose(values, expected[200:], rtol=1e-9)
+
+
+def test_ewmean_after_a_gap():
+    # With com=1, pandas reweights the observation following the gap
+    ewm = EWMean(span=3, adjust=False)
+    assert [ewm.update(v) for v in [1., NAN, 3.]] == [1., 1., 2.5]
+    ewm = EWMean(span=3, adjust=False)
+    ewm.seed(np.array([1., NAN, NAN]))
+    assert ewm.update(3.) == 2.75
+
+
+@pytest.fixture
+def gapped_bars(bars) -> pd.DataFrame:
+    """Bars missing closes, before and after the seeding history."""
+    bars = bars.copy()
+    for start in (100, HISTORY + 10, HISTORY + 300):
+        bars.iloc[start:start + 3, bars.columns.get_loc("c")] = np.nan
+    return bars
+
+
+def test_ema_matches_batch_after_gaps(gapped_bars):
+    expected = IndicatorEngine(gapped_bars).ema(3)
+    np.testing.assert_allclose(replay(EMA, gapped_bars, length=3),
+                               batch_tail(expected), rtol=1e-9)
+
+
+def test_stochastic_matches_batch_after_gaps(gapped_bars):
+    expected = IndicatorEngine(gapped_bars).stoch(14, 3, 3, "ema")
+    values = np.array(replay(Stochastic, gapped_bars, mamode="ema"))
+    for line, batch in zip(values.T, expected):
+        np.testing.assert_allclose(line, batch_tail(batch), rtol=1e-9)
+
+
+def test_rolling_mean_with_missing_values():
+    x = np.arange(20, dtype=np.float64)
+    x[[5, 12]] = np.nan
+    expected = pd.Series(x).rolling(4).mean().to_numpy()
+
+    mean = RollingMean(4)
+    mean.seed(x[:3])
+    values = [mean.update(v) for v in x[3:].tolist()]
+
+    np.testing.assert_array_equal(values, expected[3:])
+
+
+def test_rolling_mean_does_not_drift():
+    x = 1e6 + np.random.default_rng(4).normal(0, 1, 100000)
+
+    mean = RollingMean(7)
+    for v in x.tolist():
+        value = mean.update(v)
+
+    assert value == pytest.approx(x[-7:].mean(), rel=1e-14)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+# Third-party modules
+import numpy as np
+import pandas as pd
+import pytest
+
+# Local modules
+from autotrader_ui import indicator_engine
+from autotrader_ui.indicator_engine import IndicatorEngine
+
+
+@pytest.fixture
+def prices() -> np.ndarray:
+    x = 1.1 + np.random.default_rng(0).normal(0, 1e-3, 5000).cumsum()
+    x[[3, 2500, 2510]] = np.nan
+    return x
+
+
+@pytest.fixture
+def ohlc() -> pd.DataFrame:
+    rng = np.random.default_rng(1)
+    close = 1.1 + rng.normal(0, 1e-3, 2000).cumsum()
+    spread = np.abs(rng.normal(0, 5e-4, (2, 2000)))
+    return pd.DataFrame({"o": close, "h": close + spread[0],
+                         "l": close - spread[1], "c": close},
+                        index=pd.date_range("2023-01-02", periods=2000,
+                                            freq="min"))
+
+
+@pytest.mark.parametrize("length", [1, 2, 14, 200])
+def test_rolling_kernels_match_pandas(prices, length):
+    rolling = pd.Series(prices).rolling(length)
+
+    np.testing.assert_allclose(indicator_engine.sma(prices, length),
+                               rolling.mean(), rtol=1e-10)
+    np.testing.assert_array_equal(
+        indicator_engine.rolling_min(prices, length), rolling.min())
+    np.testing.assert_array_equal(
+        indicator_engine.rolling_max(prices, length), rolling.max())
+
+
+@pytest.mark.parametrize("kernel", [indicator_engine.sma,
+                                    indicator_engine.rolling_min,
+                                    indicator_engine.rolling_max])
+def test_rolling_kernels_edge_cases(kernel):
+    assert np.isnan(kernel(np.array([1., 2.]), 3)).all()
+    assert np.isnan(kernel(np.full(5, np.nan), 2)).all()
+    np.testing.assert_array_equal(kernel(np.array([2., 2., 2.]), 2),
+                                  [np.nan, 2., 2.])
+
+
+def test_sma_keeps_precision_on_long_series():
+    x = np.full(1000000, 1.23456)
+    np.testing.assert_allclose(indicator_engine.sma(x, 3)[2:], 1.23456,
+                               rtol=1e-12)
+
+
+def test_ema_matches_pandas(prices):
+    x = prices[10:2000]  # The EMA seed skips missing values only at first
+    head = x[:20]
+    seeded = pd.Series(np.concatenate(([head.mean()], x[20:])))
+    expected = seeded.ewm(span=20, adjust=False).mean()
+
+    ema = indicator_engine.ema(x, 20)
+    assert np.isnan(ema[:19]).all()
+    np.testing.assert_array_equal(ema[19:], expected)
+
+
+def test_rsi_matches_pandas(ohlc):
+    change = ohlc["c"].diff()
+    gain = change.clip(lower=0).ewm(alpha=1 / 14, min_periods=14).mean()
+    loss = (-change.clip(upper=0)).ewm(alpha=1 / 14, min_periods=14).mean()
+
+    rsi = IndicatorEngine(ohlc).rsi(14)
+    assert rsi.name == "RSI_14"
+    pd.testing.assert_series_equal(rsi, 100 * gain / (gain + loss),
+                                   check_names=False, rtol=1e-12)
+
+
+def test_stoch_matches_pandas(ohlc):
+    lowest = ohlc["l"].rolling(14).min()
+    highest = ohlc["h"].rolling(14).max()
+    fast_k = 100 * (ohlc["c"] - lowest) / (highest - lowest)
+    stoch_k = fast_k.rolling(3).mean()
+
+    k, d = IndicatorEngine(ohlc).stoch(14, 3, 3)
+    assert (k.name, d.name) == ("STOCHk_14_3_3", "STOCHd_14_3_3")
+    pd.testing.assert_series_equal(k, stoch_k, check_names=False,
+                                   rtol=1e-9)
+    pd.testing.assert_series_equal(d, stoch_k.rolling(3).mean(),
+                                   check_names=False, rtol=1e-9)
+
+
+def test_engine_reuses_emas(ohlc):
+    engine = IndicatorEngine(ohlc)
+    ema = engine.ema(12)
+    macd, histogram, signal = engine.macd(12, 26, 9)
+
+    assert np.shares_memory(engine._emas[("c", 12)], ema.to_numpy())
+    np.testing.assert_array_equal(macd, ema - engine.ema(26))
+    np.testing.assert_allclose(histogram, macd - signal)
+    assert engine.sma(10, offset=1).iloc[10] == ohlc["c"].iloc[:10].mean()
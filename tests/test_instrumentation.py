@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+# Third-party modules
+import pytest
+
+# Local modules
+from autotrader_ui.instrumentation import endpoint_family, request_stats
+from autotrader_ui.metrics import MetricsRegistry
+from autotrader_ui.tpqoa import tpqoa
+
+
+@pytest.mark.parametrize("path, family", [
+    ("/v3/instruments/EUR_USD/candles", "candles"),
+    ("/v3/accounts/1/pricing/stream", "pricing_stream"),
+    ("/v3/accounts/1/pricing", "pricing"),
+    ("/v3/accounts/1/instruments", "instruments"),
+    ("/v3/accounts/1/orders", "order"),
+    ("/v3/accounts/1/pendingOrders", "order"),
+    ("/v3/accounts/1/openTrades", "trade"),
+    ("/v3/accounts/1/openPositions", "position"),
+    ("/v3/accounts/1/transactions/sinceid", "transaction"),
+    ("/v3/accounts/1/summary", "account"),
+    ("/v3/users/me", "other"),
+])
+def test_endpoint_family(path, family):
+    assert endpoint_family(path) == family
+
+
+def test_histogram_quantiles():
+    histogram = MetricsRegistry().histogram("latency")
+    for value in range(1, 1001):
+        histogram.observe(value / 1000)
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 1000
+    assert snapshot["sum"] == pytest.approx(500.5)
+    assert snapshot["p50"] == pytest.approx(.5, rel=.1)
+    assert snapshot["p99"] == pytest.approx(.99, rel=.1)
+
+
+@pytest.fixture
+def api(standin_config):
+    """Client recording its requests into its own registry."""
+    api = tpqoa(standin_config, raw_decoding=True)
+    api.ctx.metrics = api.ctx_stream.metrics = MetricsRegistry()
+    return api
+
+
+def test_requests_are_recorded_per_endpoint(api):
+    api.get_history("EUR_USD", "2023-01-02", "2023-01-03", "M5", "M")
+    api.get_instruments()
+    api.get_prices("EUR_USD")
+    api.stream_data("EUR_USD", stop=2, ret=True)
+    metrics = api.ctx.metrics
+
+    assert metrics.counter("oanda.requests", endpoint="candles",
+                           status="200").value == 1
+    assert metrics.counter("oanda.requests", endpoint="pricing_stream",
+                           status="200").value == 1
+    assert metrics.histogram("oanda.response_bytes",
+                             endpoint="candles").count == 1
+    assert metrics.counter("oanda.stream_bytes",
+                           endpoint="pricing_stream").value > 0
+    # Scheduled requests record their wait, streams are not scheduled
+    assert metrics.histogram("oanda.queue_wait",
+                             endpoint="pricing").count == 1
+    assert metrics.histogram("oanda.queue_wait",
+                             endpoint="pricing_stream").count == 0
+
+
+def test_errors_are_recorded(api):
+    response = api.ctx.transaction.get(api.account_id, 999)
+    assert response.status == 404
+    stats = request_stats(api.ctx.metrics)
+    assert stats.loc["transaction", "requests"] == 1
+    assert stats.loc["transaction", "errors"] == 1
+
+
+def test_request_stats(api):
+    for _ in range(3):
+        api.get_prices("EUR_USD")
+    api.get_instruments()
+    stats = request_stats(api.ctx.metrics)
+    assert set(stats.index) == {"pricing", "instruments"}
+    assert stats.loc["pricing", "requests"] == 3
+    assert stats.loc["pricing", "errors"] == 0
+    assert stats.loc["pricing", "p50_ms"] > 0
+    assert stats.loc["pricing", "mean_bytes"] > 0
+    assert request_stats(MetricsRegistry()).empty
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+# Built-in modules
+import threading
+
+# Local modules
+from autotrader_ui import oanda_client
+
+
+def test_concurrent_callers_share_one_client(standin_config):
+    clients = []
+    barrier = threading.Barrier(8)
+
+    def get():
+        barrier.wait()
+        clients.append(oanda_client.get_oanda_client(standin_config))
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(clients) == 8
+    assert all(client is clients[0] for client in clients)
+    assert clients[0].raw_decoding
+
+
+def test_stream_clients_are_not_shared(standin_config):
+    shared = oanda_client.get_oanda_client(standin_config)
+    stream = oanda_client.new_stream_client(standin_config)
+    assert stream is not shared
+    assert stream is not oanda_client.new_stream_client(standin_config)
+
+    stream.stream_data("EUR_USD", stop=3)
+    assert stream.ticks == 3
+    # The stream state stays on the stream client
+    assert not hasattr(shared, "ticks")
+    assert shared.stop_stream is False
+    # Both still share the rate limit of the token
+    assert stream.scheduler is shared.scheduler
+
+
+def test_instrument_cache(standin, standin_config):
+    cache = oanda_client.get_instrument_cache(standin_config)
+    assert cache is oanda_client.get_instrument_cache(standin_config)
+    instruments = cache.get()
+    assert ("EUR/USD", "EUR_USD") in instruments
+    requests = standin.state.requests
+    assert cache.get() == instruments
+    assert standin.state.requests == requests
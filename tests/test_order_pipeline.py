@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+# Local modules
+from autotrader_ui.metrics import MetricsRegistry
+from autotrader_ui.order_pipeline import OrderPipeline, new_client_id
+from autotrader_ui.tpqoa import tpqoa
+
+
+def test_client_ids_are_unique():
+    ids = {new_client_id() for _ in range(1000)}
+    assert len(ids) == 1000
+    assert all(client_id.startswith("at-") for client_id in ids)
+
+
+def test_orders_are_sent_concurrently(standin, standin_config):
+    metrics = MetricsRegistry()
+    orders = [{"instrument": "EUR_USD", "units": 10},
+              {"instrument": "GBP_USD", "units": -20},
+              {"instrument": "EUR_USD", "units": 30, "client_id": "at-mine"}]
+    with OrderPipeline(tpqoa(standin_config), metrics=metrics) as pipeline:
+        results = pipeline.submit_many(orders)
+
+    assert [r["status"] for r in results] == ["ORDER_FILL"] * 3
+    assert [r["units"] for r in results] == [10, -20, 30]
+    assert results[2]["client_id"] == "at-mine"
+    assert all(r["round_trip_s"] > 0 and r["queue_s"] >= 0
+               and r["fill_time"] is not None for r in results)
+    assert standin.state.positions == {"EUR_USD": 40., "GBP_USD": -20.}
+    # Fills can be matched to their orders by client ID
+    fills = {t["clientOrderID"]: t for t in standin.state.transactions
+             if t["type"] == "ORDER_FILL"}
+    assert set(fills) == {r["client_id"] for r in results}
+    assert metrics.counter("order.status", instrument="EUR_USD",
+                           status="ORDER_FILL").value == 2
+    assert metrics.histogram("order.round_trip").count == 3
+    assert metrics.histogram("order.submit_to_fill").count == 3
+
+
+def test_pending_orders_are_not_filled(standin, standin_config):
+    with OrderPipeline(tpqoa(standin_config), warm=False,
+                       metrics=MetricsRegistry()) as pipeline:
+        result = pipeline.submit("EUR_USD", 10, price=1.).result()
+    assert result["status"] == "LIMIT_ORDER"
+    assert result["fill_time"] is None and result["submit_to_fill_s"] is None
+    assert standin.state.positions == {}
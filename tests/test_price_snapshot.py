@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+# Third-party modules
+import pandas as pd
+import pytest
+
+# Local modules
+from autotrader_ui import data_utils
+
+
+@pytest.fixture(autouse=True)
+def empty_price_cache():
+    data_utils._PRICE_CACHE.clear()
+    yield
+    data_utils._PRICE_CACHE.clear()
+
+
+def test_snapshot_in_a_single_request(standin, standin_config):
+    requests = standin.state.requests
+    snapshot = data_utils.get_price_snapshot(["EUR_USD", "GBP_USD"],
+                                             config=standin_config)
+    assert standin.state.requests == requests + 1
+    assert list(snapshot.columns) == data_utils.PRICE_SNAPSHOT_COLUMNS
+    assert snapshot["instrument"].tolist() == ["EUR_USD", "GBP_USD"]
+    assert (snapshot["spread"] > 0).all()
+
+
+def test_cached_prices_are_reused_within_the_ttl(standin, standin_config):
+    data_utils.get_price_snapshot(["EUR_USD"], config=standin_config,
+                                  ttl=60)
+    requests = standin.state.requests
+    snapshot = data_utils.get_price_snapshot(["EUR_USD"],
+                                             config=standin_config, ttl=60)
+    assert standin.state.requests == requests
+    # Only the instruments missing from the cache are requested
+    snapshot = data_utils.get_price_snapshot(["EUR_USD", "GBP_USD"],
+                                             config=standin_config, ttl=60)
+    assert standin.state.requests == requests + 1
+    assert snapshot["instrument"].tolist() == ["EUR_USD", "GBP_USD"]
+    spreads = data_utils.get_spreads(["GBP_USD", "EUR_USD"],
+                                     config=standin_config, ttl=60)
+    assert isinstance(spreads, pd.Series)
+    assert standin.state.requests == requests + 1
+
+
+def test_spread(standin_config):
+    spread = data_utils.get_spread("EUR_USD", config=standin_config)
+    assert spread == pytest.approx(
+        data_utils.get_spreads(["EUR_USD"], config=standin_config)
+        ["EUR_USD"])
+    assert spread > 0
+
+
+def test_spread_without_price(standin_config):
+    # The stand-in returns no price for an empty instrument name
+    assert data_utils.get_spread("", config=standin_config) is None
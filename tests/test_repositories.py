@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+# Third-party modules
+import pytest
+from google.api_core.exceptions import NotFound
+
+# Local modules
+from autotrader_ui.repositories import (
+    Cursor,
+    FirestoreRepository,
+    Repository,
+    SQLiteRepository,
+    get_repositories
+)
+
+
+@pytest.fixture(params=["sqlite", "firestore"])
+def repositories(request, firestore_db, document_cache):
+    """Repositories of both backends, compared by the tests."""
+    if request.param == "firestore":
+        yield get_repositories(firestore_db)
+    else:
+        repositories = get_repositories()
+        yield repositories
+        for repository in repositories.values():
+            repository.close()
+
+
+def make_backtests(count: int) -> dict:
+    return {f"bt{i:02d}": {"status": "Ready to start" if i % 2 else "Done",
+                           "created_at": f"2023-01-01 00:{i:02d}",
+                           "agent_config": {"rsi_threshold": i}}
+            for i in range(count)}
+
+
+def test_repository_is_abstract():
+    with pytest.raises(TypeError):
+        Repository("Backtest")
+
+
+def test_get_repositories():
+    assert isinstance(get_repositories(object())["Live"], FirestoreRepository)
+    assert isinstance(get_repositories()["Live"], SQLiteRepository)
+
+
+def test_create_get_update_delete(repositories):
+    backtests = repositories["Backtest"]
+    backtests.create("bt", {"status": "Ready to start",
+                            "agent_config": {"rsi_threshold": 50}})
+
+    backtests.update("bt", {"status": "Running",
+                            "agent_config.rsi_threshold": 60})
+    assert backtests.get("bt") == {"status": "Running",
+                                   "agent_config": {"rsi_threshold": 60}}
+    with pytest.raises((KeyError, NotFound)):
+        backtests.update("missing", {"status": "Running"})
+
+    backtests.delete("bt")
+    assert backtests.get("bt") is None
+    assert backtests.names() == []
+
+
+def test_bulk_operations(repositories):
+    backtests = repositories["Backtest"]
+    documents = make_backtests(30)
+
+    assert backtests.bulk_create(documents) == 30
+    assert backtests.bulk_update({name: {"status": "Done"}
+                                  for name in documents}) == 30
+    assert backtests.bulk_delete(list(documents)[:10]) == 10
+
+    assert backtests.names() == list(documents)[10:]
+    assert {data["status"] for data in backtests.list()[0].values()} == \
+        {"Done"}
+
+
+@pytest.mark.parametrize("order_by,descending", [
+    (None, False), ("created_at", True), ("agent_config.rsi_threshold", False)])
+def test_paginated_listings_match(repositories, order_by, descending):
+    backtests = repositories["Backtest"]
+    documents = make_backtests(23)
+    backtests.bulk_create(documents)
+    backtests.create("undated", {"status": "Done"})
+
+    pages, cursor = [], None
+    while True:
+        page, cursor = backtests.list(fields=["status"], order_by=order_by,
+                                      descending=descending, limit=10,
+                                      start_after=cursor)
+        pages.append(page)
+        if cursor is None:
+            break
+        assert isinstance(cursor, Cursor)
+
+    names = [name for page in pages for name in page]
+    expected = sorted(documents, reverse=descending)
+    if order_by is None:  # Documents missing the sort field are left out
+        expected.append("undated")
+    assert names == expected
+    assert [len(page) for page in pages] == [10, 10, len(expected) - 20]
+    expected_fields = {"status"} | ({order_by.split(".")[0]}
+                                    if order_by is not None else set())
+    assert set(pages[0][names[0]]) == expected_fields
+
+
+def test_names_pages(repositories):
+    backtests = repositories["Backtest"]
+    backtests.bulk_create(make_backtests(5))
+
+    first, cursor = backtests.list(fields=[], limit=3)
+    second, end = backtests.list(fields=[], limit=3, start_after=cursor)
+
+    assert list(first) + list(second) == backtests.names()
+    assert first["bt00"] == {}
+    assert end is None
+
+
+def test_cursors_are_checked(repositories):
+    repositories["Backtest"].bulk_create(make_backtests(5))
+    repositories["Live"].bulk_create(make_backtests(5))
+    _, cursor = repositories["Backtest"].list(order_by="created_at", limit=2)
+
+    with pytest.raises(ValueError):
+        repositories["Live"].list(order_by="created_at", start_after=cursor)
+    with pytest.raises(ValueError):
+        repositories["Backtest"].list(order_by="status", start_after=cursor)
+    with pytest.raises(ValueError):
+        repositories["Backtest"].list(start_after=("2023", "bt01"))
+
+
+def test_experiments(repositories):
+    experiments = repositories["Experiment"]
+    transactions = {f"2023-01-01 00:00:{i:02d}": {"action": "buy",
+                                                  "price": 1. + i}
+                    for i in range(20)}
+    data = {"exp": {"execution": {"instrument": "EUR_USD"}, "start": "s",
+                    "end": "e", "agent": {}, "failure": None,
+                    "transactions": transactions}}
+    experiments.create("exp", data)
+
+    summary = experiments.get_summary("exp")
+    assert "transactions" not in summary
+    assert summary["execution"] == {"instrument": "EUR_USD"}
+    assert experiments.get_transactions("exp") == transactions
+    assert experiments.get("exp")["exp"]["transactions"] == transactions
+    assert experiments.get_summary("missing") is None
+
+    experiments.bulk_delete(["exp"])
+    assert experiments.names() == []
+    assert experiments.get("exp") is None
+
+
+def test_versions_change_on_rewrites(repositories):
+    experiments = repositories["Experiment"]
+    # Legacy layout, with inlined transactions and no generation
+    data = {"exp": {"failure": None,
+                    "transactions": {"2023-01-01 00:00:00": {"price": 1.}}}}
+    experiments.create("exp", data)
+    version = experiments.version("exp")
+
+    assert experiments.version("exp") == version
+    data["exp"]["transactions"]["2023-01-01 00:01:00"] = {"price": 2.}
+    experiments.create("exp", data)
+    assert experiments.version("exp") not in (None, version)
+    assert experiments.version("missing") is None
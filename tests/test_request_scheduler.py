@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+# Built-in modules
+import threading
+import time
+
+# Third-party modules
+import pytest
+from v20.request import Request
+
+# Local modules
+from autotrader_ui import request_scheduler
+from autotrader_ui.instrumentation import InstrumentedContext
+from autotrader_ui.metrics import MetricsRegistry
+from autotrader_ui.oanda_standin import StandinConfig, StandinServer
+from autotrader_ui.request_scheduler import (MAX_RETRIES, RETRY_MAX,
+                                             RequestScheduler,
+                                             endpoint_priority,
+                                             get_request_scheduler,
+                                             retry_delay)
+
+
+def test_retry_after_is_honoured():
+    assert retry_delay(429, {"Retry-After": "1.5"}, 0) == 1.5
+    assert retry_delay(503, {"Retry-After": "2"}, 0) == 2.
+    assert retry_delay(429, {"Retry-After": "3600"}, 0) == RETRY_MAX
+    assert retry_delay(429, {"Retry-After": "-1"}, 0) == 0.
+
+
+def test_retry_without_retry_after():
+    # 429 is retried with a jittered backoff, 503 only when told to
+    delays = [retry_delay(429, {}, 2) for _ in range(100)]
+    assert all(0 <= delay <= request_scheduler.RETRY_BASE * 4
+               for delay in delays)
+    assert 0 <= retry_delay(429, {"Retry-After": "soon"}, 0) <= \
+        request_scheduler.RETRY_BASE
+    assert retry_delay(503, {}, 0) is None
+    assert retry_delay(503, None, 0) is None
+
+
+def test_other_statuses_and_exhausted_retries_are_not_retried():
+    assert retry_delay(200, {"Retry-After": "1"}, 0) is None
+    assert retry_delay(400, {}, 0) is None
+    assert retry_delay(429, {"Retry-After": "1"}, MAX_RETRIES) is None
+
+
+def test_priorities():
+    assert endpoint_priority("order") < endpoint_priority("pricing") < \
+        endpoint_priority("account") < endpoint_priority("candles")
+    assert endpoint_priority("unknown") == request_scheduler.DEFAULT_PRIORITY
+
+
+def test_waiting_requests_are_served_by_priority():
+    scheduler = RequestScheduler(rate=20, burst=1)
+    scheduler.acquire()  # Empties the bucket
+    served = []
+
+    def request(priority, name):
+        scheduler.acquire(priority)
+        served.append(name)
+
+    threads = []
+    for priority, name in [(3, "candles"), (2, "account"), (0, "order"),
+                           (3, "candles 2")]:
+        threads.append(threading.Thread(target=request,
+                                        args=(priority, name)))
+        threads[-1].start()
+        while scheduler.waiting < len(threads):
+            time.sleep(.001)
+    for thread in threads:
+        thread.join()
+    assert served == ["order", "account", "candles", "candles 2"]
+
+
+def test_rate_and_pause():
+    scheduler = RequestScheduler(rate=50, burst=5)
+    start = time.monotonic()
+    waits = [scheduler.acquire() for _ in range(15)]
+    # The burst is free, the next 10 requests take 10 / 50 s
+    assert sum(waits[:5]) < .01
+    assert time.monotonic() - start == pytest.approx(.2, abs=.1)
+
+    scheduler.pause(.2)
+    assert scheduler.current_rate == 25
+    assert scheduler.acquire() >= .15
+
+
+def test_schedulers_are_shared_per_token():
+    assert get_request_scheduler("token a") is get_request_scheduler("token a")
+    assert get_request_scheduler("token a") is not \
+        get_request_scheduler("token b")
+
+
+def test_rate_limited_requests_are_retried():
+    config = StandinConfig(rate_limit=10, seed=0)
+    with StandinServer(config=config) as server:
+        metrics = MetricsRegistry()
+        # Configured above the server limit, converges to it
+        scheduler = RequestScheduler(rate=100, burst=20)
+        statuses = []
+
+        def send(requests):
+            ctx = InstrumentedContext(
+                hostname=server.host, port=server.port, ssl=False,
+                token="standin", metrics=metrics, scheduler=scheduler)
+            for _ in range(requests):
+                request = Request("GET", "/v3/accounts/{accountID}/pricing")
+                request.set_path_param("accountID", "000-000-0000000-000")
+                request.set_param("instruments", "EUR_USD")
+                statuses.append(ctx.request(request).status)
+
+        threads = [threading.Thread(target=send, args=(5,))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert statuses == [200] * 40
+    retries = metrics.counter("oanda.retries", endpoint="pricing").value
+    assert retries > 0
+    assert metrics.counter("oanda.requests", endpoint="pricing",
+                           status="429").value == retries
+    assert scheduler.current_rate < 100
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+# Built-in modules
+import datetime as dt
+import threading
+import time
+
+# Third-party modules
+import pandas as pd
+import pytest
+
+# Local modules
+from autotrader_ui import data_utils
+from autotrader_ui.data_utils import _flight_key, _single_flight
+
+
+def fetch(instrument="EUR_USD", start=None, end=None, granularity="M1",
+          instruments=None):
+    return pd.DataFrame()
+
+
+def test_equivalent_requests_share_a_key():
+    keys = {_flight_key("OANDA", fetch, kwargs) for kwargs in [
+        {"instrument": "EUR_USD", "start": "2023-01-02",
+         "end": "2023-01-03 00:00"},
+        {"end": dt.datetime(2023, 1, 3), "start": "2023-01-02T00:00:00Z",
+         "granularity": "M1"},
+        {"start": pd.Timestamp("2023-01-02 01:00", tz="Europe/Paris"),
+         "end": "2023-01-03"},
+    ]}
+    assert len(keys) == 1
+    assert _flight_key("oanda", fetch, {"start": "2023-01-02",
+                                        "granularity": "M5"}) not in keys
+
+
+def test_unhashable_arguments_do_not_raise():
+    first = _flight_key("oanda", fetch, {"instruments": ["A", "B"]})
+    assert first == _flight_key("oanda", fetch, {"instruments": ["A", "B"]})
+    assert first != _flight_key("oanda", fetch, {"instruments": ["B", "A"]})
+    # Arguments the fetch does not accept, or unparsable dates
+    _flight_key("oanda", fetch, {"unknown": {"a": [1]}})
+    _flight_key("oanda", fetch, {"start": "not a date"})
+
+
+def test_concurrent_calls_share_one_fetch():
+    calls = []
+    release = threading.Event()
+
+    def slow_fetch():
+        calls.append(1)
+        release.wait(5)
+        return pd.DataFrame({"c": [1., 2.]})
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        _single_flight(("key",), slow_fetch))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while ("key",) not in data_utils._IN_FLIGHT:
+        time.sleep(.001)
+    time.sleep(.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert len(results) == 5
+    # Every caller gets its own copy
+    results[0]["c"] = 0.
+    assert results[1]["c"].tolist() == [1., 2.]
+    # Later calls fetch again
+    _single_flight(("key",), slow_fetch)
+    assert len(calls) == 2
+
+
+def test_errors_reach_every_caller():
+    def failing():
+        time.sleep(.05)
+        raise RuntimeError("fetch failed")
+
+    errors = []
+
+    def call():
+        try:
+            _single_flight(("failing",), failing)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 3
+    assert ("failing",) not in data_utils._IN_FLIGHT
+
+
+def test_historical_data_from_the_stand_in(standin, standin_config,
+                                           tmp_path, monkeypatch):
+    monkeypatch.setattr(data_utils, "CANDLE_STORE",
+                        data_utils.CandleStore(str(tmp_path)))
+    data = data_utils.get_historical_data("oanda", {
+        "instrument": "EUR_USD", "start": "2023-01-02",
+        "end": "2023-01-02 06:00", "config": standin_config})
+    assert len(data) == 360
+    with pytest.raises(TypeError):
+        data_utils.get_historical_data("oanda", {"unknown": [1]})
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+# Built-in modules
+import queue
+import threading
+import time
+
+# Third-party modules
+import pytest
+
+# Local modules
+from autotrader_ui import streaming
+from autotrader_ui.metrics import MetricsRegistry
+from autotrader_ui.oanda_client import new_stream_client
+from autotrader_ui.streaming import StreamMultiplexer, backoff_delay
+
+
+class FakeApi(object):
+    account_id = "000-000-0000000-000"
+    stream_hostname = "127.0.0.1"
+    port = 1
+    ssl = False
+    access_token = "standin"
+
+
+def drain(subscriber: queue.Queue) -> list:
+    ticks = []
+    while True:
+        try:
+            ticks.append(subscriber.get_nowait())
+        except queue.Empty:
+            return ticks
+
+
+def test_backoff_delay_is_jittered_and_capped():
+    delays = [backoff_delay(3, base=1., maximum=5.) for _ in range(200)]
+    assert all(0 <= delay <= 5. for delay in delays)
+    assert len(set(delays)) > 1
+    assert all(backoff_delay(20, maximum=2.) <= 2. for _ in range(50))
+
+
+def test_subscribe_and_unsubscribe(standin_config):
+    mux = StreamMultiplexer(new_stream_client(standin_config),
+                            metrics=MetricsRegistry())
+    try:
+        eur_usd = mux.subscribe("EUR_USD")
+        gbp_usd = mux.subscribe("GBP_USD")
+        other_eur_usd = mux.subscribe("EUR_USD")
+        assert mux.instruments == ["EUR_USD", "GBP_USD"]
+        for subscriber, instrument in ((eur_usd, "EUR_USD"),
+                                       (gbp_usd, "GBP_USD"),
+                                       (other_eur_usd, "EUR_USD")):
+            tick = subscriber.get(timeout=5)
+            assert tick[0] == instrument and tick[2] < tick[3]
+
+        mux.unsubscribe("EUR_USD", eur_usd)
+        assert mux.instruments == ["EUR_USD", "GBP_USD"]
+        mux.unsubscribe("EUR_USD", other_eur_usd)
+        assert mux.instruments == ["GBP_USD"]
+        time.sleep(.2)  # Let the stream reopen without EUR_USD
+        drain(eur_usd)
+        drain(other_eur_usd)
+        gbp_usd.get(timeout=5)
+        time.sleep(.2)
+        assert drain(eur_usd) == [] and drain(other_eur_usd) == []
+        assert mux.metrics.counter("stream.connects").value >= 2
+        assert mux.last_message_age is not None
+    finally:
+        mux.stop(timeout=5)
+    assert not mux._thread.is_alive()
+
+
+def test_stream_timeout_is_not_set_on_the_client(standin_config):
+    api = new_stream_client(standin_config)
+    timeout = api.ctx_stream.stream_timeout
+    mux = StreamMultiplexer(api, heartbeat_timeout=.5)
+    assert mux.ctx is not api.ctx_stream
+    assert mux.ctx.stream_timeout == .5
+    assert api.ctx_stream.stream_timeout == timeout
+
+
+def test_silent_streams_are_reopened(standin_config, attempts):
+    mux = StreamMultiplexer(new_stream_client(standin_config),
+                            metrics=MetricsRegistry())
+    # Reads time out before any message
+    mux.ctx.set_stream_timeout(1e-6)
+    try:
+        mux.subscribe("EUR_USD")
+        deadline = time.monotonic() + 5
+        while mux.metrics.counter("stream.failures").value < 2 \
+                and time.monotonic() < deadline:
+            time.sleep(.05)
+    finally:
+        mux.stop(timeout=5)
+    assert mux.metrics.counter("stream.failures").value >= 2
+
+
+def test_full_queues_drop_their_oldest_tick():
+    mux = StreamMultiplexer(FakeApi(), queue_size=2)
+    subscriber = queue.Queue(2)
+    mux._subscribers["EUR_USD"] = {subscriber}
+    for i in range(4):
+        mux._dispatch(("EUR_USD", str(i), 1., 2.))
+    assert [tick[1] for tick in drain(subscriber)] == ["2", "3"]
+
+
+@pytest.fixture
+def attempts(monkeypatch):
+    """Backoff attempts requested by the multiplexers, without waiting."""
+    attempts = []
+
+    def delay(attempt):
+        attempts.append(attempt)
+        return 0.
+
+    monkeypatch.setattr(streaming, "backoff_delay", delay)
+    return attempts
+
+
+def run_connections(mux: StreamMultiplexer, outcomes: list):
+    """Runs the supervision loop over scripted connection outcomes."""
+    done = threading.Event()
+
+    def stream(instruments):
+        outcome = outcomes.pop(0)
+        if len(outcomes) == 0:
+            mux._stopped.set()
+            done.set()
+        if outcome == "tick":
+            mux._ticked = True
+        elif outcome == "error":
+            raise ConnectionError("stream failed")
+
+    mux._stream = stream
+    mux._subscribers["EUR_USD"] = {queue.Queue()}
+    mux._run()
+    assert done.is_set()
+
+
+def test_clean_ends_back_off(attempts):
+    mux = StreamMultiplexer(FakeApi(), metrics=MetricsRegistry())
+    run_connections(mux, ["end"] * 5)
+    assert attempts == [0, 1, 2, 3, 4]
+
+
+def test_backoff_is_reset_by_ticks_only(attempts):
+    mux = StreamMultiplexer(FakeApi(), metrics=MetricsRegistry())
+    run_connections(mux, ["error", "end", "tick", "error", "error", "tick",
+                          "end"])
+    assert attempts == [0, 1, 0, 1, 2, 0, 1]
+    assert mux.metrics.counter("stream.failures").value == 3
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+# Third-party modules
+import numpy as np
+import pandas as pd
+import pytest
+
+# Local modules
+from autotrader_ui.ticks import (TICK_FIELDS, BarAggregator, RingBuffer,
+                                 TickAggregator, granularity_to_ns,
+                                 time_to_ns)
+
+
+def test_granularity_to_ns():
+    assert granularity_to_ns("S5") == 5 * 10**9
+    assert granularity_to_ns("M15") == 15 * 60 * 10**9
+    assert granularity_to_ns("H4") == 4 * 3600 * 10**9
+    for granularity in ("D", "W1", "Mx"):
+        with pytest.raises(ValueError):
+            granularity_to_ns(granularity)
+
+
+def test_time_to_ns_keeps_nanoseconds():
+    assert time_to_ns("2023-01-02T10:00:00.123456789Z") == \
+        pd.Timestamp("2023-01-02T10:00:00.123456789").value
+
+
+def test_ring_buffer_keeps_the_latest_rows():
+    buffer = RingBuffer(3, TICK_FIELDS)
+    assert len(buffer) == 0
+    assert len(buffer.last()["time"]) == 0
+    for i in range(5):
+        buffer.append(i, 1. + i, 2. + i)
+    assert len(buffer) == 3
+    np.testing.assert_array_equal(buffer.last()["time"], [2, 3, 4])
+    np.testing.assert_array_equal(buffer.last(2)["bid"], [4., 5.])
+    # Copies, not views of the buffer
+    buffer.last()["ask"][:] = 0
+    np.testing.assert_array_equal(buffer.last()["ask"], [4., 5., 6.])
+    frame = buffer.to_frame()
+    assert list(frame.columns) == ["bid", "ask"]
+    assert frame.index[0] == pd.Timestamp(2, unit="ns")
+
+
+def test_bars_match_a_resample_of_the_ticks():
+    rng = np.random.default_rng(0)
+    times = np.sort(rng.integers(0, 10 * 60 * 10**9, 2000))
+    prices = 1.1 + rng.normal(0, 1e-4, len(times)).cumsum()
+    aggregator = BarAggregator("M1")
+    closed = [bar for bar in (aggregator.update(int(t), float(p))
+                              for t, p in zip(times, prices))
+              if bar is not None]
+    assert len(closed) == len(aggregator.bars)
+
+    ticks = pd.Series(prices, index=pd.to_datetime(times, unit="ns"))
+    expected = ticks.resample("1min").ohlc()
+    expected["volume"] = ticks.resample("1min").count()
+    bars = aggregator.to_frame(include_current=True)
+    np.testing.assert_allclose(bars[["o", "h", "l", "c"]],
+                               expected[["open", "high", "low", "close"]])
+    np.testing.assert_array_equal(bars["volume"], expected["volume"])
+    assert bars["complete"].tolist() == [True] * 9 + [False]
+    assert aggregator.current_bar[0] == 9 * 60 * 10**9
+
+
+def test_tick_aggregator_builds_mid_bars_per_instrument():
+    closed = []
+    aggregator = TickAggregator(granularities=("S5", "M1"),
+                                on_bar=lambda *bar: closed.append(bar))
+    start = time_to_ns("2023-01-02T00:00:00Z")
+    for i in range(13):
+        aggregator.on_tick("EUR_USD", start + i * 10**9, 1.0 + i, 1.2 + i)
+    aggregator.on_tick("GBP_USD", "2023-01-02T00:00:01.5Z", 1.3, 1.4)
+
+    assert len(aggregator.get_ticks("EUR_USD")) == 13
+    assert len(aggregator.get_ticks("GBP_USD", 5)) == 1
+    bars = aggregator.get_bars("EUR_USD", "S5")
+    assert bars["o"].tolist() == pytest.approx([1.1, 6.1])
+    assert bars["c"].tolist() == pytest.approx([5.1, 10.1])
+    assert bars["volume"].tolist() == [5, 5]
+    assert [(instrument, granularity) for instrument, granularity, _
+            in closed] == [("EUR_USD", "S5")] * 2
+    assert aggregator.get_bars("EUR_USD", "M1").empty
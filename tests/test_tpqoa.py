@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+# Built-in modules
+import time
+
+# Third-party modules
+import numpy as np
+import pandas as pd
+import pytest
+
+# Local modules
+from autotrader_ui import data_utils
+from autotrader_ui.tpqoa import tpqoa
+
+
+@pytest.mark.parametrize("price", ["A", "B", "M"])
+def test_raw_decoding_matches_v20_objects(standin_config, price):
+    decoded = tpqoa(standin_config).retrieve_data(
+        "EUR_USD", "2023-01-02T00:00:00.000000000Z",
+        "2023-01-02T06:00:00.000000000Z", "M1", price)
+    raw = tpqoa(standin_config, raw_decoding=True).retrieve_data(
+        "EUR_USD", "2023-01-02T00:00:00.000000000Z",
+        "2023-01-02T06:00:00.000000000Z", "M1", price)
+    assert len(raw) == 360
+    pd.testing.assert_frame_equal(raw[decoded.columns], decoded,
+                                  check_dtype=False)
+    assert raw.index.tz is not None
+
+
+def test_raw_decoding_of_an_empty_response():
+    assert tpqoa.decode_candles(b'{"candles": []}', "M").empty
+
+
+def test_raw_decoding_rejects_unknown_prices(standin_config):
+    api = tpqoa(standin_config, raw_decoding=True)
+    with pytest.raises(ValueError):
+        api.retrieve_data("EUR_USD", "2023-01-02T00:00:00.000000000Z",
+                          "2023-01-02T01:00:00.000000000Z", "M1", "X")
+
+
+def test_history_is_the_same_in_both_modes(standin_config):
+    args = ("EUR_USD", "2023-01-02", "2023-01-05", "M1", "M")
+    decoded = tpqoa(standin_config).get_history(*args)
+    raw = tpqoa(standin_config, raw_decoding=True).get_history(*args)
+    pd.testing.assert_frame_equal(raw, decoded, check_dtype=False)
+
+
+HISTORY_ARGS = ("EUR_USD", "2023-01-02", "2023-01-14", "M1", "M")
+
+
+@pytest.fixture
+def api(standin_config):
+    return tpqoa(standin_config, raw_decoding=True)
+
+
+def record_batches(api, delay=None, fail=None):
+    """Wraps retrieve_data to record the batches it was called with.
+
+    Args:
+        delay (callable, optional): Seconds to wait before a batch, by batch position.
+        fail (int, optional): Position of a batch raising a ConnectionError.
+    """
+    positions = {batch[0]: i for i, batch in
+                 enumerate(api._history_batches(*HISTORY_ARGS[1:4]))}
+    calls = []
+    retrieve_data = api.retrieve_data
+
+    def retrieve(instrument, start, end, granularity, price):
+        position = positions[start]
+        calls.append(position)
+        if delay is not None:
+            time.sleep(delay(position))
+        if position == fail:
+            raise ConnectionError(f"batch {position} failed")
+        return retrieve_data(instrument, start, end, granularity, price)
+
+    api.retrieve_data = retrieve
+    return calls
+
+
+@pytest.mark.parametrize("raw_decoding", [False, True])
+def test_concurrent_history_is_the_sequential_one(standin_config,
+                                                  raw_decoding):
+    api = tpqoa(standin_config, raw_decoding=raw_decoding)
+    sequential = api.get_history(*HISTORY_ARGS, max_workers=1)
+    concurrent = api.get_history(*HISTORY_ARGS, max_workers=4)
+
+    assert len(sequential) == 4 * 3 * 1440
+    pd.testing.assert_frame_equal(concurrent, sequential)
+    pd.testing.assert_frame_equal(api.get_history(*HISTORY_ARGS),
+                                  sequential)
+
+
+def test_batches_completing_out_of_order(api):
+    sequential = api.get_history(*HISTORY_ARGS, max_workers=1)
+    # The first batches complete last
+    calls = record_batches(api, delay=lambda position: .1 / (position + 1))
+
+    concurrent = api.get_history(*HISTORY_ARGS, max_workers=5)
+
+    assert sorted(calls) == [0, 1, 2, 3, 4]
+    pd.testing.assert_frame_equal(concurrent, sequential)
+
+
+def test_boundary_candles_are_not_repeated(api):
+    sequential = api.get_history(*HISTORY_ARGS, max_workers=1)
+    retrieve_data = api.retrieve_data
+
+    def inclusive(instrument, start, end, granularity, price):
+        # Also returns the candle starting at end, as the next batch does
+        end = (pd.Timestamp(end) + pd.Timedelta(minutes=1)).strftime(
+            "%Y-%m-%dT%H:%M:%S.000000000Z")
+        return retrieve_data(instrument, start, end, granularity, price)
+
+    api.retrieve_data = inclusive
+    for max_workers in (1, 3):
+        data = api.get_history(*HISTORY_ARGS, max_workers=max_workers)
+        assert data.index.is_unique
+        pd.testing.assert_frame_equal(data.iloc[:len(sequential)],
+                                      sequential)
+        assert len(data) == len(sequential) + 1  # The candle at end
+
+
+def test_prefetch_is_bounded(api):
+    calls = record_batches(api)
+    batches = api.iter_history(*HISTORY_ARGS, max_workers=2)
+
+    for consumed in range(1, 4):
+        next(batches)
+        # Each yielded batch lets one more be retrieved ahead
+        assert len(calls) <= consumed + 1
+    batches.close()
+
+
+def test_failed_batch_cancels_the_next_ones(api):
+    calls = record_batches(api, delay=lambda position: .05, fail=1)
+
+    with pytest.raises(ConnectionError, match="batch 1 failed"):
+        api.get_history(*HISTORY_ARGS, max_workers=2)
+
+    time.sleep(.2)
+    # Batches 3 and 4 were never submitted, batch 2 at most started
+    assert sorted(calls)[:2] == [0, 1]
+    assert max(calls) <= 2
+
+
+def test_iter_history_chunks_are_in_order(api):
+    chunks = list(api.iter_history(*HISTORY_ARGS, max_workers=2))
+
+    # The batch of the end date is empty and left out
+    assert [len(chunk) for chunk in chunks] == [3 * 1440] * 4
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert previous.index[-1] < chunk.index[0]
+    pd.testing.assert_frame_equal(pd.concat(chunks),
+                                  api.get_history(*HISTORY_ARGS))
+
+
+def test_iter_history_records(api):
+    frames = api.iter_history(*HISTORY_ARGS)
+    records = api.iter_history(*HISTORY_ARGS, records=True)
+
+    for frame, chunk in zip(frames, records):
+        assert isinstance(chunk, np.recarray)
+        assert chunk.dtype.names == ("time", "o", "h", "l", "c", "volume",
+                                     "complete")
+        np.testing.assert_array_equal(chunk.time, frame.index.to_numpy())
+        for column in frame:
+            np.testing.assert_array_equal(chunk[column], frame[column])
+
+
+def test_iter_history_localisation(api):
+    local = next(api.iter_history(*HISTORY_ARGS))
+    utc = next(api.iter_history(*HISTORY_ARGS, localize=False))
+
+    assert local.index.tz is None
+    assert str(utc.index.tz) == "UTC"
+    assert local.index[0] == pd.Timestamp("2023-01-02")
+    pd.testing.assert_index_equal(utc.index.tz_localize(None), local.index)
+
+
+def test_closing_iter_history_stops_retrieving(api):
+    calls = record_batches(api, delay=lambda position: .02)
+    chunks = api.iter_history(*HISTORY_ARGS, max_workers=2)
+
+    next(chunks)
+    chunks.close()
+    retrieved = len(calls)
+    time.sleep(.2)
+
+    assert len(calls) == retrieved < 5
+    with pytest.raises(StopIteration):
+        next(chunks)
+
+
+@pytest.mark.parametrize("records", [False, True])
+def test_iter_oanda_data(standin_config, records):
+    expected = list(tpqoa(standin_config).iter_history(*HISTORY_ARGS,
+                                                       records=records))
+    chunks = list(data_utils.iter_oanda_data(
+        *HISTORY_ARGS, config=standin_config, records=records, max_workers=2))
+
+    assert len(chunks) == len(expected) == 4
+    for chunk, batch in zip(chunks, expected):
+        if records:
+            np.testing.assert_array_equal(chunk, batch)
+        else:
+            pd.testing.assert_frame_equal(chunk, batch)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+# Built-in modules
+import os
+import threading
+
+# Local modules
+from autotrader_ui import data_utils
+from autotrader_ui.tpqoa import tpqoa
+from autotrader_ui.transaction_ledger import TransactionLedger
+
+
+def place_orders(api, orders):
+    for instrument, units in orders:
+        api.create_order(instrument, units, suppress=True, ret=True)
+
+
+class CountingApi(object):
+    """Client recording the IDs its transactions are requested from."""
+
+    def __init__(self, api):
+        self.api = api
+        self.account_id = api.account_id
+        self.tids = []
+
+    def get_transactions(self, tid=0):
+        self.tids.append(tid)
+        return self.api.get_transactions(tid=tid)
+
+
+def test_sync_is_incremental_and_idempotent(standin_config, tmp_path):
+    api = tpqoa(standin_config)
+    place_orders(api, [("EUR_USD", 100), ("GBP_USD", -50)])
+    ledger = TransactionLedger(str(tmp_path / "transactions.sqlite"))
+    counting = CountingApi(api)
+
+    assert ledger.sync(counting) == 4  # Create and fill per order
+    assert ledger.sync(counting) == 0
+    assert ledger.last_id(api.account_id) == 4
+
+    place_orders(api, [("EUR_USD", -100)])
+    counting.tids.clear()
+    assert ledger.sync(counting) == 2
+    # Only the transactions after the last stored one are requested
+    assert counting.tids[0] == 4
+    # Storing the same transactions again adds nothing
+    assert ledger.append(api.account_id, api.get_transactions()) == 0
+    assert [t["id"] for t in ledger.query(api.account_id)] == \
+        [str(i) for i in range(1, 7)]
+
+
+def test_concurrent_syncs_store_each_transaction_once(standin_config,
+                                                     tmp_path):
+    api = tpqoa(standin_config)
+    place_orders(api, [("EUR_USD", 10)] * 5)
+    ledger = TransactionLedger(str(tmp_path / "transactions.sqlite"))
+    added = []
+    threads = [threading.Thread(target=lambda: added.append(ledger.sync(api)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(added) == 10
+    assert len(ledger.query(api.account_id)) == 10
+
+
+def test_queries(standin_config, tmp_path):
+    api = tpqoa(standin_config)
+    place_orders(api, [("EUR_USD", 100), ("GBP_USD", -50),
+                       ("EUR_USD", -100)])
+    ledger = TransactionLedger(str(tmp_path / "transactions.sqlite"))
+    ledger.sync(api)
+    fills = ledger.query(api.account_id, instrument="EUR_USD",
+                         types=["ORDER_FILL"])
+    assert [float(t["units"]) for t in fills] == [100., -100.]
+    frame = ledger.to_frame(api.account_id, instrument="GBP_USD")
+    assert frame["type"].tolist() == ["MARKET_ORDER", "ORDER_FILL"]
+    assert ledger.realized_pl(api.account_id) == 0.
+    last = ledger.query(api.account_id)[-1]
+    assert ledger.query(api.account_id, start=last["time"])[-1] == last
+    assert ledger.query(api.account_id, end="2000-01-01") == []
+
+
+def test_default_path_does_not_depend_on_the_working_directory():
+    assert os.path.isabs(data_utils.TRANSACTION_LEDGER_PATH)
+    assert os.path.dirname(data_utils.TRANSACTION_LEDGER_PATH) == \
+        os.path.dirname(os.path.abspath(data_utils.__file__))